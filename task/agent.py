@@ -1,16 +1,41 @@
 import asyncio
+import functools
 import json
-from typing import Any
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Optional
 
 from aidial_client import AsyncDial
 from aidial_client.types.chat.legacy.chat_completion import CustomContent, ToolCall
 from aidial_sdk.chat_completion import Message, Role, Choice, Request, Response
+from pydantic import StrictStr
 
-from task.tools.base import BaseTool
+from task.prompts import FINAL_ROUND_PROMPT
 from task.tools.models import ToolCallParams
-from task.utils.constants import TOOL_CALL_HISTORY_KEY
-from task.utils.history import unpack_messages
-from task.utils.stage import StageProcessor
+from task.tools.registry import ToolCatalog
+from task.tools.router import ToolRouter
+from task.tools.scheduler import ToolScheduler, ToolSession
+from task.utils.blob_store import BlobStore
+from task.utils.constants import CUSTOM_CONTENT, TOOL_CALL_HISTORY_KEY
+from task.utils.context import ContextManager
+from task.utils.dial_client_factory import DialClientFactory
+from task.utils.history import offload_tool_messages, unpack_messages
+from task.utils.log import get_logger
+from task.utils.stage import BufferedContentWriter, BufferedStage, StageProcessor
+
+logger = get_logger(__name__)
+
+
+@dataclass
+class RoundTiming:
+    """Timings of one model round in seconds."""
+
+    round: int
+    llm_time: float
+    tool_wait_time: float
+    total_time: float
+    tool_calls: int
+    prompt_tokens: int
 
 
 class GeneralPurposeAgent:
@@ -19,86 +44,236 @@ class GeneralPurposeAgent:
             self,
             endpoint: str,
             system_prompt: str,
-            tools: list[BaseTool],
+            tool_catalog: ToolCatalog,
+            tool_scheduler: ToolScheduler,
+            context_manager: ContextManager,
+            max_rounds: int = 10,
+            blob_store: Optional[BlobStore] = None,
+            offload_min_chars: int = 2_000,
+            tool_router: Optional[ToolRouter] = None,
+            output_flush_interval: float = 0.03,
+            output_flush_chars: int = 2_048,
+            stage_max_chars: Optional[int] = None,
+            final_round_prompt: str = FINAL_ROUND_PROMPT,
     ):
         self.endpoint = endpoint
         self.system_prompt = system_prompt
-        self.tools = tools
-        self._tools_dict = {tool.name: tool for tool in tools}
+        self.tool_catalog = tool_catalog
+        self.tool_scheduler = tool_scheduler
+        self.context_manager = context_manager
+        self.max_rounds = max_rounds
+        self.blob_store = blob_store
+        self.offload_min_chars = offload_min_chars
+        self.tool_router = tool_router
+        self.output_flush_interval = output_flush_interval
+        self.output_flush_chars = output_flush_chars
+        self.stage_max_chars = stage_max_chars
+        self.final_round_prompt = final_round_prompt
+        self.round_timings: list[RoundTiming] = []
         self.state = {TOOL_CALL_HISTORY_KEY: []}
 
     async def handle_request(self, deployment_name: str, choice: Choice, request: Request, response: Response) -> Message:
-        client = AsyncDial(base_url=self.endpoint, api_key=request.api_key, api_version=request.api_version)
-        messages = self._prepare_messages(request.messages)
-        tools_schema = [tool.schema for tool in self.tools]
+        client = DialClientFactory.get_instance().create_async_client(self.endpoint, request.api_key)
+        context = self.context_manager.open(deployment_name)
+        prepared_messages = self._prepare_messages(request.messages)
+        context.extend(prepared_messages)
+        tools_schema = list(self.tool_catalog.schemas) if self.tool_router is None \
+            else await self.tool_router.select(self.tool_catalog, prepared_messages)
+        conversation_id = request.headers.get("x-conversation-id", "")
+        self.round_timings = []
+        assistant_message = None
+        for round_number in range(1, self.max_rounds + 1):
+            final_round = round_number == self.max_rounds
+            started_at = time.perf_counter()
+            messages = await context.build()
+            if final_round:
+                # The tools stay in the request, since the tool messages in the history need them;
+                # the model is told to answer instead, and tool calls it still makes are not run
+                messages = [*messages, {"role": "user", "content": self.final_round_prompt}]
+            session = self.tool_scheduler.session()
+            try:
+                assistant_message, dispatched = await self._stream_round(
+                    client, deployment_name, messages, tools_schema, choice, session, request.api_key,
+                    request.api_version, conversation_id, dispatch_tools=not final_round
+                )
+                streamed_at = time.perf_counter()
+                tool_messages = await self._collect_tool_messages(session, dispatched)
+            finally:
+                session.cancel()
+            finished_at = time.perf_counter()
+            timing = RoundTiming(
+                round=round_number,
+                llm_time=streamed_at - started_at,
+                tool_wait_time=finished_at - streamed_at,
+                total_time=finished_at - started_at,
+                tool_calls=len(dispatched),
+                prompt_tokens=context.prompt_tokens
+            )
+            self.round_timings.append(timing)
+            logger.info("Agent round %d finished", round_number, extra=asdict(timing))
+
+            if not assistant_message.tool_calls:
+                break
+            round_messages = [assistant_message.dict(exclude_none=True), *tool_messages]
+            self.state[TOOL_CALL_HISTORY_KEY].extend(await self._compact_for_state(round_messages))
+            # The context keeps the prepared messages, so they are not rebuilt every round
+            context.extend([
+                {key: value for key, value in message.items() if key != CUSTOM_CONTENT}
+                for message in round_messages
+            ])
+
+        choice.set_state(self.state)
+        return assistant_message
+
+    async def _stream_round(
+            self,
+            client: AsyncDial,
+            deployment_name: str,
+            messages: list[dict[str, Any]],
+            tools_schema: list[Any] | None,
+            choice: Choice,
+            session: ToolSession,
+            api_key: str,
+            api_version: Optional[str],
+            conversation_id: str,
+            dispatch_tools: bool = True,
+    ) -> tuple[Message, list[ToolCall]]:
+        """
+        Stream one model response. Every tool call is dispatched to the scheduler as soon as its
+        arguments are complete: when they form a JSON object, when the next tool call starts,
+        or when the stream ends. Returns the assistant message and the calls in dispatch order.
+        With `dispatch_tools` off, tool calls of the response are dropped.
+        """
         stream = await client.chat.completions.create(
             messages=messages,
             tools=tools_schema,
             deployment_name=deployment_name,
-            stream=True
+            stream=True,
+            api_version=api_version
         )
         tool_call_index_map = {}
+        dispatched: dict[int, ToolCall] = {}
+        writer = BufferedContentWriter(
+            choice, flush_interval=self.output_flush_interval, max_buffer_chars=self.output_flush_chars
+        )
+
+        def dispatch(index: int) -> None:
+            if index in dispatched:
+                return
+            tool_call = ToolCall.validate(tool_call_index_map[index])
+            dispatched[index] = tool_call
+            # The content streamed so far is shown before the tool starts
+            writer.flush()
+            session.submit(
+                self.tool_catalog.by_name[tool_call.function.name],
+                functools.partial(self._process_tool_call, tool_call, choice, api_key, conversation_id)
+            )
+
         content = ""
-        async for chunk in stream:
-            if chunk.choices:
-                delta = chunk.choices[0].delta
-                if delta:
-                    if delta.content:
-                        choice.append_content(delta.content)
-                        content += delta.content
-                    if delta.tool_calls:
-                        for tool_call_delta in delta.tool_calls:
-                            if getattr(tool_call_delta, "id", None):
-                                tool_call_index_map[tool_call_delta.index] = tool_call_delta
-                            else:
-                                tool_call = tool_call_index_map.get(tool_call_delta.index)
-                                if tool_call and hasattr(tool_call_delta, "function") and tool_call_delta.function:
-                                    argument_chunk = tool_call_delta.function.arguments or ""
-                                    if not hasattr(tool_call.function, "arguments") or tool_call.function.arguments is None:
-                                        tool_call.function.arguments = ""
-                                    tool_call.function.arguments += argument_chunk
+        dropped_tool_calls = False
+        try:
+            async for chunk in stream:
+                if chunk.choices:
+                    delta = chunk.choices[0].delta
+                    if delta:
+                        if delta.content:
+                            writer.append_content(delta.content)
+                            content += delta.content
+                        if delta.tool_calls and not dispatch_tools:
+                            dropped_tool_calls = True
+                        elif delta.tool_calls:
+                            for tool_call_delta in delta.tool_calls:
+                                if getattr(tool_call_delta, "id", None):
+                                    # A new tool call starts, so the arguments of the earlier ones are complete
+                                    for index in tool_call_index_map:
+                                        dispatch(index)
+                                    tool_call_index_map[tool_call_delta.index] = tool_call_delta
+                                    if self._is_complete_json(tool_call_delta.function.arguments or ""):
+                                        dispatch(tool_call_delta.index)
+                                else:
+                                    tool_call = tool_call_index_map.get(tool_call_delta.index)
+                                    if tool_call and hasattr(tool_call_delta, "function") and tool_call_delta.function:
+                                        argument_chunk = tool_call_delta.function.arguments or ""
+                                        if not hasattr(tool_call.function, "arguments") or tool_call.function.arguments is None:
+                                            tool_call.function.arguments = ""
+                                        tool_call.function.arguments += argument_chunk
+                                        if self._is_complete_json(tool_call.function.arguments):
+                                            dispatch(tool_call_delta.index)
+            for index in tool_call_index_map:
+                dispatch(index)
+        finally:
+            writer.close()
+        if dropped_tool_calls:
+            logger.warning("Tool calls of the final round were dropped", extra={"deployment": deployment_name})
 
         assistant_message = Message(
             role=Role.ASSISTANT,
             content=content,
-            tool_calls=[ToolCall.validate(tc) for tc in tool_call_index_map.values()] if tool_call_index_map else None
+            tool_calls=list(dispatched.values()) if dispatched else None
         )
+        return assistant_message, list(dispatched.values())
 
-        if assistant_message.tool_calls:
-            tasks = []
-            conversation_id = request.headers.get("x-conversation-id", "")
-            for tool_call in assistant_message.tool_calls:
-                tasks.append(self._process_tool_call(tool_call, choice, request.api_key, conversation_id))
-            tool_messages = await asyncio.gather(*tasks)
-            self.state[TOOL_CALL_HISTORY_KEY].append(assistant_message.dict(exclude_none=True))
-            self.state[TOOL_CALL_HISTORY_KEY].extend(tool_messages)
-            return await self.handle_request(deployment_name, choice, request, response)
-        else:
-            choice.set_state(self.state)
-            return assistant_message
+    @staticmethod
+    def _is_complete_json(arguments: str) -> bool:
+        if not arguments.rstrip().endswith("}"):
+            return False
+        try:
+            json.loads(arguments)
+        except ValueError:
+            return False
+        return True
+
+    async def _collect_tool_messages(self, session: ToolSession, tool_calls: list[ToolCall]) -> list[dict[str, Any]]:
+        """Wait for the dispatched tool calls; tool messages keep the order of the calls."""
+        tool_messages: list[dict[str, Any]] = [{} for _ in tool_calls]
+        async for call_result in session.results():
+            tool_call = tool_calls[call_result.index]
+            if call_result.error is None:
+                tool_messages[call_result.index] = call_result.result
+            else:
+                tool_messages[call_result.index] = Message(
+                    role=Role.TOOL,
+                    name=StrictStr(tool_call.function.name),
+                    tool_call_id=StrictStr(tool_call.id),
+                    content=f"Error: {call_result.error}"
+                ).dict(exclude_none=True)
+        return tool_messages
+
+    async def _compact_for_state(self, messages: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        """Offload large tool results, so the state sent back by the client on every request stays small."""
+        if self.blob_store is None:
+            return messages
+        return await asyncio.to_thread(offload_tool_messages, messages, self.blob_store, self.offload_min_chars)
 
     def _prepare_messages(self, messages: list[Message]) -> list[dict[str, Any]]:
         unpacked = unpack_messages(messages, self.state.get(TOOL_CALL_HISTORY_KEY, []))
         system_message = {"role": "system", "content": self.system_prompt}
         full_messages = [system_message] + unpacked
-        for msg in full_messages:
-            print(json.dumps(msg, indent=2, ensure_ascii=False))
+        logger.debug("Prepared %d messages", len(full_messages))
         return full_messages
 
     async def _process_tool_call(self, tool_call: ToolCall, choice: Choice, api_key: str, conversation_id: str) -> dict[str, Any]:
         tool_name = tool_call.function.name
-        stage = StageProcessor.open_stage(choice, name=tool_name)
-        tool = self._tools_dict[tool_name]
-        if tool.show_in_stage:
-            stage.append_content("## Request arguments: \n")
-            stage.append_content(f"```json\n\r{json.dumps(json.loads(tool_call.function.arguments), indent=2)}\n\r```\n\r")
-            stage.append_content("## Response: \n")
-        tool_message = await tool.execute(ToolCallParams(
-            tool_call=tool_call,
-            stage=stage,
-            choice=choice,
-            api_key=api_key,
-            conversation_id=conversation_id
-        ))
-        StageProcessor.close_stage_safely(stage)
+        stage = BufferedStage(
+            StageProcessor.open_stage(choice, name=tool_name),
+            flush_interval=self.output_flush_interval,
+            max_buffer_chars=self.output_flush_chars,
+            max_total_chars=self.stage_max_chars
+        )
+        tool = self.tool_catalog.by_name[tool_name]
+        try:
+            if tool.show_in_stage:
+                stage.append_content("## Request arguments: \n")
+                stage.append_content(f"```json\n\r{json.dumps(json.loads(tool_call.function.arguments), indent=2)}\n\r```\n\r")
+                stage.append_content("## Response: \n")
+            tool_message = await tool.execute(ToolCallParams(
+                tool_call=tool_call,
+                stage=stage,
+                choice=choice,
+                api_key=api_key,
+                conversation_id=conversation_id
+            ))
+        finally:
+            # Also closes the stage of a call cancelled at its deadline
+            StageProcessor.close_stage_safely(stage)
         return tool_message.dict(exclude_none=True)
\ No newline at end of file
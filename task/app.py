@@ -1,8 +1,14 @@
+import asyncio
 import os
+import time
+from contextlib import AsyncExitStack, asynccontextmanager
+from datetime import timedelta
+from typing import Optional
 
 import uvicorn
 from aidial_sdk import DIALApp
 from aidial_sdk.chat_completion import ChatCompletion, Request, Response
+from fastapi.responses import JSONResponse
 
 from task.agent import GeneralPurposeAgent
 from task.prompts import SYSTEM_PROMPT
@@ -10,52 +16,290 @@ from task.tools.base import BaseTool
 from task.tools.deployment.image_generation_tool import ImageGenerationTool
 from task.tools.files.file_content_extraction_tool import FileContentExtractionTool
 from task.tools.py_interpreter.python_code_interpreter_tool import PythonCodeInterpreterTool
-from task.tools.mcp.mcp_client import MCPClient
+from task.tools.mcp.mcp_client_pool import MCPClientPool
 from task.tools.mcp.mcp_tool import MCPTool
 from task.tools.rag.document_cache import DocumentCache
+from task.tools.rag.embedding_executor import EmbeddingExecutor
+from task.tools.rag.index_factory import IndexConfig
+from task.tools.rag.index_store import PersistentIndexStore
 from task.tools.rag.rag_tool import RagTool
+from task.tools.registry import ToolRegistry
+from task.tools.router import ToolRouter
+from task.tools.scheduler import ToolLimit, ToolScheduler
+from task.utils.blob_store import BlobStore
+from task.utils.context import ContextManager
+from task.utils.dial_client_factory import DialClientFactory
+from task.utils.extracted_text_cache import ExtractedTextCache
+from task.utils.log import get_logger, setup_logging
+from task.utils.pdf_extractor import PdfPageExtractor
+
+logger = get_logger(__name__)
 
 DIAL_ENDPOINT = os.getenv('DIAL_ENDPOINT', "http://localhost:8080")
 DEPLOYMENT_NAME = os.getenv('DEPLOYMENT_NAME', 'gpt-4o')
 # DEPLOYMENT_NAME = os.getenv('DEPLOYMENT_NAME', 'claude-haiku-4-5')
+EMBEDDING_WORKERS = int(os.getenv('EMBEDDING_WORKERS', '2'))
+EMBEDDING_MAX_PENDING = int(os.getenv('EMBEDDING_MAX_PENDING', '32'))
+EMBEDDING_TIMEOUT = float(os.getenv('EMBEDDING_TIMEOUT', '300'))
+EMBEDDING_MAX_BATCH_SIZE = int(os.getenv('EMBEDDING_MAX_BATCH_SIZE', '64'))
+EMBEDDING_MAX_BATCH_WAIT_MS = float(os.getenv('EMBEDDING_MAX_BATCH_WAIT_MS', '5'))
+DOCUMENT_CACHE_MAX_BYTES = int(os.getenv('DOCUMENT_CACHE_MAX_BYTES', str(512 * 1024 * 1024)))
+DOCUMENT_CACHE_TTL_HOURS = float(os.getenv('DOCUMENT_CACHE_TTL_HOURS', '24'))
+DOCUMENT_CACHE_EVICTION_POLICY = os.getenv('DOCUMENT_CACHE_EVICTION_POLICY', 'lru')
+INDEX_STORE_DIR = os.getenv('INDEX_STORE_DIR', '.cache/rag_indexes')
+INDEX_STORE_MAX_BYTES = int(os.getenv('INDEX_STORE_MAX_BYTES', str(4 * 1024 * 1024 * 1024)))
+RAG_INDEX_BACKEND = os.getenv('RAG_INDEX_BACKEND', 'auto')
+RAG_INDEX_METRIC = os.getenv('RAG_INDEX_METRIC', 'cosine')
+RAG_TOP_K = int(os.getenv('RAG_TOP_K', '3'))
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'json')
+LOG_SAMPLE_RATE = float(os.getenv('LOG_SAMPLE_RATE', '1.0'))
+LOG_MAX_MESSAGE_LENGTH = int(os.getenv('LOG_MAX_MESSAGE_LENGTH', '2000'))
+DIAL_MAX_CONNECTIONS = int(os.getenv('DIAL_MAX_CONNECTIONS', '100'))
+DIAL_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv('DIAL_MAX_KEEPALIVE_CONNECTIONS', '20'))
+DIAL_KEEPALIVE_EXPIRY = float(os.getenv('DIAL_KEEPALIVE_EXPIRY', '30'))
+DIAL_HTTP2 = os.getenv('DIAL_HTTP2', 'false').lower() == 'true'
+CONTEXT_TOKEN_BUDGET = int(os.getenv('CONTEXT_TOKEN_BUDGET', '64000'))
+# Per-deployment budgets, e.g. "gpt-4o=100000,claude-haiku-4-5=150000"
+CONTEXT_TOKEN_BUDGETS = {
+    name.strip(): int(budget)
+    for name, budget in (
+        item.split('=', 1) for item in os.getenv('CONTEXT_TOKEN_BUDGETS', '').split(',') if '=' in item
+    )
+}
+CONTEXT_KEEP_RECENT_TURNS = int(os.getenv('CONTEXT_KEEP_RECENT_TURNS', '2'))
+CONTEXT_STUB_THRESHOLD = int(os.getenv('CONTEXT_STUB_THRESHOLD', '2000'))
+BLOB_STORE_DIR = os.getenv('BLOB_STORE_DIR', '.cache/tool_outputs')
+BLOB_STORE_MAX_BYTES = int(os.getenv('BLOB_STORE_MAX_BYTES', str(1024 * 1024 * 1024)))
+TOOL_OUTPUT_OFFLOAD_MIN_CHARS = int(os.getenv('TOOL_OUTPUT_OFFLOAD_MIN_CHARS', '2000'))
+AGENT_MAX_ROUNDS = int(os.getenv('AGENT_MAX_ROUNDS', '10'))
+OUTPUT_FLUSH_INTERVAL_MS = float(os.getenv('OUTPUT_FLUSH_INTERVAL_MS', '30'))
+OUTPUT_FLUSH_CHARS = int(os.getenv('OUTPUT_FLUSH_CHARS', '2048'))
+STAGE_MAX_CHARS = int(os.getenv('STAGE_MAX_CHARS', '20000'))
+TOOL_MAX_CONCURRENCY_PER_REQUEST = int(os.getenv('TOOL_MAX_CONCURRENCY_PER_REQUEST', '8'))
+TOOL_DEFAULT_MAX_CONCURRENCY = int(os.getenv('TOOL_DEFAULT_MAX_CONCURRENCY', '16'))
+TOOL_DEFAULT_TIMEOUT = float(os.getenv('TOOL_DEFAULT_TIMEOUT', '300'))
+IMAGE_GENERATION_MAX_CONCURRENCY = int(os.getenv('IMAGE_GENERATION_MAX_CONCURRENCY', '2'))
+IMAGE_GENERATION_TIMEOUT = float(os.getenv('IMAGE_GENERATION_TIMEOUT', '120'))
+PYTHON_INTERPRETER_MAX_CONCURRENCY = int(os.getenv('PYTHON_INTERPRETER_MAX_CONCURRENCY', '4'))
+PYTHON_INTERPRETER_TIMEOUT = float(os.getenv('PYTHON_INTERPRETER_TIMEOUT', '180'))
+PYTHON_INTERPRETER_MAX_TRANSFERS = int(os.getenv('PYTHON_INTERPRETER_MAX_TRANSFERS', '4'))
+PYTHON_INTERPRETER_WARM_SESSIONS = int(os.getenv('PYTHON_INTERPRETER_WARM_SESSIONS', '2'))
+PYTHON_INTERPRETER_PRELUDE = os.getenv('PYTHON_INTERPRETER_PRELUDE', '')
+PYTHON_INTERPRETER_SESSION_TTL = float(os.getenv('PYTHON_INTERPRETER_SESSION_TTL', '1800'))
+PYTHON_INTERPRETER_CLOSE_SESSION_TOOL = os.getenv('PYTHON_INTERPRETER_CLOSE_SESSION_TOOL') or None
+MCP_TOOL_MAX_CONCURRENCY = int(os.getenv('MCP_TOOL_MAX_CONCURRENCY', '8'))
+MCP_TOOL_TIMEOUT = float(os.getenv('MCP_TOOL_TIMEOUT', '60'))
+MCP_POOL_SIZE = int(os.getenv('MCP_POOL_SIZE', '4'))
+MCP_HEALTH_CHECK_INTERVAL = float(os.getenv('MCP_HEALTH_CHECK_INTERVAL', '30'))
+MCP_MAX_RETRIES = int(os.getenv('MCP_MAX_RETRIES', '2'))
+TOOL_ROUTER_ENABLED = os.getenv('TOOL_ROUTER_ENABLED', 'true').lower() == 'true'
+TOOL_ROUTER_TOP_K = int(os.getenv('TOOL_ROUTER_TOP_K', '8'))
+TOOL_ROUTER_ALWAYS_INCLUDE = {
+    name.strip() for name in os.getenv(
+        'TOOL_ROUTER_ALWAYS_INCLUDE',
+        'Image Generation Tool,File Content Extraction Tool,RAG Document QA Tool,execute_code'
+    ).split(',') if name.strip()
+}
+MCP_TOOLS_POLL_INTERVAL = float(os.getenv('MCP_TOOLS_POLL_INTERVAL', '0'))
+MCP_IDEMPOTENT_TOOLS = {name.strip() for name in os.getenv('MCP_IDEMPOTENT_TOOLS', '').split(',') if name.strip()}
+EXTRACTED_TEXT_CACHE_MAX_BYTES = int(os.getenv('EXTRACTED_TEXT_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+PDF_WORKERS = int(os.getenv('PDF_WORKERS', str(min(os.cpu_count() or 1, 4))))
+PDF_PAGES_PER_TASK = int(os.getenv('PDF_PAGES_PER_TASK', '16'))
+PDF_MIN_PAGES_FOR_POOL = int(os.getenv('PDF_MIN_PAGES_FOR_POOL', '32'))
+PDF_WORKER_MEMORY_LIMIT_MB = int(os.getenv('PDF_WORKER_MEMORY_LIMIT_MB', '1024'))
 
 
 class GeneralPurposeAgentApplication(ChatCompletion):
 
     def __init__(self):
-        self.tools: list[BaseTool] = []
+        self.tool_registry = ToolRegistry(poll_interval=MCP_TOOLS_POLL_INTERVAL or None)
+        self.tool_router: Optional[ToolRouter] = None
+        self.pdf_extractor = PdfPageExtractor(
+            max_workers=PDF_WORKERS,
+            pages_per_task=PDF_PAGES_PER_TASK,
+            min_pages_for_pool=PDF_MIN_PAGES_FOR_POOL,
+            memory_limit_mb=PDF_WORKER_MEMORY_LIMIT_MB or None
+        )
+        # Cleanups of everything held open (threads, processes, connections, sessions), run in reverse order
+        self.resources = AsyncExitStack()
+        self.resources.push_async_callback(lambda: DialClientFactory.get_instance().aclose())
+        self.resources.callback(self.pdf_extractor.shutdown)
+        self.ready = False
+        self._init_lock = asyncio.Lock()
+        self.tool_scheduler = ToolScheduler(
+            limits={
+                ImageGenerationTool: ToolLimit(IMAGE_GENERATION_MAX_CONCURRENCY, IMAGE_GENERATION_TIMEOUT),
+                PythonCodeInterpreterTool: ToolLimit(PYTHON_INTERPRETER_MAX_CONCURRENCY, PYTHON_INTERPRETER_TIMEOUT),
+                MCPTool: ToolLimit(MCP_TOOL_MAX_CONCURRENCY, MCP_TOOL_TIMEOUT),
+            },
+            default_limit=ToolLimit(TOOL_DEFAULT_MAX_CONCURRENCY, TOOL_DEFAULT_TIMEOUT),
+            max_concurrency_per_request=TOOL_MAX_CONCURRENCY_PER_REQUEST
+        )
+        self.blob_store = BlobStore(BLOB_STORE_DIR, max_bytes=BLOB_STORE_MAX_BYTES) if BLOB_STORE_DIR else None
+        self.context_manager = ContextManager(
+            budgets=CONTEXT_TOKEN_BUDGETS,
+            default_budget=CONTEXT_TOKEN_BUDGET,
+            keep_recent_turns=CONTEXT_KEEP_RECENT_TURNS,
+            stub_threshold=CONTEXT_STUB_THRESHOLD,
+            blob_store=self.blob_store
+        )
 
-    async def _get_mcp_tools(self, url: str) -> list[BaseTool]:
-        tools: list[BaseTool] = []
-        mcp_client = await MCPClient.create(url)
-        mcp_tools = await mcp_client.get_tools()
-        for tool_model in mcp_tools:
-            tools.append(MCPTool(mcp_client, tool_model))
-        return tools
+    @staticmethod
+    def _mcp_pool_options() -> dict:
+        return {
+            "size": MCP_POOL_SIZE,
+            "health_check_interval": MCP_HEALTH_CHECK_INTERVAL,
+            "max_retries": MCP_MAX_RETRIES,
+            "idempotent_tools": MCP_IDEMPOTENT_TOOLS,
+        }
 
-    async def _create_tools(self) -> list[BaseTool]:
+    async def _create_embedding_executor(self) -> EmbeddingExecutor:
+        # Loading the model is blocking, so it runs in a thread while the MCP servers are connected
+        embedding_executor = await asyncio.to_thread(
+            EmbeddingExecutor,
+            max_workers=EMBEDDING_WORKERS,
+            max_pending=EMBEDDING_MAX_PENDING,
+            timeout=EMBEDDING_TIMEOUT,
+            max_batch_size=EMBEDDING_MAX_BATCH_SIZE,
+            max_batch_wait=EMBEDDING_MAX_BATCH_WAIT_MS / 1000
+        )
+        # The first encode initializes the model kernels, so the first user request doesn't pay for it
+        await embedding_executor.encode(["warm-up"])
+        return embedding_executor
+
+    async def _create_tools(self, resources: AsyncExitStack) -> tuple[list[BaseTool], list[MCPClientPool]]:
+        """
+        Create the tools and the MCP servers they depend on. The cleanup of every part that was
+        created is pushed to `resources`, also when another part fails.
+        """
+        results = await asyncio.gather(
+            self._create_embedding_executor(),
+            PythonCodeInterpreterTool.create(
+                mcp_url="http://localhost:8050/mcp",
+                tool_name="execute_code",
+                dial_endpoint=DIAL_ENDPOINT,
+                max_concurrent_transfers=PYTHON_INTERPRETER_MAX_TRANSFERS,
+                warm_sessions=PYTHON_INTERPRETER_WARM_SESSIONS,
+                session_prelude=PYTHON_INTERPRETER_PRELUDE,
+                session_ttl=PYTHON_INTERPRETER_SESSION_TTL,
+                close_session_tool=PYTHON_INTERPRETER_CLOSE_SESSION_TOOL,
+                **self._mcp_pool_options()
+            ),
+            MCPClientPool.create("http://localhost:8051/mcp", **self._mcp_pool_options()),
+            return_exceptions=True
+        )
+        embedding_executor, py_interpreter, mcp_client = results
+        if not isinstance(embedding_executor, BaseException):
+            resources.callback(embedding_executor.shutdown)
+        if not isinstance(py_interpreter, BaseException):
+            resources.push_async_callback(py_interpreter.close)
+        if not isinstance(mcp_client, BaseException):
+            resources.push_async_callback(mcp_client.close)
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+
+        if TOOL_ROUTER_ENABLED:
+            self.tool_router = ToolRouter(
+                embedding_executor,
+                top_k=TOOL_ROUTER_TOP_K,
+                always_include=TOOL_ROUTER_ALWAYS_INCLUDE
+            )
         tools: list[BaseTool] = []
         tools.append(ImageGenerationTool(DIAL_ENDPOINT))
-        tools.append(FileContentExtractionTool(DIAL_ENDPOINT))
-        tools.append(RagTool(DIAL_ENDPOINT, DEPLOYMENT_NAME, DocumentCache.create()))
-        py_interpreter = await PythonCodeInterpreterTool.create(
-            mcp_url="http://localhost:8050/mcp",
-            tool_name="execute_code",
-            dial_endpoint=DIAL_ENDPOINT
+        text_cache = ExtractedTextCache(max_bytes=EXTRACTED_TEXT_CACHE_MAX_BYTES)
+        tools.append(FileContentExtractionTool(DIAL_ENDPOINT, text_cache, self.pdf_extractor))
+        document_cache = DocumentCache.create(
+            max_bytes=DOCUMENT_CACHE_MAX_BYTES,
+            ttl=timedelta(hours=DOCUMENT_CACHE_TTL_HOURS),
+            eviction_policy=DOCUMENT_CACHE_EVICTION_POLICY,
+            store=PersistentIndexStore(
+                INDEX_STORE_DIR,
+                model_version=embedding_executor.model_name,
+                max_bytes=INDEX_STORE_MAX_BYTES
+            ) if INDEX_STORE_DIR else None
         )
+        resources.callback(document_cache.stop_cleanup_task)
+        tools.append(RagTool(
+            DIAL_ENDPOINT,
+            DEPLOYMENT_NAME,
+            document_cache,
+            embedding_executor,
+            index_config=IndexConfig(backend=RAG_INDEX_BACKEND, metric=RAG_INDEX_METRIC),
+            top_k=RAG_TOP_K,
+            text_cache=text_cache,
+            pdf_extractor=self.pdf_extractor
+        ))
         tools.append(py_interpreter)
-        mcp_tools = await self._get_mcp_tools("http://localhost:8051/mcp")
-        tools.extend(mcp_tools)
-        return tools
+        return tools, [mcp_client]
+
+    async def init_tools(self) -> None:
+        """Create and warm up the tools once; concurrent callers wait for the same initialization."""
+        if self.ready:
+            return
+        async with self._init_lock:
+            if self.ready:
+                return
+            started_at = time.perf_counter()
+            # A failed build closes what it created and registers nothing, so the next request starts clean
+            async with AsyncExitStack() as resources:
+                try:
+                    tools, mcp_clients = await self._create_tools(resources)
+                    await self.tool_registry.register(tools, mcp_clients)
+                except BaseException:
+                    self.tool_router = None
+                    raise
+                self.resources.push_async_callback(resources.pop_all().aclose)
+                self.resources.push_async_callback(self.tool_registry.close)
+            if self.tool_router is not None:
+                # Tool embeddings are computed whenever a catalog is published, never on the request path
+                self.tool_registry.add_catalog_listener(self.tool_router.prepare_in_background)
+                try:
+                    await self.tool_router.prepare_in_background(self.tool_registry.catalog)
+                except Exception:
+                    logger.warning("Unable to embed the tool catalog, requests offer all tools until it is")
+            self.ready = True
+            logger.info(
+                "Tools initialized",
+                extra={
+                    "cold_start_ms": round((time.perf_counter() - started_at) * 1000),
+                    "tools": len(self.tool_registry.catalog.tools)
+                }
+            )
+
+    async def shutdown(self) -> None:
+        """Release all resources; every cleanup runs even if an earlier one fails."""
+        await self.resources.aclose()
+
+    async def startup(self) -> None:
+        try:
+            await self.init_tools()
+        except Exception:
+            # The app still starts, and the first request retries the initialization
+            logger.exception("Unable to initialize tools at startup")
+
+    async def readiness(self) -> JSONResponse:
+        if not self.ready:
+            return JSONResponse({"status": "starting"}, status_code=503)
+        return JSONResponse({"status": "ready"})
 
     async def chat_completion(self, request: Request, response: Response) -> None:
-        if not self.tools:
-            self.tools = await self._create_tools()
+        await self.init_tools()
         with response.create_single_choice() as choice:
             agent = GeneralPurposeAgent(
                 endpoint=DIAL_ENDPOINT,
                 system_prompt=SYSTEM_PROMPT,
-                tools=self.tools
+                tool_catalog=self.tool_registry.catalog,
+                tool_scheduler=self.tool_scheduler,
+                context_manager=self.context_manager,
+                max_rounds=AGENT_MAX_ROUNDS,
+                blob_store=self.blob_store,
+                offload_min_chars=TOOL_OUTPUT_OFFLOAD_MIN_CHARS,
+                tool_router=self.tool_router,
+                output_flush_interval=OUTPUT_FLUSH_INTERVAL_MS / 1000,
+                output_flush_chars=OUTPUT_FLUSH_CHARS,
+                stage_max_chars=STAGE_MAX_CHARS or None
             )
             await agent.handle_request(
                 deployment_name=DEPLOYMENT_NAME,
@@ -64,8 +308,35 @@ class GeneralPurposeAgentApplication(ChatCompletion):
                 response=response
             )
 
-app = DIALApp()
+setup_logging(
+    level=LOG_LEVEL,
+    json_format=LOG_FORMAT == 'json',
+    sample_rate=LOG_SAMPLE_RATE,
+    max_message_length=LOG_MAX_MESSAGE_LENGTH
+)
+DialClientFactory.configure(
+    max_connections=DIAL_MAX_CONNECTIONS,
+    max_keepalive_connections=DIAL_MAX_KEEPALIVE_CONNECTIONS,
+    keepalive_expiry=DIAL_KEEPALIVE_EXPIRY,
+    http2=DIAL_HTTP2
+)
+
 agent_app = GeneralPurposeAgentApplication()
+
+
+@asynccontextmanager
+async def lifespan(_: DIALApp):
+    # Tools warm up in the background, so the server binds right away; /ready reports when they are done
+    warm_up = asyncio.create_task(agent_app.startup())
+    yield
+    warm_up.cancel()
+    # A build that is still running unwinds what it created before the rest is released
+    await asyncio.gather(warm_up, return_exceptions=True)
+    await agent_app.shutdown()
+
+
+app = DIALApp(lifespan=lifespan)
+app.add_api_route("/ready", agent_app.readiness, methods=["GET"])
 app.add_chat_completion(
     deployment_name="general-purpose-agent",
     impl=agent_app
@@ -57,4 +57,9 @@ Common Mistakes to Avoid:
 - Not providing enough examples or explanations.
 - Ignoring edge cases or multi-step scenarios.
 - Failing to set or meet clear quality standards.
-"""
\ No newline at end of file
+"""
+
+FINAL_ROUND_PROMPT = """
+You have used all tool-calling rounds for this request. Do not call any more tools.
+Answer the user now with the information gathered so far, and say briefly if something could not be completed.
+""".strip()
@@ -2,12 +2,12 @@ import json
 from abc import ABC, abstractmethod
 from typing import Any
 
-from aidial_client import AsyncDial
 from aidial_sdk.chat_completion import Message, Role, CustomContent
 from pydantic import StrictStr
 
 from task.tools.base import BaseTool
 from task.tools.models import ToolCallParams
+from task.utils.dial_client_factory import DEFAULT_API_VERSION, DialClientFactory
 
 
 class DeploymentTool(BaseTool, ABC):
@@ -30,7 +30,7 @@ class DeploymentTool(BaseTool, ABC):
         arguments.pop("prompt", None)
         custom_fields = arguments if arguments else None
 
-        client = AsyncDial(base_url=self.endpoint, api_version="2025-01-01-preview", api_key=tool_call_params.api_key)
+        client = DialClientFactory.get_instance().create_async_client(self.endpoint, tool_call_params.api_key)
         messages = []
         if hasattr(self, "system_prompt") and getattr(self, "system_prompt", None):
             messages.append({"role": "system", "content": self.system_prompt})
@@ -40,6 +40,7 @@ class DeploymentTool(BaseTool, ABC):
             messages=messages,
             deployment_name=self.deployment_name,
             stream=True,
+            api_version=DEFAULT_API_VERSION,
             extra_body={"custom_fields": custom_fields} if custom_fields else {},
             **self.tool_parameters
         )
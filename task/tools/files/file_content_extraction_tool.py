@@ -1,22 +1,32 @@
 import json
-from typing import Any
+from typing import Any, Optional
 
 from aidial_sdk.chat_completion import Message
 
 from task.tools.base import BaseTool
 from task.tools.models import ToolCallParams
 from task.utils.dial_file_conent_extractor import DialFileContentExtractor
+from task.utils.extracted_text_cache import ExtractedTextCache
+from task.utils.pdf_extractor import PdfPageExtractor
 
 
 class FileContentExtractionTool(BaseTool):
     """
     Extracts text content from files. Supported: PDF (text only), TXT, CSV (as markdown table), HTML/HTM.
-    PAGINATION: Files >10,000 chars are paginated. Response format: `**Page #X. Total pages: Y**` appears at end if paginated.
+    PAGINATION: Files >10,000 chars are paginated; CSV pages hold whole rows. Response format: `**Page #X. Total pages: Y**` appears at end if paginated.
     USAGE: Start with page=1 (by default)
+    SUMMARY: mode='summary' describes a CSV file (schema, row count, column statistics, first and last rows).
     """
 
-    def __init__(self, endpoint: str):
+    def __init__(
+            self,
+            endpoint: str,
+            text_cache: Optional[ExtractedTextCache] = None,
+            pdf_extractor: Optional[PdfPageExtractor] = None,
+    ):
         self.endpoint = endpoint
+        self.text_cache = text_cache
+        self.pdf_extractor = pdf_extractor
 
     @property
     def show_in_stage(self) -> bool:
@@ -30,9 +40,10 @@ class FileContentExtractionTool(BaseTool):
     def description(self) -> str:
         return (
             "Extracts text content from files (PDF, TXT, CSV, HTML/HTM). "
-            "Supports pagination for large files (>10,000 characters). "
+            "Supports pagination for large files (>10,000 characters; CSV files are paged by whole rows). "
             "Returns content as plain text or markdown table (for CSV). "
-            "Use 'page' parameter to navigate large documents."
+            "Use 'page' parameter to navigate large documents. "
+            "For CSV files, mode 'summary' returns the schema, row count, column statistics and sample rows."
         )
 
     @property
@@ -46,8 +57,21 @@ class FileContentExtractionTool(BaseTool):
                 },
                 "page": {
                     "type": "integer",
-                    "description": "For large documents pagination is enabled. Each page consists of 10000 characters.",
+                    "description": (
+                        "For large documents pagination is enabled. A text page consists of 10000 characters. "
+                        "A CSV page is a markdown table of whole rows, about 10000 characters, "
+                        "with the column header repeated on every page."
+                    ),
                     "default": 1
+                },
+                "mode": {
+                    "type": "string",
+                    "enum": ["content", "summary"],
+                    "description": (
+                        "'summary' is for CSV files: columns with types, row count, per-column statistics "
+                        "and the first and last rows. Use it before reading the pages of a large CSV file."
+                    ),
+                    "default": "content"
                 }
             },
             "required": ["file_url"]
@@ -57,31 +81,53 @@ class FileContentExtractionTool(BaseTool):
         arguments = json.loads(tool_call_params.tool_call.function.arguments)
         file_url = arguments.get("file_url")
         page = arguments.get("page", 1)
+        mode = arguments.get("mode", "content")
         stage = tool_call_params.stage
 
         stage.append_content("## Request arguments: \n")
         stage.append_content(f"**File URL**: {file_url}\n\r")
         if page > 1:
             stage.append_content(f"**Page**: {page}\n\r")
+        if mode != "content":
+            stage.append_content(f"**Mode**: {mode}\n\r")
         stage.append_content("## Response: \n")
 
-        extractor = DialFileContentExtractor(self.endpoint, tool_call_params.api_key)
-        content = extractor.extract_text(file_url)
-        if not content:
-            content = "Error: File content not found."
+        extractor = DialFileContentExtractor(
+            self.endpoint, tool_call_params.api_key, self.text_cache, self.pdf_extractor
+        )
+        if await extractor.is_csv(file_url):
+            content = await self.__get_csv_content(extractor, file_url, page, mode)
+            stage.append_content(f"```text\n\r{content}\n\r```\n\r")
+            return content
+        if mode == "summary":
+            return "Error: Summary mode is supported only for CSV files."
 
-        page_size = 10_000
-        if len(content) > page_size:
-            total_pages = (len(content) + page_size - 1) // page_size
+        extracted = await extractor.get_extracted_text(file_url)
+        if not extracted.text:
+            content = "Error: File content not found."
+        elif extracted.total_pages == 1:
+            content = extracted.text
+        else:
+            total_pages = extracted.total_pages
             if page < 1:
                 page = 1
             if page > total_pages:
                 content = f"Error: Page {page} does not exist. Total pages: {total_pages}"
             else:
-                start_index = (page - 1) * page_size
-                end_index = start_index + page_size
-                page_content = content[start_index:end_index]
-                content = f"{page_content}\n\n**Page #{page}. Total pages: {total_pages}**"
+                content = f"{extracted.page(page)}\n\n**Page #{page}. Total pages: {total_pages}**"
 
         stage.append_content(f"```text\n\r{content}\n\r```\n\r")
-        return content
\ No newline at end of file
+        return content
+
+    @staticmethod
+    async def __get_csv_content(extractor: DialFileContentExtractor, file_url: str, page: int, mode: str) -> str:
+        # CSV files are read in chunks and only the requested page is rendered, so large files fit in memory
+        if mode == "summary":
+            return await extractor.get_csv_summary(file_url)
+        page = max(page, 1)
+        table, total_pages = await extractor.get_csv_page(file_url, page)
+        if not table:
+            return f"Error: Page {page} does not exist. Total pages: {total_pages}"
+        if total_pages == 1:
+            return table
+        return f"{table}\n\n**Page #{page}. Total pages: {total_pages}**"
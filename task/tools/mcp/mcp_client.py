@@ -1,69 +1,117 @@
-from typing import Optional, Any
+import asyncio
+from typing import Any, Callable, Optional
 
 from mcp import ClientSession
 from mcp.client.streamable_http import streamablehttp_client
-from mcp.types import CallToolResult, TextContent, ReadResourceResult, TextResourceContents, BlobResourceContents
+from mcp.types import (
+    CallToolResult, TextContent, ReadResourceResult, TextResourceContents, BlobResourceContents, ListToolsResult,
+    ServerNotification, ToolListChangedNotification
+)
 from pydantic import AnyUrl
 
 from task.tools.mcp.mcp_tool_model import MCPToolModel
+from task.utils.log import get_logger
+
+logger = get_logger(__name__)
 
 
 class MCPClient:
     """Handles MCP server connection and tool execution"""
 
-    def __init__(self, mcp_server_url: str) -> None:
+    def __init__(self, mcp_server_url: str, on_tools_changed: Optional[Callable[[], None]] = None) -> None:
         self.server_url = mcp_server_url
+        # Called from the session's receive loop, so it must not wait on the session itself
+        self.on_tools_changed = on_tools_changed
         self.session: Optional[ClientSession] = None
-        self._streams_context = None
-        self._session_context = None
+        self._connection: Optional[asyncio.Task] = None
+        self._closing: Optional[asyncio.Event] = None
 
     @classmethod
-    async def create(cls, mcp_server_url: str) -> 'MCPClient':
-        instance = cls(mcp_server_url)
+    async def create(cls, mcp_server_url: str, on_tools_changed: Optional[Callable[[], None]] = None) -> 'MCPClient':
+        instance = cls(mcp_server_url, on_tools_changed)
         await instance.connect()
         return instance
 
     async def connect(self):
         if self.session is not None:
             return
-        self._streams_context = streamablehttp_client(self.server_url)
-        read_stream, write_stream, _ = await self._streams_context.__aenter__()
-        self._session_context = ClientSession(read_stream, write_stream)
-        self.session = await self._session_context.__aenter__()
-        await self.session.initialize()
-        print("[MCPClient] Session initialized.")
+        # The transport and session contexts are entered and exited by one dedicated task:
+        # their anyio cancel scopes must not leak into (and cancel) the task that calls connect
+        connected = asyncio.get_running_loop().create_future()
+        self._closing = asyncio.Event()
+        self._connection = asyncio.create_task(self.__run_connection(connected, self._closing))
+        await connected
+        logger.info("MCP session initialized for %s", self.server_url)
+
+    async def __run_connection(self, connected: asyncio.Future, closing: asyncio.Event) -> None:
+        try:
+            async with streamablehttp_client(self.server_url) as (read_stream, write_stream, _):
+                async with ClientSession(read_stream, write_stream, message_handler=self.__handle_message) as session:
+                    await session.initialize()
+                    self.session = session
+                    connected.set_result(None)
+                    await closing.wait()
+        except BaseException as e:
+            if not connected.done():
+                connected.set_exception(ConnectionError(f"Unable to connect to MCP server {self.server_url}: {e!r}"))
+            elif not closing.is_set():
+                logger.warning("MCP connection to %s closed: %r", self.server_url, e)
+        finally:
+            self.session = None
+
+    async def __handle_message(self, message: Any) -> None:
+        if isinstance(message, ServerNotification) and isinstance(message.root, ToolListChangedNotification):
+            logger.info("MCP server %s reported changed tools", self.server_url)
+            if self.on_tools_changed is not None:
+                self.on_tools_changed()
+
+    @property
+    def is_connected(self) -> bool:
+        return self.session is not None
 
     async def get_tools(self) -> list[MCPToolModel]:
-        tools = await self.session.get_tools()
-        return [MCPToolModel(**tool) for tool in tools]
+        result: ListToolsResult = await self.__session().list_tools()
+        return [
+            MCPToolModel(
+                name=tool.name,
+                description=tool.description or "",
+                parameters=tool.inputSchema,
+                idempotent=bool(tool.annotations and (tool.annotations.idempotentHint or tool.annotations.readOnlyHint))
+            )
+            for tool in result.tools
+        ]
 
     async def call_tool(self, tool_name: str, tool_args: dict[str, Any]) -> Any:
-        result: CallToolResult = await self.session.call_tool(tool_name, tool_args)
-        # result.content is a list of TextContent or similar
-        if hasattr(result, "content") and isinstance(result.content, list):
-            # If only one content, return its value, else join all as string
-            if len(result.content) == 1:
-                return result.content[0].value
-            return "\n".join([c.value for c in result.content])
-        return str(result)
+        result: CallToolResult = await self.__session().call_tool(tool_name, tool_args)
+        texts = [content.text if isinstance(content, TextContent) else content.model_dump_json() for content in result.content]
+        # If only one content, return it, else join all as string
+        return texts[0] if len(texts) == 1 else "\n".join(texts)
 
     async def get_resource(self, uri: AnyUrl) -> str | bytes:
-        resource: ReadResourceResult = await self.session.get_resource(str(uri))
-        if isinstance(resource, TextResourceContents):
-            return resource.value
-        elif isinstance(resource, BlobResourceContents):
-            return resource.value
-        else:
-            return b""
+        """Read a resource: text resources are returned as text, binary ones as base64-encoded text."""
+        result: ReadResourceResult = await self.__session().read_resource(AnyUrl(str(uri)))
+        for resource in result.contents:
+            if isinstance(resource, TextResourceContents):
+                return resource.text
+            if isinstance(resource, BlobResourceContents):
+                return resource.blob
+        return b""
+
+    async def ping(self) -> None:
+        await self.__session().send_ping()
+
+    def __session(self) -> ClientSession:
+        if self.session is None:
+            raise ConnectionError(f"MCP server {self.server_url} is not connected")
+        return self.session
 
     async def close(self):
-        if self._session_context:
-            await self._session_context.__aexit__(None, None, None)
-        if self._streams_context:
-            await self._streams_context.__aexit__(None, None, None)
+        if self._connection is not None:
+            self._closing.set()
+            await asyncio.gather(self._connection, return_exceptions=True)
         self.session = None
-        self._session_context = None
-        self._streams_context = None
+        self._connection = None
+        self._closing = None
 
     async def __aenter__(self):
         await self.connect()
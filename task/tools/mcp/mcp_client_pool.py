@@ -0,0 +1,203 @@
+import asyncio
+import random
+from typing import Any, Callable, Optional
+
+from mcp.shared.exceptions import McpError
+from pydantic import AnyUrl
+
+from task.tools.mcp.mcp_client import MCPClient
+from task.tools.mcp.mcp_tool_model import MCPToolModel
+from task.utils.log import get_logger
+
+logger = get_logger(__name__)
+
+
+class MCPClientPool:
+    """
+    Pool of MCP sessions to one server, with the same interface as `MCPClient`.
+
+    Calls go to the connected session with the fewest calls in flight. A background task
+    pings every session each `health_check_interval` seconds, and broken sessions are
+    reconnected with exponential backoff. A call that fails because of its connection is
+    retried on another session if the tool is idempotent: marked so by the server or
+    listed in `idempotent_tools`. Errors reported by the server itself are never retried.
+    """
+
+    def __init__(
+            self,
+            mcp_server_url: str,
+            size: int = 4,
+            health_check_interval: float = 30.0,
+            ping_timeout: float = 5.0,
+            max_retries: int = 2,
+            backoff_base: float = 0.5,
+            backoff_max: float = 30.0,
+            idempotent_tools: Optional[set[str]] = None,
+    ):
+        self.server_url = mcp_server_url
+        self.size = size
+        self.health_check_interval = health_check_interval
+        self.ping_timeout = ping_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.idempotent_tools = set(idempotent_tools or ())
+        self._clients = [MCPClient(mcp_server_url, self.__notify_tools_changed) for _ in range(size)]
+        self._tools_changed_listeners: list[Callable[[], None]] = []
+        self._in_flight = [0] * size
+        self._reconnects: dict[int, asyncio.Task] = {}
+        self._connected = asyncio.Event()
+        self._health_check: Optional[asyncio.Task] = None
+
+    @classmethod
+    async def create(cls, mcp_server_url: str, **kwargs) -> 'MCPClientPool':
+        instance = cls(mcp_server_url, **kwargs)
+        try:
+            await instance.connect()
+        except BaseException:
+            # Also when cancelled: sessions that connected already must not stay open
+            await instance.close()
+            raise
+        return instance
+
+    async def connect(self) -> None:
+        """Open all sessions; succeeds if at least one connects, the rest keep reconnecting."""
+        results = await asyncio.gather(*(client.connect() for client in self._clients), return_exceptions=True)
+        for slot, result in enumerate(results):
+            if isinstance(result, Exception):
+                logger.warning("MCP session %d to %s failed to connect: %s", slot, self.server_url, result)
+                self.__schedule_reconnect(slot)
+        if not any(client.is_connected for client in self._clients):
+            await self.close()
+            raise ConnectionError(f"Unable to connect to MCP server {self.server_url}")
+        self._connected.set()
+        if self._health_check is None:
+            self._health_check = asyncio.create_task(self.__run_health_checks())
+
+    async def get_tools(self) -> list[MCPToolModel]:
+        tools = await self.__call(lambda client: client.get_tools(), retry=True)
+        self.idempotent_tools.update(tool.name for tool in tools if tool.idempotent)
+        return tools
+
+    async def call_tool(self, tool_name: str, tool_args: dict[str, Any]) -> Any:
+        return await self.__call(
+            lambda client: client.call_tool(tool_name, tool_args),
+            retry=tool_name in self.idempotent_tools
+        )
+
+    async def get_resource(self, uri: AnyUrl) -> str | bytes:
+        return await self.__call(lambda client: client.get_resource(uri), retry=True)
+
+    def add_tools_changed_listener(self, listener: Callable[[], None]) -> None:
+        """Register a callback for `tools/list_changed` notifications of the server; it must not block."""
+        self._tools_changed_listeners.append(listener)
+
+    def __notify_tools_changed(self) -> None:
+        for listener in self._tools_changed_listeners:
+            listener()
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "connected": sum(client.is_connected for client in self._clients),
+            "size": self.size,
+            "in_flight": sum(self._in_flight),
+            "reconnecting": len(self._reconnects),
+        }
+
+    async def close(self) -> None:
+        if self._health_check is not None:
+            self._health_check.cancel()
+            self._health_check = None
+        for task in self._reconnects.values():
+            task.cancel()
+        self._reconnects.clear()
+        await asyncio.gather(*(client.close() for client in self._clients), return_exceptions=True)
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+        return False
+
+    async def __call(self, operation, retry: bool) -> Any:
+        attempts = 1 + (self.max_retries if retry else 0)
+        for attempt in range(attempts):
+            slot = await self.__acquire()
+            self._in_flight[slot] += 1
+            try:
+                return await operation(self._clients[slot])
+            except McpError:
+                # The server answered, so the session is healthy
+                raise
+            except Exception as e:
+                logger.warning(
+                    "MCP call to %s failed on session %d (attempt %d/%d): %r",
+                    self.server_url, slot, attempt + 1, attempts, e
+                )
+                self.__schedule_reconnect(slot)
+                if attempt + 1 == attempts:
+                    raise
+            finally:
+                self._in_flight[slot] -= 1
+
+    async def __acquire(self) -> int:
+        while not (available := self.__available_slots()):
+            self._connected.clear()
+            # Wait for any session to come back, but not longer than the backoff limit
+            try:
+                await asyncio.wait_for(self._connected.wait(), timeout=self.backoff_max)
+            except asyncio.TimeoutError:
+                raise ConnectionError(f"MCP server {self.server_url} is not reachable") from None
+        return min(available, key=lambda slot: self._in_flight[slot])
+
+    def __available_slots(self) -> list[int]:
+        # Sessions waiting for a reconnect may still look connected until the reconnect closes them
+        return [
+            slot for slot, client in enumerate(self._clients)
+            if client.is_connected and slot not in self._reconnects
+        ]
+
+    def __schedule_reconnect(self, slot: int) -> None:
+        if slot not in self._reconnects:
+            task = asyncio.create_task(self.__reconnect(slot))
+            self._reconnects[slot] = task
+            task.add_done_callback(lambda _: self._reconnects.pop(slot, None))
+
+    async def __reconnect(self, slot: int) -> None:
+        client = self._clients[slot]
+        delay = self.backoff_base
+        while True:
+            await client.close()
+            try:
+                await client.connect()
+            except Exception as e:
+                logger.warning("MCP session %d to %s: reconnect failed, retrying in %.1fs: %s",
+                               slot, self.server_url, delay, e)
+                # Jitter keeps sessions of many workers from reconnecting in lockstep
+                await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+                delay = min(delay * 2, self.backoff_max)
+                continue
+            logger.info("MCP session %d to %s reconnected", slot, self.server_url)
+            self._connected.set()
+            # The server may have been restarted with other tools
+            self.__notify_tools_changed()
+            return
+
+    async def __run_health_checks(self) -> None:
+        while True:
+            await asyncio.sleep(self.health_check_interval)
+            await asyncio.gather(*(self.__check(slot) for slot in range(self.size)))
+
+    async def __check(self, slot: int) -> None:
+        if slot in self._reconnects:
+            return
+        client = self._clients[slot]
+        try:
+            if not client.is_connected:
+                raise ConnectionError("session is closed")
+            await asyncio.wait_for(client.ping(), timeout=self.ping_timeout)
+        except Exception as e:
+            logger.warning("MCP session %d to %s failed its health check: %r", slot, self.server_url, e)
+            self.__schedule_reconnect(slot)
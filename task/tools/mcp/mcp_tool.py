@@ -4,14 +4,14 @@ from typing import Any
 from aidial_sdk.chat_completion import Message
 
 from task.tools.base import BaseTool
-from task.tools.mcp.mcp_client import MCPClient
+from task.tools.mcp.mcp_client_pool import MCPClientPool
 from task.tools.mcp.mcp_tool_model import MCPToolModel
 from task.tools.models import ToolCallParams
 
 
 class MCPTool(BaseTool):
 
-    def __init__(self, client: MCPClient, mcp_tool_model: MCPToolModel):
+    def __init__(self, client: MCPClientPool, mcp_tool_model: MCPToolModel):
         self.client = client
         self.mcp_tool_model = mcp_tool_model
 
@@ -7,3 +7,5 @@ class MCPToolModel(BaseModel):
     name: str
     description: str
     parameters: dict[str, Any]
+    # Safe to retry after a connection failure (the server marks it idempotent or read-only)
+    idempotent: bool = False
@@ -2,11 +2,13 @@ from dataclasses import dataclass
 from aidial_sdk.chat_completion import Stage, Choice
 from aidial_client.types.chat.legacy.chat_completion import ToolCall
 
+from task.utils.stage import BufferedStage
+
 
 @dataclass
 class ToolCallParams:
     tool_call: ToolCall
-    stage: Stage
+    stage: Stage | BufferedStage
     choice: Choice
     api_key: str
     conversation_id: str
@@ -0,0 +1,63 @@
+import base64
+import hashlib
+import io
+import tempfile
+from dataclasses import dataclass, field
+from typing import IO, Optional
+
+# Base64 resources longer than this are decoded into a temporary file instead of memory
+_SPOOL_THRESHOLD_CHARS = 4 * 1024 * 1024
+# Multiple of 4, so every block decodes on its own
+_DECODE_BLOCK_CHARS = 1024 * 1024
+
+_TEXT_MIME_TYPES = ("application/json", "application/xml")
+
+
+@dataclass
+class _Artifact:
+    """Decoded content of a file produced by the interpreter, ready to upload."""
+
+    content: bytes | IO[bytes]
+    content_hash: str
+    _spool: Optional[IO[bytes]] = field(default=None, repr=False)
+
+    def close(self) -> None:
+        if self._spool is not None:
+            self.content.close()
+            self._spool.close()
+
+
+def _is_text(mime_type: str) -> bool:
+    return mime_type.startswith("text/") or mime_type in _TEXT_MIME_TYPES
+
+
+def _decode_artifact(resource: str | bytes, mime_type: str) -> _Artifact:
+    """
+    Decode a resource read from the interpreter: text as UTF-8, binary content from base64.
+    Large base64 content is decoded block by block into a temporary file, so the decoded bytes
+    are never held in memory next to the base64 text.
+    """
+    if isinstance(resource, bytes):
+        return _Artifact(resource, hashlib.sha256(resource).hexdigest())
+    if _is_text(mime_type):
+        data = resource.encode("utf-8")
+        return _Artifact(data, hashlib.sha256(data).hexdigest())
+    if len(resource) <= _SPOOL_THRESHOLD_CHARS:
+        data = base64.b64decode(resource)
+        return _Artifact(data, hashlib.sha256(data).hexdigest())
+
+    content_hash = hashlib.sha256()
+    spool = tempfile.TemporaryFile()
+    try:
+        for start in range(0, len(resource), _DECODE_BLOCK_CHARS):
+            block = base64.b64decode(resource[start:start + _DECODE_BLOCK_CHARS])
+            content_hash.update(block)
+            spool.write(block)
+        spool.flush()
+        # The DIAL client accepts file content only as bytes, str or a BufferedReader
+        reader = io.BufferedReader(io.FileIO(spool.fileno(), 'rb', closefd=False))
+        reader.seek(0)
+    except BaseException:
+        spool.close()
+        raise
+    return _Artifact(reader, content_hash.hexdigest(), spool)
@@ -17,6 +17,14 @@ class _FileReference(BaseModel):
     size: int
 
 
+class _UploadedFile(BaseModel):
+    """A result file copied to DIAL storage."""
+
+    url: str
+    type: str
+    title: str
+
+
 class _ExecutionResult(BaseModel):
     """Standardized response structure for code execution."""
 
@@ -26,4 +34,5 @@ class _ExecutionResult(BaseModel):
     error: Optional[str] = Field(default=None)
     traceback: list[str] = Field(default_factory=list)
     files: list[_FileReference] = Field(default_factory=list)
+    attachments: list[_UploadedFile] = Field(default_factory=list)
     session_info: Optional[_SessionInfo] = Field(default=None)
@@ -0,0 +1,145 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, Optional
+
+from task.tools.py_interpreter._response import _ExecutionResult
+from task.utils.log import get_logger
+
+logger = get_logger(__name__)
+
+
+class _InterpreterSessionPool:
+    """
+    Interpreter sessions started ahead of time, so the first code of a conversation doesn't wait
+    for the kernel to start and for the `prelude` imports.
+
+    A new conversation gets a warm session, and later calls of the conversation reuse it.
+    Sessions of conversations idle for `ttl` seconds are forgotten (and closed on the server
+    if it offers a tool for that). Warm sessions never handed out within `ttl` are replaced
+    only if they can be closed; otherwise they are kept, so they don't pile up on the server.
+    """
+
+    def __init__(
+            self,
+            execute: Callable[[str], Awaitable[_ExecutionResult]],
+            size: int = 2,
+            prelude: str = "",
+            ttl: float = 1_800,
+            close_session: Optional[Callable[[str], Awaitable[None]]] = None,
+    ):
+        self.execute = execute
+        self.size = size
+        self.prelude = prelude
+        self.ttl = ttl
+        self.close_session = close_session
+        self._warm: deque[tuple[str, float]] = deque()
+        self._conversations: OrderedDict[str, tuple[str, float]] = OrderedDict()
+        self._starting = 0
+        self._fill: Optional[asyncio.Task] = None
+        self._recycle: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._recycle is None:
+            self._recycle = asyncio.create_task(self.__run_recycling())
+        self.__schedule_fill()
+
+    def acquire(self, conversation_id: str) -> Optional[str]:
+        """
+        Return the session of a conversation, assigning a warm one to a new conversation.
+
+        Args:
+            conversation_id: Conversation ID, empty if unknown
+
+        Returns:
+            Session ID, or None if no warm session is available and the server should start one
+        """
+        now = time.monotonic()
+        if conversation_id and conversation_id in self._conversations:
+            session_id, _ = self._conversations[conversation_id]
+            self._conversations[conversation_id] = (session_id, now)
+            self._conversations.move_to_end(conversation_id)
+            return session_id
+        if not self._warm:
+            self.__schedule_fill()
+            return None
+        session_id, _ = self._warm.popleft()
+        if conversation_id:
+            # Bound before the code runs, so parallel calls of the conversation share the session
+            self._conversations[conversation_id] = (session_id, now)
+        self.__schedule_fill()
+        return session_id
+
+    def bind(self, conversation_id: str, session_id: str) -> None:
+        """Remember the session that served a conversation (the server may have started a new one)."""
+        if conversation_id:
+            self._conversations[conversation_id] = (session_id, time.monotonic())
+            self._conversations.move_to_end(conversation_id)
+
+    async def close(self) -> None:
+        for task in (self._fill, self._recycle):
+            if task is not None:
+                task.cancel()
+        self._fill = self._recycle = None
+        sessions = [session_id for session_id, _ in self._warm]
+        sessions += [session_id for session_id, _ in self._conversations.values()]
+        self._warm.clear()
+        self._conversations.clear()
+        await asyncio.gather(*(self.__close_session(session_id) for session_id in sessions))
+
+    def __schedule_fill(self) -> None:
+        if self.size > 0 and (self._fill is None or self._fill.done()):
+            self._fill = asyncio.create_task(self.__fill())
+
+    async def __fill(self) -> None:
+        missing = self.size - len(self._warm) - self._starting
+        if missing <= 0:
+            return
+        self._starting += missing
+        try:
+            results = await asyncio.gather(*(self.__start_session() for _ in range(missing)), return_exceptions=True)
+        finally:
+            self._starting -= missing
+        for result in results:
+            if isinstance(result, BaseException):
+                logger.warning("Unable to start a warm interpreter session: %r", result)
+            else:
+                self._warm.append((result, time.monotonic()))
+        logger.debug("Warm interpreter sessions: %d", len(self._warm))
+
+    async def __start_session(self) -> str:
+        started_at = time.perf_counter()
+        result = await self.execute(self.prelude or "pass")
+        if not result.success or result.session_info is None:
+            raise RuntimeError(result.error or "the interpreter returned no session")
+        logger.info(
+            "Started warm interpreter session",
+            extra={"session_id": result.session_info.session_id,
+                   "warm_up_ms": round((time.perf_counter() - started_at) * 1000)}
+        )
+        return result.session_info.session_id
+
+    async def __run_recycling(self) -> None:
+        while True:
+            await asyncio.sleep(max(self.ttl / 4, 1))
+            expired_at = time.monotonic() - self.ttl
+            expired = []
+            if self.close_session is not None:
+                expired = [session_id for session_id, created_at in self._warm if created_at < expired_at]
+                self._warm = deque(entry for entry in self._warm if entry[1] >= expired_at)
+            for conversation_id, (session_id, last_used) in list(self._conversations.items()):
+                if last_used < expired_at:
+                    del self._conversations[conversation_id]
+                    expired.append(session_id)
+            if expired:
+                logger.info("Recycling %d idle interpreter sessions", len(expired))
+                await asyncio.gather(*(self.__close_session(session_id) for session_id in expired))
+            self.__schedule_fill()
+
+    async def __close_session(self, session_id: str) -> None:
+        if self.close_session is None:
+            return
+        try:
+            await self.close_session(session_id)
+        except Exception as e:
+            logger.warning("Unable to close interpreter session %s: %r", session_id, e)
@@ -1,16 +1,27 @@
-import base64
+import asyncio
 import json
+from collections import OrderedDict
+from pathlib import PurePosixPath
 from typing import Any, Optional
 
-from aidial_client import Dial
+from aidial_client import AsyncDial
 from aidial_sdk.chat_completion import Message, Attachment
 from pydantic import StrictStr, AnyUrl
 
 from task.tools.base import BaseTool
-from task.tools.py_interpreter._response import _ExecutionResult
-from task.tools.mcp.mcp_client import MCPClient
+from task.tools.py_interpreter._artifacts import _decode_artifact
+from task.tools.py_interpreter._response import _ExecutionResult, _FileReference, _UploadedFile
+from task.tools.py_interpreter._session_pool import _InterpreterSessionPool
+from task.tools.mcp.mcp_client_pool import MCPClientPool
 from task.tools.mcp.mcp_tool_model import MCPToolModel
 from task.tools.models import ToolCallParams
+from task.utils.dial_client_factory import DialClientFactory
+from task.utils.log import get_logger
+
+logger = get_logger(__name__)
+
+# Content hash and ETag of the last upload per path, remembered to skip re-uploading unchanged files
+_MAX_UPLOADED_ENTRIES = 10_000
 
 
 class PythonCodeInterpreterTool(BaseTool):
@@ -22,13 +33,20 @@ class PythonCodeInterpreterTool(BaseTool):
 
     def __init__(
             self,
-            mcp_client: MCPClient,
+            mcp_client: MCPClientPool,
             mcp_tool_models: list[MCPToolModel],
             tool_name: str,
             dial_endpoint: str,
+            max_concurrent_transfers: int = 4,
+            warm_sessions: int = 0,
+            session_prelude: str = "",
+            session_ttl: float = 1_800,
+            close_session_tool: Optional[str] = None,
     ):
         self.dial_endpoint = dial_endpoint
         self.mcp_client = mcp_client
+        self.max_concurrent_transfers = max_concurrent_transfers
+        self._uploaded: OrderedDict[str, tuple[str, Optional[str]]] = OrderedDict()
         self._code_execute_tool: Optional[MCPToolModel] = None
         for tool in mcp_tool_models:
             if tool.name == tool_name:
@@ -36,6 +54,18 @@ class PythonCodeInterpreterTool(BaseTool):
                 break
         if self._code_execute_tool is None:
             raise ValueError("PythonCodeInterpreterTool requires a tool with name 'execute_code' in mcp_tool_models.")
+        has_close_tool = any(tool.name == close_session_tool for tool in mcp_tool_models)
+        self._session_pool = _InterpreterSessionPool(
+            execute=lambda code: self.__run_code({"code": code}),
+            size=warm_sessions,
+            prelude=session_prelude,
+            ttl=session_ttl,
+            close_session=(
+                lambda session_id: self.mcp_client.call_tool(
+                    close_session_tool, {"session_id": self.__session_argument(session_id)}
+                )
+            ) if has_close_tool else None
+        )
 
     @classmethod
     async def create(
@@ -43,10 +73,37 @@ class PythonCodeInterpreterTool(BaseTool):
             mcp_url: str,
             tool_name: str,
             dial_endpoint: str,
+            max_concurrent_transfers: int = 4,
+            warm_sessions: int = 0,
+            session_prelude: str = "",
+            session_ttl: float = 1_800,
+            close_session_tool: Optional[str] = None,
+            **pool_kwargs,
     ) -> 'PythonCodeInterpreterTool':
-        mcp_client = await MCPClient.create(mcp_url)
-        tools = await mcp_client.get_tools()
-        return cls(mcp_client, tools, tool_name, dial_endpoint)
+        mcp_client = await MCPClientPool.create(mcp_url, **pool_kwargs)
+        try:
+            tools = await mcp_client.get_tools()
+            instance = cls(
+                mcp_client,
+                tools,
+                tool_name,
+                dial_endpoint,
+                max_concurrent_transfers=max_concurrent_transfers,
+                warm_sessions=warm_sessions,
+                session_prelude=session_prelude,
+                session_ttl=session_ttl,
+                close_session_tool=close_session_tool
+            )
+        except BaseException:
+            await mcp_client.close()
+            raise
+        # Sessions are warmed up in the background, so the startup doesn't wait for them
+        instance._session_pool.start()
+        return instance
+
+    async def close(self) -> None:
+        await self._session_pool.close()
+        await self.mcp_client.close()
 
     @property
     def show_in_stage(self) -> bool:
@@ -69,6 +126,13 @@ class PythonCodeInterpreterTool(BaseTool):
         code = arguments.get("code")
         session_id = arguments.get("session_id", None)
         stage = tool_call_params.stage
+        conversation_id = tool_call_params.conversation_id
+
+        if not session_id:
+            # The conversation continues in its own session, or starts in a warm one
+            if (pooled_session_id := self._session_pool.acquire(conversation_id)) is not None:
+                session_id = self.__session_argument(pooled_session_id)
+                arguments["session_id"] = session_id
 
         stage.append_content("## Request arguments: \n")
         stage.append_content(f"```python\n\r{code}\n\r```\n\r")
@@ -77,33 +141,80 @@ class PythonCodeInterpreterTool(BaseTool):
         else:
             stage.append_content("New session will be created\n\r")
 
-        result_str = await self.mcp_client.call_tool(self._code_execute_tool.name, arguments)
-        execution_result = _ExecutionResult.model_validate_json(result_str)
+        execution_result = await self.__run_code(arguments)
+        if execution_result.session_info is not None:
+            self._session_pool.bind(conversation_id, execution_result.session_info.session_id)
 
         if execution_result.files:
-            dial_client = Dial(base_url=self.dial_endpoint, api_key=tool_call_params.api_key)
-            files_home = await dial_client.my_appdata_home()
-            attachments = []
-            for file in execution_result.files:
-                file_name = file.name
-                mime_type = file.mime_type
-                resource = await self.mcp_client.get_resource(file.uri)
-                if mime_type.startswith("text/") or mime_type in ("application/json", "application/xml"):
-                    upload_data = resource.encode("utf-8") if isinstance(resource, str) else resource
-                else:
-                    upload_data = base64.b64decode(resource) if isinstance(resource, str) else resource
-                upload_path = f"files/{(files_home / file_name).as_posix()}"
-                await dial_client.files.upload(upload_path, upload_data, mime_type=mime_type)
-                attachment = Attachment(url=upload_path, type=mime_type, title=file_name)
+            attachments = await self.__transfer_files(execution_result.files, tool_call_params.api_key)
+            for attachment in attachments:
                 stage.add_attachment(attachment)
-                attachments.append(attachment)
             # Add attachments to execution_result for output
-            if not hasattr(execution_result, "attachments"):
-                execution_result.attachments = []
-            execution_result.attachments.extend(attachments)
+            execution_result.attachments.extend(
+                _UploadedFile(url=attachment.url, type=attachment.type, title=attachment.title)
+                for attachment in attachments
+            )
 
         if execution_result.output:
             execution_result.output = [o[:1000] for o in execution_result.output]
 
         stage.append_content(f"```json\n\r{execution_result.model_dump_json(indent=2)}\n\r```\n\r")
-        return execution_result.model_dump_json()
\ No newline at end of file
+        return execution_result.model_dump_json()
+
+    async def __run_code(self, arguments: dict[str, Any]) -> _ExecutionResult:
+        result_str = await self.mcp_client.call_tool(self._code_execute_tool.name, arguments)
+        return _ExecutionResult.model_validate_json(result_str)
+
+    def __session_argument(self, session_id: str) -> str | int:
+        # Session IDs are reported as strings, but the tool may declare its argument as an integer
+        session_schema = self._code_execute_tool.parameters.get("properties", {}).get("session_id", {})
+        if session_schema.get("type") == "integer" and session_id.isdigit():
+            return int(session_id)
+        return session_id
+
+    async def __transfer_files(self, files: list[_FileReference], api_key: str) -> list[Attachment]:
+        """Copy the produced files to the user's DIAL storage, a few at a time; attachments keep the file order."""
+        dial_client = DialClientFactory.get_instance().create_async_client(self.dial_endpoint, api_key)
+        files_home = await dial_client.my_appdata_home()
+        semaphore = asyncio.Semaphore(self.max_concurrent_transfers)
+
+        async def transfer(file: _FileReference) -> Attachment:
+            async with semaphore:
+                return await self.__transfer_file(dial_client, files_home, file)
+
+        return list(await asyncio.gather(*(transfer(file) for file in files)))
+
+    async def __is_uploaded(self, dial_client: AsyncDial, upload_path: str, content_hash: str) -> bool:
+        """
+        Whether the storage still holds this content at the path: it was the last upload there,
+        and the file was neither replaced nor deleted since (its ETag is unchanged).
+        """
+        uploaded_hash, etag = self._uploaded.get(upload_path, (None, None))
+        if uploaded_hash != content_hash or etag is None:
+            return False
+        try:
+            metadata = await dial_client.files.get_metadata(upload_path)
+        except Exception as e:
+            logger.debug("Uploading %s again, its metadata is unavailable: %r", upload_path, e)
+            return False
+        return metadata.etag == etag
+
+    async def __transfer_file(self, dial_client: AsyncDial, files_home: PurePosixPath, file: _FileReference) -> Attachment:
+        resource = await self.mcp_client.get_resource(file.uri)
+        artifact = await asyncio.to_thread(_decode_artifact, resource, file.mime_type)
+        del resource
+        upload_path = f"files/{(files_home / file.name).as_posix()}"
+        try:
+            # Sessions report the same files on every run, so unchanged files are not uploaded again
+            if await self.__is_uploaded(dial_client, upload_path, artifact.content_hash):
+                self._uploaded.move_to_end(upload_path)
+                logger.debug("Skipped upload of unchanged file %s", upload_path)
+            else:
+                metadata = await dial_client.files.upload(upload_path, (file.name, artifact.content, file.mime_type))
+                self._uploaded[upload_path] = (artifact.content_hash, metadata.etag)
+                self._uploaded.move_to_end(upload_path)
+                if len(self._uploaded) > _MAX_UPLOADED_ENTRIES:
+                    self._uploaded.popitem(last=False)
+        finally:
+            artifact.close()
+        return Attachment(url=upload_path, type=file.mime_type, title=file.name)
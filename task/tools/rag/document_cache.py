@@ -1,27 +1,92 @@
-from datetime import datetime, time, timedelta
-from typing import Any, Tuple
+import hashlib
+import json
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Literal, Tuple
 import threading
 
+from task.tools.rag.index_store import PersistentIndexStore
+from task.utils.log import get_logger
+
+logger = get_logger(__name__)
+
+# File versions whose content hash is remembered in memory
+_MAX_SOURCES = 4_096
+
+
+@dataclass
+class _CacheEntry:
+    index: Any
+    chunks: Any
+    size: int
+    created_at: datetime
+    hits: int = field(default=0)
+
 
 class DocumentCache:
     """
-    Thread-safe document cache with automatic cleanup at midnight.
-    Removes entries older than 24 hours.
+    Thread-safe, content-addressed document index cache.
+    Entries are keyed by document content and indexing config, so identical documents
+    are indexed once per process regardless of conversation. Memory is bounded by
+    `max_bytes` (FAISS index bytes plus chunk text) with LRU or LFU eviction, and
+    entries older than `ttl` are dropped on access and by a periodic background sweep.
+    With a `store`, misses fall through to the persistent on-disk tier and new entries are
+    written through to it, so indexes survive restarts and are shared across workers.
+    The content hash of every indexed file version (file URL and ETag) is remembered as well,
+    so a cached document is found with a metadata request instead of a download.
     """
 
-    def __init__(self):
-        self._cache: dict[str, Tuple[Any, Any, datetime]] = {}
+    def __init__(
+            self,
+            max_bytes: int = 512 * 1024 * 1024,
+            ttl: timedelta = timedelta(hours=24),
+            eviction_policy: Literal["lru", "lfu"] = "lru",
+            cleanup_interval: timedelta = timedelta(hours=1),
+            store: PersistentIndexStore | None = None,
+    ):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.eviction_policy = eviction_policy
+        self.cleanup_interval = cleanup_interval
+        self.store = store
+        self._cache: OrderedDict[str, _CacheEntry] = OrderedDict()
+        self._sources: OrderedDict[tuple[str, str], str] = OrderedDict()
+        self._total_bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._store_hits = 0
         self._lock = threading.Lock()
         self._cleanup_thread = None
         self._stop_event = threading.Event()
         self._running = False
 
     @classmethod
-    def create(cls) ->'DocumentCache':
-        instance = cls()
+    def create(cls, **kwargs) -> 'DocumentCache':
+        instance = cls(**kwargs)
         instance.start_cleanup_task()
         return instance
 
+    @staticmethod
+    def make_key(content_hash: str, model_name: str, config: dict[str, Any]) -> str:
+        """
+        Build a content-addressed cache key.
+
+        Args:
+            content_hash: Hash of the document content
+            model_name: Embedding model name
+            config: Splitter and index settings that affect the stored index
+
+        Returns:
+            Hex digest identifying the (content, model, config) combination
+        """
+        digest = hashlib.sha256()
+        digest.update(model_name.encode('utf-8'))
+        digest.update(json.dumps(config, sort_keys=True).encode('utf-8'))
+        digest.update(content_hash.encode('utf-8'))
+        return digest.hexdigest()
+
     def get(self, key: str) -> Tuple[Any, Any] | None:
         """
         Retrieve a cached entry.
@@ -33,69 +98,164 @@ class DocumentCache:
             Tuple of (index, chunks) if found and not expired, None otherwise
         """
         with self._lock:
-            if key in self._cache:
-                index, chunks, timestamp = self._cache[key]
-                if datetime.now() - timestamp < timedelta(hours=24):
-                    return (index, chunks)
-                else:
-                    del self._cache[key]
-            return None
+            entry = self._cache.get(key)
+            if entry is not None and self._is_expired(entry, datetime.now()):
+                self._remove(key)
+                self._evictions += 1
+                entry = None
+            if entry is not None:
+                entry.hits += 1
+                self._cache.move_to_end(key)
+                self._hits += 1
+                return (entry.index, entry.chunks)
+
+        stored = self.store.get(key) if self.store else None
+        with self._lock:
+            if stored is None:
+                self._misses += 1
+                return None
+            self._store_hits += 1
+        index, chunks, size = stored
+        self._put(key, index, chunks, size)
+        return (index, chunks)
+
+    def find_content_hash(self, file_url: str, etag: str) -> str | None:
+        """
+        Look up the content hash of a file version indexed before.
+
+        Args:
+            file_url: File URL
+            etag: ETag of the file version
+
+        Returns:
+            Content hash if the version is known, None otherwise
+        """
+        with self._lock:
+            content_hash = self._sources.get((file_url, etag))
+            if content_hash is not None:
+                self._sources.move_to_end((file_url, etag))
+                return content_hash
+        content_hash = self.store.find_content_hash(file_url, etag) if self.store else None
+        if content_hash is not None:
+            self._remember(file_url, etag, content_hash)
+        return content_hash
+
+    def add_source(self, key: str, file_url: str, etag: str, content_hash: str) -> None:
+        """
+        Remember the content hash of a file version whose index is stored under `key`.
+
+        Args:
+            key: Cache key of the index
+            file_url: File URL
+            etag: ETag of the file version
+            content_hash: Content hash of the file version
+        """
+        if not self._remember(file_url, etag, content_hash):
+            return
+        if self.store:
+            self.store.add_source(key, file_url, etag, content_hash)
 
     def set(self, key: str, index: Any, chunks: Any) -> None:
         """
-        Store an entry in the cache.
+        Store an entry in the cache, evicting other entries if the memory budget is exceeded.
+        Entries larger than the whole budget are not cached.
 
         Args:
             key: Cache key
             index: FAISS index
             chunks: Document chunks
         """
+        self._put(key, index, chunks, self._entry_size(index, chunks))
+        if self.store:
+            self.store.put(key, index, chunks)
+
+    def _put(self, key: str, index: Any, chunks: Any, size: int) -> None:
+        if size > self.max_bytes:
+            return
         with self._lock:
-            self._cache[key] = (index, chunks, datetime.now())
+            if key in self._cache:
+                self._remove(key)
+            self._cache[key] = _CacheEntry(index=index, chunks=chunks, size=size, created_at=datetime.now())
+            self._total_bytes += size
+            while self._total_bytes > self.max_bytes:
+                self._remove(self._select_victim())
+                self._evictions += 1
 
     def clear(self) -> None:
         """Clear all cached entries."""
         with self._lock:
             self._cache.clear()
+            self._total_bytes = 0
 
     def cleanup_old_entries(self) -> int:
         """
-        Remove entries older than 24 hours.
+        Remove entries older than the TTL.
 
         Returns:
             Number of entries removed
         """
         now = datetime.now()
-        cutoff_time = now - timedelta(hours=24)
 
         with self._lock:
             keys_to_remove = [
-                key for key, (_, _, timestamp) in self._cache.items()
-                if timestamp < cutoff_time
+                key for key, entry in self._cache.items()
+                if self._is_expired(entry, now)
             ]
 
             for key in keys_to_remove:
-                del self._cache[key]
+                self._remove(key)
 
             removed_count = len(keys_to_remove)
+            self._evictions += removed_count
             if removed_count > 0:
-                print(f"[DocumentCache] Cleaned up {removed_count} expired entries at {now}")
+                logger.info("Cleaned up %d expired document cache entries", removed_count)
 
             return removed_count
 
-    def _schedule_midnight_cleanup(self) -> None:
-        """Background thread that runs cleanup at midnight every day."""
-        while not self._stop_event.is_set():
-            now = datetime.now()
-            tomorrow = now + timedelta(days=1)
-            midnight = datetime.combine(tomorrow.date(), time.min)
-            seconds_until_midnight = (midnight - now).total_seconds()
+    def stats(self) -> dict[str, int]:
+        """Return hit/miss/eviction counters and current usage."""
+        with self._lock:
+            return {
+                "hits": self._hits,
+                "store_hits": self._store_hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "entries": len(self._cache),
+                "bytes": self._total_bytes,
+            }
+
+    def _remember(self, file_url: str, etag: str, content_hash: str) -> bool:
+        with self._lock:
+            if self._sources.get((file_url, etag)) == content_hash:
+                self._sources.move_to_end((file_url, etag))
+                return False
+            self._sources[(file_url, etag)] = content_hash
+            while len(self._sources) > _MAX_SOURCES:
+                self._sources.popitem(last=False)
+            return True
+
+    def _is_expired(self, entry: _CacheEntry, now: datetime) -> bool:
+        return now - entry.created_at >= self.ttl
 
-            if self._stop_event.wait(timeout=seconds_until_midnight):
-                break
+    def _select_victim(self) -> str:
+        if self.eviction_policy == "lfu":
+            # Ties are broken by recency: OrderedDict iterates from least recently used
+            return min(self._cache, key=lambda key: self._cache[key].hits)
+        return next(iter(self._cache))
 
-            if not self._stop_event.is_set():
-                self.cleanup_old_entries()
+    def _remove(self, key: str) -> None:
+        entry = self._cache.pop(key)
+        self._total_bytes -= entry.size
+
+    @staticmethod
+    def _entry_size(index: Any, chunks: Any) -> int:
+        chunks_bytes = sum(len(chunk.encode('utf-8')) for chunk in chunks)
+        return _index_size(index) + chunks_bytes
+
+    def _schedule_cleanup(self) -> None:
+        """Background thread that removes expired entries every cleanup interval."""
+        while not self._stop_event.wait(timeout=self.cleanup_interval.total_seconds()):
+            self.cleanup_old_entries()
 
     def start_cleanup_task(self) -> None:
         """Start the background cleanup thread."""
@@ -103,12 +263,12 @@ class DocumentCache:
             self._running = True
             self._stop_event.clear()
             self._cleanup_thread = threading.Thread(
-                target=self._schedule_midnight_cleanup,
+                target=self._schedule_cleanup,
                 daemon=True,
                 name="DocumentCache-Cleanup"
             )
             self._cleanup_thread.start()
-            print("[DocumentCache] Started automatic cleanup thread (runs at midnight)")
+            logger.info("Started document cache cleanup thread (runs every %s)", self.cleanup_interval)
 
     def stop_cleanup_task(self) -> None:
         """Stop the background cleanup thread."""
@@ -117,7 +277,7 @@ class DocumentCache:
             self._stop_event.set()
             if self._cleanup_thread and self._cleanup_thread.is_alive():
                 self._cleanup_thread.join(timeout=5)
-            print("[DocumentCache] Stopped automatic cleanup thread")
+            logger.info("Stopped document cache cleanup thread")
 
     def size(self) -> int:
         """Return the number of cached entries."""
@@ -126,4 +286,24 @@ class DocumentCache:
 
     def __contains__(self, key: str) -> bool:
         """Check if a key exists in the cache (and is not expired)."""
-        return self.get(key) is not None
\ No newline at end of file
+        return self.get(key) is not None
+
+
+def _index_size(index: Any) -> int:
+    """Memory held by a FAISS index, computed from its structure instead of serializing a copy of it."""
+    import faiss
+    index = faiss.downcast_index(index)
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf = faiss.downcast_index(ivf)
+        # Codes and int64 ids of the inverted lists, the coarse centroids and the PQ codebooks
+        size = ivf.ntotal * (ivf.code_size + 8) + _index_size(ivf.quantizer)
+        if hasattr(ivf, 'pq'):
+            size += ivf.pq.centroids.size() * 4
+        return size
+    if hasattr(index, 'hnsw'):
+        hnsw = index.hnsw
+        # Stored vectors plus the graph: int32 neighbor links and levels, int64 neighbor offsets
+        links = hnsw.neighbors.size() * 4 + hnsw.levels.size() * 4 + hnsw.offsets.size() * 8
+        return _index_size(index.storage) + links
+    return index.ntotal * index.code_size
@@ -0,0 +1,204 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, Callable, Optional
+
+import numpy as np
+
+from task.tools.rag.index_factory import IndexBuilder, IndexConfig, prepare_query
+
+if TYPE_CHECKING:
+    import faiss
+
+
+class EmbeddingExecutorBusyError(Exception):
+    """Raised when the embedding executor queue is full."""
+
+
+class EmbeddingExecutor:
+    """
+    Runs SentenceTransformer encoding and FAISS indexing in a bounded thread pool,
+    so CPU-heavy work never blocks the asyncio event loop.
+
+    Both torch and faiss release the GIL in their native kernels, so threads give
+    real parallelism here while the model is loaded only once per process.
+
+    Texts from concurrent callers (queries and document chunks) are micro-batched:
+    they are collected for up to `max_batch_wait` seconds or until `max_batch_size`
+    texts are queued, and encoded with a single `encode` call.
+    """
+
+    def __init__(
+            self,
+            model_name: str = 'all-MiniLM-L6-v2',
+            max_workers: int = 2,
+            max_pending: int = 32,
+            timeout: float = 300.0,
+            max_batch_size: int = 64,
+            max_batch_wait: float = 0.005,
+    ):
+        self.model_name = model_name
+        self.timeout = timeout
+        self.max_batch_size = max_batch_size
+        self.max_batch_wait = max_batch_wait
+        self._max_pending = max_pending
+        self._pending = 0
+        self._semaphore = asyncio.Semaphore(max_workers)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="EmbeddingExecutor")
+        self._batch: list[tuple[list[str], asyncio.Future]] = []
+        self._batch_texts = 0
+        self._batch_flush: Optional[asyncio.TimerHandle] = None
+        self._batch_tasks: set[asyncio.Task] = set()
+        # Imported here: sentence_transformers pulls in torch, which takes seconds to load
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name, device='cpu')
+
+    @property
+    def dimension(self) -> int:
+        return self.model.get_sentence_embedding_dimension()
+
+    async def encode(self, texts: list[str], timeout: float | None = None) -> np.ndarray:
+        """
+        Encode texts into float32 embeddings in the worker pool.
+
+        Args:
+            texts: Texts to encode
+            timeout: Per-request timeout in seconds, defaults to the executor timeout
+
+        Returns:
+            Array of shape (len(texts), dimension)
+        """
+        return await asyncio.wait_for(self._encode_batched(texts), timeout=timeout or self.timeout)
+
+    def create_index_builder(self, index_config: IndexConfig) -> IndexBuilder:
+        return IndexBuilder(self.dimension, index_config)
+
+    async def add_to_index(self, builder: IndexBuilder, chunks: list[str], timeout: float | None = None) -> None:
+        """
+        Encode a batch of chunks and append them to an index that is being built incrementally.
+
+        Args:
+            builder: Index builder created by `create_index_builder`
+            chunks: Document chunks
+            timeout: Per-request timeout in seconds, defaults to the executor timeout
+        """
+        async def _add() -> None:
+            embeddings = await self._encode_batched(chunks)
+            await self._submit(builder.add, embeddings)
+
+        await asyncio.wait_for(_add(), timeout=timeout or self.timeout)
+
+    async def finish_index(self, builder: IndexBuilder, timeout: float | None = None) -> 'faiss.Index':
+        """Finish an incrementally built index in the worker pool."""
+        return await asyncio.wait_for(self._submit(builder.build), timeout=timeout or self.timeout)
+
+    async def search(
+            self,
+            indexes: list['faiss.Index'],
+            query: str,
+            k: int,
+            index_config: IndexConfig,
+            timeout: float | None = None,
+    ) -> list[tuple[np.ndarray, np.ndarray]]:
+        """
+        Encode a query once and search it in every index in the worker pool.
+
+        Args:
+            indexes: FAISS indexes to search in
+            query: Query text
+            k: Number of nearest neighbours per index
+            index_config: Settings the indexes were built with
+            timeout: Per-request timeout in seconds, defaults to the executor timeout
+
+        Returns:
+            Tuple of (distances, indices) as returned by FAISS for each index
+        """
+        async def _search() -> list[tuple[np.ndarray, np.ndarray]]:
+            query_embedding = prepare_query(await self._encode_batched([query]), index_config)
+            return await self._submit(self._search, indexes, query_embedding, k)
+
+        return await asyncio.wait_for(_search(), timeout=timeout or self.timeout)
+
+    async def _encode_batched(self, texts: list[str]) -> np.ndarray:
+        if not texts:
+            return np.empty((0, self.dimension), dtype='float32')
+        # Large inputs are fed batch by batch, so one big document can't flood the pool
+        parts = []
+        for start in range(0, len(texts), self.max_batch_size):
+            parts.append(await self._enqueue(texts[start:start + self.max_batch_size]))
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+    def _enqueue(self, texts: list[str]) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._batch.append((texts, future))
+        self._batch_texts += len(texts)
+        if self._batch_texts >= self.max_batch_size:
+            self._flush_batch()
+        elif self._batch_flush is None:
+            self._batch_flush = loop.call_later(self.max_batch_wait, self._flush_batch)
+        return future
+
+    def _flush_batch(self) -> None:
+        if self._batch_flush is not None:
+            self._batch_flush.cancel()
+            self._batch_flush = None
+        batch, self._batch, self._batch_texts = self._batch, [], 0
+        if batch:
+            task = asyncio.create_task(self._run_batch(batch))
+            self._batch_tasks.add(task)
+            task.add_done_callback(self._batch_tasks.discard)
+
+    async def _run_batch(self, batch: list[tuple[list[str], asyncio.Future]]) -> None:
+        texts = [text for batch_texts, _ in batch for text in batch_texts]
+        try:
+            embeddings = await self._submit(self._encode, texts)
+        except asyncio.CancelledError:
+            for _, future in batch:
+                future.cancel()
+            raise
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        offset = 0
+        for batch_texts, future in batch:
+            if not future.done():
+                future.set_result(embeddings[offset:offset + len(batch_texts)])
+            offset += len(batch_texts)
+
+    def _encode(self, texts: list[str]) -> np.ndarray:
+        return self.model.encode(texts, batch_size=self.max_batch_size, convert_to_numpy=True).astype('float32')
+
+    @staticmethod
+    def _search(
+            indexes: list['faiss.Index'],
+            query_embedding: np.ndarray,
+            k: int,
+    ) -> list[tuple[np.ndarray, np.ndarray]]:
+        return [index.search(query_embedding, k) for index in indexes]
+
+    async def _submit(self, fn: Callable[..., Any], *args: Any) -> Any:
+        if self._pending >= self._max_pending:
+            raise EmbeddingExecutorBusyError(
+                f"Embedding executor is busy ({self._pending} pending requests), try again later"
+            )
+        self._pending += 1
+        try:
+            async with self._semaphore:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self._executor, fn, *args)
+        finally:
+            self._pending -= 1
+
+    def shutdown(self) -> None:
+        """Stop the worker pool, cancelling queued work and batches that wait for it."""
+        if self._batch_flush is not None:
+            self._batch_flush.cancel()
+            self._batch_flush = None
+        for _, future in self._batch:
+            future.cancel()
+        self._batch, self._batch_texts = [], 0
+        for task in self._batch_tasks:
+            task.cancel()
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,154 @@
+import math
+from dataclasses import asdict, dataclass
+from typing import TYPE_CHECKING, Any, Literal
+
+import numpy as np
+
+if TYPE_CHECKING:
+    import faiss
+
+IndexBackend = Literal["auto", "flat", "hnsw", "ivfpq"]
+IndexMetric = Literal["cosine", "l2"]
+
+# Faiss recommends at least ~39 training points per IVF centroid
+_MIN_POINTS_PER_CENTROID = 39
+
+
+@dataclass(frozen=True)
+class IndexConfig:
+    """
+    ANN index settings. With the `auto` backend the index type is chosen by corpus size:
+    exact flat search up to `flat_max_size` vectors, HNSW up to `hnsw_max_size`, IVF-PQ above.
+    The `cosine` metric uses an inner-product index over L2-normalized embeddings.
+    """
+
+    backend: IndexBackend = "auto"
+    metric: IndexMetric = "cosine"
+    flat_max_size: int = 20_000
+    hnsw_max_size: int = 500_000
+    hnsw_m: int = 32
+    hnsw_ef_construction: int = 80
+    hnsw_ef_search: int = 64
+    ivf_nlist: int = 0
+    ivf_nprobe: int = 16
+    pq_m: int = 48
+    pq_nbits: int = 8
+
+    @property
+    def higher_is_better(self) -> bool:
+        """Whether larger search scores mean closer matches (similarity rather than distance)."""
+        return self.metric == "cosine"
+
+    def as_dict(self) -> dict[str, Any]:
+        return asdict(self)
+
+
+class IndexBuilder:
+    """
+    Builds an index incrementally from batches of embeddings.
+    Vectors go into a flat index while the corpus is small and are moved to HNSW once it
+    outgrows `flat_max_size`. IVF-PQ needs training data, so its vectors are staged in a flat
+    index and it is only trained in `build`, when the final corpus size is known.
+    """
+
+    def __init__(self, dimension: int, config: IndexConfig):
+        import faiss
+        self.dimension = dimension
+        self.config = config
+        self._metric = faiss.METRIC_INNER_PRODUCT if config.metric == "cosine" else faiss.METRIC_L2
+        self._backend: IndexBackend | None = None
+        self._index: 'faiss.Index | None' = None
+
+    @property
+    def ntotal(self) -> int:
+        return self._index.ntotal if self._index is not None else 0
+
+    def add(self, embeddings: np.ndarray) -> None:
+        """Add a batch of document embeddings."""
+        embeddings = _prepare(embeddings, self.config)
+        backend = _resolve_backend(self.ntotal + len(embeddings), self.dimension, self.config)
+        if backend == "ivfpq":
+            backend = "flat"
+        if backend != self._backend:
+            self._migrate(backend)
+        self._index.add(embeddings)
+
+    def build(self) -> 'faiss.Index':
+        """Finish the index, training IVF-PQ if the final corpus size calls for it."""
+        backend = _resolve_backend(self.ntotal, self.dimension, self.config)
+        if self._index is None or backend != self._backend:
+            self._migrate(backend)
+        return self._index
+
+    def _migrate(self, backend: IndexBackend) -> None:
+        vectors = self._index.reconstruct_n(0, self.ntotal) if self.ntotal else None
+        index = self._create(backend, vectors)
+        if vectors is not None:
+            index.add(vectors)
+        self._index = index
+        self._backend = backend
+
+    def _create(self, backend: IndexBackend, training_vectors: np.ndarray | None) -> 'faiss.Index':
+        import faiss
+        if backend == "hnsw":
+            index = faiss.IndexHNSWFlat(self.dimension, self.config.hnsw_m, self._metric)
+            index.hnsw.efConstruction = self.config.hnsw_ef_construction
+            index.hnsw.efSearch = self.config.hnsw_ef_search
+            return index
+        if backend == "ivfpq":
+            size = len(training_vectors)
+            nlist = self.config.ivf_nlist or int(4 * math.sqrt(size))
+            nlist = max(1, min(nlist, size // _MIN_POINTS_PER_CENTROID))
+            quantizer = faiss.IndexFlat(self.dimension, self._metric)
+            index = faiss.IndexIVFPQ(
+                quantizer, self.dimension, nlist, self.config.pq_m, self.config.pq_nbits, self._metric
+            )
+            index.train(training_vectors)
+            index.nprobe = min(self.config.ivf_nprobe, nlist)
+            return index
+        return faiss.IndexFlat(self.dimension, self._metric)
+
+
+def create_index(embeddings: np.ndarray, config: IndexConfig) -> 'faiss.Index':
+    """
+    Build an index over document embeddings.
+
+    Args:
+        embeddings: float32 array of shape (n, dimension)
+        config: Index settings
+
+    Returns:
+        Trained FAISS index containing all embeddings
+    """
+    builder = IndexBuilder(embeddings.shape[1], config)
+    builder.add(embeddings)
+    return builder.build()
+
+
+def prepare_query(query_embeddings: np.ndarray, config: IndexConfig) -> np.ndarray:
+    """Bring query embeddings into the same space as the indexed documents."""
+    return _prepare(query_embeddings, config)
+
+
+def _prepare(embeddings: np.ndarray, config: IndexConfig) -> np.ndarray:
+    embeddings = np.ascontiguousarray(embeddings, dtype='float32')
+    if config.metric == "cosine":
+        import faiss
+        embeddings = embeddings.copy()
+        faiss.normalize_L2(embeddings)
+    return embeddings
+
+
+def _resolve_backend(size: int, dimension: int, config: IndexConfig) -> IndexBackend:
+    backend = config.backend
+    if backend == "auto":
+        if size <= config.flat_max_size:
+            backend = "flat"
+        elif size <= config.hnsw_max_size:
+            backend = "hnsw"
+        else:
+            backend = "ivfpq"
+    # PQ needs enough training points for its codebooks and a dimension split into equal sub-vectors
+    if backend == "ivfpq" and (size < (1 << config.pq_nbits) or dimension % config.pq_m != 0):
+        backend = "hnsw"
+    return backend
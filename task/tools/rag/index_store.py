@@ -0,0 +1,209 @@
+import fcntl
+import json
+import mmap
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Iterator, Sequence, Tuple
+
+import numpy as np
+
+from task.utils.log import get_logger
+
+logger = get_logger(__name__)
+
+_MANIFEST_FILE = "manifest.json"
+_LOCK_FILE = "manifest.lock"
+# File versions listed per entry; a URL keeps only its latest version
+_MAX_SOURCES_PER_ENTRY = 16
+
+
+class MappedChunks(Sequence[str]):
+    """
+    Read-only list of document chunks backed by memory-mapped files:
+    all chunk texts concatenated in UTF-8 and an int64 array of their offsets.
+    """
+
+    def __init__(self, text_path: Path, offsets_path: Path):
+        self._offsets = np.load(offsets_path, mmap_mode='r')
+        self._text: bytes | mmap.mmap = b""
+        if text_path.stat().st_size > 0:
+            with open(text_path, 'rb') as f:
+                self._text = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, idx: int) -> str:
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError("chunk index out of range")
+        return self._text[self._offsets[idx]:self._offsets[idx + 1]].decode('utf-8')
+
+
+class PersistentIndexStore:
+    """
+    On-disk tier for RAG indexes shared by all workers of the app.
+    FAISS indexes are written with `faiss.write_index` and loaded memory-mapped (the inverted
+    lists of IVF indexes, the flat codes of the others), chunks are stored as one text blob plus offsets. A JSON manifest keyed by content hash records the
+    model version and size of every entry; it is updated under a file lock and every file is
+    written atomically through a temporary file and `os.replace`. When the store grows over
+    `max_bytes`, least recently used entries are removed. An entry also lists the file versions
+    (URL and ETag) it was built from, so they are found after a restart without a download.
+    """
+
+    def __init__(self, root_dir: str | Path, model_version: str, max_bytes: int = 4 * 1024 * 1024 * 1024):
+        self.root_dir = Path(root_dir)
+        self.model_version = model_version
+        self.max_bytes = max_bytes
+        self.root_dir.mkdir(parents=True, exist_ok=True)
+
+    def get(self, key: str) -> Tuple[Any, MappedChunks, int] | None:
+        """
+        Load an entry from disk.
+
+        Args:
+            key: Content hash key
+
+        Returns:
+            Tuple of (index, chunks, size in bytes) if stored for the current model version, None otherwise
+        """
+        with self._locked(shared=True):
+            entry = self._read_manifest().get(key)
+        if not entry or entry.get("model_version") != self.model_version:
+            return None
+        index_path, text_path, offsets_path = self._paths(key)
+        try:
+            import faiss
+            # Faiss can't combine both mmap modes: IVF indexes fail to load with IO_FLAG_MMAP_IFC set
+            mmap_flag = faiss.IO_FLAG_MMAP if entry.get("ivf") else faiss.IO_FLAG_MMAP_IFC
+            index = faiss.read_index(str(index_path), mmap_flag | faiss.IO_FLAG_READ_ONLY)
+            chunks = MappedChunks(text_path, offsets_path)
+        except (OSError, RuntimeError) as e:
+            logger.warning("Unable to load index store entry %s: %s", key, e)
+            return None
+        # The index file mtime tracks last access for eviction
+        os.utime(index_path)
+        return index, chunks, entry["size"]
+
+    def put(self, key: str, index: Any, chunks: Sequence[str]) -> None:
+        """
+        Persist an entry and evict least recently used entries over the size cap.
+
+        Args:
+            key: Content hash key
+            index: FAISS index
+            chunks: Document chunks
+        """
+        index_path, text_path, offsets_path = self._paths(key)
+        encoded_chunks = [chunk.encode('utf-8') for chunk in chunks]
+        offsets = np.zeros(len(encoded_chunks) + 1, dtype=np.int64)
+        np.cumsum([len(chunk) for chunk in encoded_chunks], out=offsets[1:])
+
+        self._atomic_write(text_path, lambda path: path.write_bytes(b"".join(encoded_chunks)))
+        self._atomic_write(offsets_path, lambda path: self._save_array(path, offsets))
+        import faiss
+        self._atomic_write(index_path, lambda path: faiss.write_index(index, str(path)))
+
+        size = sum(path.stat().st_size for path in (index_path, text_path, offsets_path))
+        with self._locked(shared=False):
+            manifest = self._read_manifest()
+            manifest[key] = {
+                "model_version": self.model_version,
+                "size": size,
+                "ivf": faiss.try_extract_index_ivf(index) is not None,
+                "created_at": time.time(),
+            }
+            self._evict(manifest, keep=key)
+            self._atomic_write(self.root_dir / _MANIFEST_FILE, lambda path: path.write_text(json.dumps(manifest)))
+
+    def find_content_hash(self, file_url: str, etag: str) -> str | None:
+        """Return the content hash of a file version some stored entry was built from."""
+        with self._locked(shared=True):
+            manifest = self._read_manifest()
+        for entry in manifest.values():
+            if [file_url, etag] in entry.get("sources", []):
+                return entry["content_hash"]
+        return None
+
+    def add_source(self, key: str, file_url: str, etag: str, content_hash: str) -> None:
+        """
+        Record a file version the entry was built from; the oldest versions beyond a limit are dropped.
+
+        Args:
+            key: Content hash key of the entry
+            file_url: File URL
+            etag: ETag of the file version
+            content_hash: Content hash of the file version
+        """
+        with self._locked(shared=False):
+            manifest = self._read_manifest()
+            if (entry := manifest.get(key)) is None:
+                return
+            sources = [source for source in entry.get("sources", []) if source[0] != file_url]
+            entry["sources"] = [*sources, [file_url, etag]][-_MAX_SOURCES_PER_ENTRY:]
+            entry["content_hash"] = content_hash
+            self._atomic_write(self.root_dir / _MANIFEST_FILE, lambda path: path.write_text(json.dumps(manifest)))
+
+    def _evict(self, manifest: dict[str, dict[str, Any]], keep: str) -> None:
+        total_bytes = sum(entry["size"] for entry in manifest.values())
+        if total_bytes <= self.max_bytes:
+            return
+        candidates = sorted((key for key in manifest if key != keep), key=self._last_access)
+        for key in candidates:
+            if total_bytes <= self.max_bytes:
+                break
+            total_bytes -= manifest.pop(key)["size"]
+            # Workers that still have the files mapped keep reading them until they drop the entry
+            for path in self._paths(key):
+                path.unlink(missing_ok=True)
+            logger.info("Evicted index store entry %s", key)
+
+    def _last_access(self, key: str) -> float:
+        try:
+            return self._paths(key)[0].stat().st_mtime
+        except OSError:
+            return 0.0
+
+    def _paths(self, key: str) -> Tuple[Path, Path, Path]:
+        return (
+            self.root_dir / f"{key}.index",
+            self.root_dir / f"{key}.chunks",
+            self.root_dir / f"{key}.offsets.npy",
+        )
+
+    def _read_manifest(self) -> dict[str, dict[str, Any]]:
+        try:
+            with open(self.root_dir / _MANIFEST_FILE, 'rb') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _atomic_write(self, path: Path, write: Callable[[Path], Any]) -> None:
+        fd, tmp_name = tempfile.mkstemp(dir=self.root_dir, prefix=f".{path.name}.", suffix=".tmp")
+        os.close(fd)
+        tmp_path = Path(tmp_name)
+        try:
+            write(tmp_path)
+            os.replace(tmp_path, path)
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+
+    @staticmethod
+    def _save_array(path: Path, array: np.ndarray) -> None:
+        # Saving through a file object keeps numpy from appending its own `.npy` suffix
+        with open(path, 'wb') as f:
+            np.save(f, array)
+
+    @contextmanager
+    def _locked(self, shared: bool) -> Iterator[None]:
+        with open(self.root_dir / _LOCK_FILE, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
@@ -1,39 +1,63 @@
+import asyncio
 import json
-from typing import Any
+from typing import Any, AsyncIterator, Callable, Sequence
 
-import faiss
-import numpy as np
-from aidial_client import AsyncDial
 from aidial_sdk.chat_completion import Message, Role
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from sentence_transformers import SentenceTransformer
 
 from task.tools.base import BaseTool
 from task.tools.models import ToolCallParams
 from task.tools.rag.document_cache import DocumentCache
+from task.tools.rag.embedding_executor import EmbeddingExecutor
+from task.tools.rag.index_factory import IndexConfig
+from task.utils.dial_client_factory import DEFAULT_API_VERSION, DialClientFactory
 from task.utils.dial_file_conent_extractor import DialFileContentExtractor
+from task.utils.extracted_text_cache import ExtractedText, ExtractedTextCache
+from task.utils.pdf_extractor import PdfPageExtractor
 
 _SYSTEM_PROMPT = """
-You are a helpful assistant that answers questions based on provided document content. Use only the information from the document to answer the user's question. If the answer is not present in the document, say so clearly.
+You are a helpful assistant that answers questions based on provided document content. Use only the information from the documents to answer the user's question. Each context fragment is preceded by its source; when the context comes from several documents, mention which document the information comes from. If the answer is not present in the documents, say so clearly.
 """
 
+_SPLITTER_CONFIG = {
+    "chunk_size": 500,
+    "chunk_overlap": 50,
+    "separators": ["\n\n", "\n", ". ", " ", ""],
+}
+
+# Extracted text is split once this much of it is buffered
+_SPLIT_BUFFER_SIZE = 20_000
+# Chunks are embedded and added to the index in batches of this size
+_EMBED_BATCH_SIZE = 256
+
+
 class RagTool(BaseTool):
     """
     Performs semantic search on documents to find and answer questions based on relevant content.
     Supports: PDF, TXT, CSV, HTML.
     """
 
-    def __init__(self, endpoint: str, deployment_name: str, document_cache: DocumentCache):
+    def __init__(
+            self,
+            endpoint: str,
+            deployment_name: str,
+            document_cache: DocumentCache,
+            embedding_executor: EmbeddingExecutor,
+            index_config: IndexConfig = IndexConfig(),
+            top_k: int = 3,
+            text_cache: ExtractedTextCache | None = None,
+            pdf_extractor: PdfPageExtractor | None = None,
+    ):
         self.endpoint = endpoint
         self.deployment_name = deployment_name
         self.document_cache = document_cache
-        self.model = SentenceTransformer('all-MiniLM-L6-v2', device='cpu')
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=500,
-            chunk_overlap=50,
-            length_function=len,
-            separators=["\n\n", "\n", ". ", " ", ""]
-        )
+        self.embedding_executor = embedding_executor
+        self.index_config = index_config
+        self.top_k = top_k
+        self.text_cache = text_cache
+        self.pdf_extractor = pdf_extractor
+        from langchain_text_splitters import RecursiveCharacterTextSplitter
+        self.text_splitter = RecursiveCharacterTextSplitter(length_function=len, **_SPLITTER_CONFIG)
+        self._indexing: dict[str, asyncio.Task] = {}
 
     @property
     def show_in_stage(self) -> bool:
@@ -47,7 +71,8 @@ class RagTool(BaseTool):
     def description(self) -> str:
         return (
             "Performs semantic search and question answering on documents (PDF, TXT, CSV, HTML). "
-            "Finds relevant content and answers user questions based on the document. "
+            "Finds relevant content and answers user questions based on the documents. "
+            "Searches several files at once, so pass all relevant files in a single call. "
             "Uses embeddings and chunking for efficient retrieval."
         )
 
@@ -60,50 +85,52 @@ class RagTool(BaseTool):
                     "type": "string",
                     "description": "The search query or question to search for in the document."
                 },
-                "file_url": {
-                    "type": "string",
-                    "description": "URL of the file to search in."
+                "file_urls": {
+                    "type": "array",
+                    "items": {"type": "string"},
+                    "description": "URLs of the files to search in. Pass all relevant files in one call."
                 }
             },
-            "required": ["request", "file_url"]
+            "required": ["request", "file_urls"]
         }
 
     async def _execute(self, tool_call_params: ToolCallParams) -> str | Message:
         arguments = json.loads(tool_call_params.tool_call.function.arguments)
         request = arguments.get("request")
-        file_url = arguments.get("file_url")
+        file_urls = list(arguments.get("file_urls") or [])
+        if file_url := arguments.get("file_url"):
+            file_urls.append(file_url)
+        file_urls = list(dict.fromkeys(file_urls))
         stage = tool_call_params.stage
 
         stage.append_content("## Request arguments: \n")
         stage.append_content(f"**Request**: {request}\n\r")
-        stage.append_content(f"**File URL**: {file_url}\n\r")
-
-        cache_document_key = f"{tool_call_params.conversation_id}:{file_url}"
-        cached_data = self.document_cache.get(cache_document_key)
-        if cached_data:
-            index, chunks = cached_data
-        else:
-            extractor = DialFileContentExtractor(self.endpoint, tool_call_params.api_key)
-            text_content = extractor.extract_text(file_url)
-            if not text_content:
-                stage.append_content("File content not found or could not be extracted.")
-                return "Error: File content not found."
-            chunks = self.text_splitter.split_text(text_content)
-            embeddings = self.model.encode(chunks, convert_to_numpy=True)
-            index = faiss.IndexFlatL2(384)
-            index.add(np.array(embeddings, dtype='float32'))
-            self.document_cache.set(cache_document_key, index, chunks)
-
-        query_embedding = self.model.encode([request], convert_to_numpy=True).astype('float32')
-        distances, indices = index.search(query_embedding, k=3)
-        retrieved_chunks = [chunks[idx] for idx in indices[0] if idx < len(chunks)]
+        for file_url in file_urls:
+            stage.append_content(f"**File URL**: {file_url}\n\r")
+
+        loaded = await asyncio.gather(
+            *(self.__load_document(file_url, tool_call_params.api_key) for file_url in file_urls),
+            return_exceptions=True
+        )
+        documents: list[tuple[str, Any, Sequence[str]]] = []
+        for file_url, document in zip(file_urls, loaded):
+            if isinstance(document, Exception):
+                stage.append_content(f"Unable to process {file_url}: {document}\n\r")
+            elif document is None:
+                stage.append_content(f"Content of {file_url} not found or could not be extracted.\n\r")
+            else:
+                documents.append((file_url, *document))
+        if not documents:
+            return "Error: File content not found."
+
+        retrieved_chunks = await self.__search(request, documents)
 
         augmented_prompt = self.__augmentation(request, retrieved_chunks)
         stage.append_content("## RAG Request: \n")
         stage.append_content(f"```text\n\r{augmented_prompt}\n\r```\n\r")
         stage.append_content("## Response: \n")
 
-        client = AsyncDial(base_url=self.endpoint, api_version="2025-01-01-preview", api_key=tool_call_params.api_key)
+        client = DialClientFactory.get_instance().create_async_client(self.endpoint, tool_call_params.api_key)
         messages = [
             {"role": "system", "content": _SYSTEM_PROMPT},
             {"role": "user", "content": augmented_prompt}
@@ -111,7 +138,8 @@ class RagTool(BaseTool):
         stream = await client.chat.completions.create(
             messages=messages,
             deployment_name=self.deployment_name,
-            stream=True
+            stream=True,
+            api_version=DEFAULT_API_VERSION
         )
         content = ""
         async for chunk in stream:
@@ -121,8 +149,144 @@ class RagTool(BaseTool):
                 content += delta.content
         return content
 
-    def __augmentation(self, request: str, chunks: list[str]) -> str:
-        context = "\n\n".join(chunks)
+    async def __load_document(self, file_url: str, api_key: str) -> tuple[Any, Sequence[str]] | None:
+        extractor = DialFileContentExtractor(self.endpoint, api_key, self.text_cache, self.pdf_extractor)
+        # The ETag of the file version leads to a known index or text without downloading the file
+        etag = await extractor.get_etag(file_url)
+        if etag:
+            content_hash = await asyncio.to_thread(self.document_cache.find_content_hash, file_url, etag)
+            if content_hash:
+                if cached := await asyncio.to_thread(self.document_cache.get, self.__cache_key(content_hash)):
+                    return cached
+            if self.text_cache is not None and (cached_text := self.text_cache.get(file_url, etag)):
+                document = await self.__get_or_build_index(
+                    self.__cache_key(cached_text.content_hash), self.__iter_pages(cached_text)
+                )
+                await self.__add_source(file_url, etag, cached_text.content_hash, document)
+                return document
+
+        file = await extractor.download(file_url)
+        content_hash, etag = file.content_hash, file.etag or etag
+        document = await self.__get_or_build_index(
+            self.__cache_key(content_hash), extractor.iter_file_text(file), file.close
+        )
+        if etag:
+            await self.__add_source(file_url, etag, content_hash, document)
+        return document
+
+    async def __add_source(
+            self,
+            file_url: str,
+            etag: str,
+            content_hash: str,
+            document: tuple[Any, Sequence[str]] | None,
+    ) -> None:
+        if document is not None:
+            await asyncio.to_thread(
+                self.document_cache.add_source, self.__cache_key(content_hash), file_url, etag, content_hash
+            )
+
+    def __cache_key(self, content_hash: str) -> str:
+        return DocumentCache.make_key(
+            content_hash,
+            self.embedding_executor.model_name,
+            {"splitter": _SPLITTER_CONFIG, "index": self.index_config.as_dict()}
+        )
+
+    @staticmethod
+    async def __iter_pages(extracted: ExtractedText) -> AsyncIterator[str]:
+        for page in range(1, extracted.total_pages + 1):
+            yield extracted.page(page)
+
+    async def __search(
+            self,
+            request: str,
+            documents: list[tuple[str, Any, Sequence[str]]],
+    ) -> list[tuple[str, str]]:
+        """Search all documents with one query embedding and merge the hits into a single top-k."""
+        results = await self.embedding_executor.search(
+            [index for _, index, _ in documents], request, self.top_k, self.index_config
+        )
+        hits = []
+        for (file_url, _, chunks), (scores, indices) in zip(documents, results):
+            for score, idx in zip(scores[0], indices[0]):
+                if 0 <= idx < len(chunks):
+                    hits.append((float(score), file_url, chunks[idx]))
+        hits.sort(key=lambda hit: hit[0], reverse=self.index_config.higher_is_better)
+        return [(file_url, chunk) for _, file_url, chunk in hits[:self.top_k]]
+
+    async def __get_or_build_index(
+            self,
+            key: str,
+            pieces: AsyncIterator[str],
+            close: Callable[[], None] | None = None,
+    ) -> tuple[Any, Sequence[str]] | None:
+        task = None
+        try:
+            cached_data = await asyncio.to_thread(self.document_cache.get, key)
+            if cached_data:
+                return cached_data
+            # Concurrent requests for the same document share one indexing task
+            task = self._indexing.get(key)
+            if task is None:
+                task = asyncio.create_task(self.__build_index(key, pieces, close))
+                self._indexing[key] = task
+                task.add_done_callback(lambda _: self._indexing.pop(key, None))
+                close = None
+        finally:
+            # The indexing task owns the source it reads from
+            if close is not None:
+                close()
+        return await asyncio.shield(task)
+
+    async def __build_index(
+            self,
+            key: str,
+            pieces: AsyncIterator[str],
+            close: Callable[[], None] | None,
+    ) -> tuple[Any, list[str]] | None:
+        """
+        Index the document as its text streams in: extracted pieces are split into chunks,
+        and chunks are embedded and appended to the index in fixed-size batches, so neither
+        the full text nor all embeddings are held in memory at once.
+        """
+        builder = self.embedding_executor.create_index_builder(self.index_config)
+        chunks: list[str] = []
+        pending: list[str] = []
+        buffer = ""
+        try:
+            async for piece in pieces:
+                buffer += piece
+                if len(buffer) < _SPLIT_BUFFER_SIZE:
+                    continue
+                new_chunks = await asyncio.to_thread(self.text_splitter.split_text, buffer)
+                # The last chunk may be cut mid-sentence, so it is split again together with the next text.
+                # The raw tail is kept: the chunk itself is stripped, and the next text may start with a space
+                tail_start = buffer.rfind(new_chunks.pop()) if new_chunks else -1
+                buffer = buffer[tail_start:] if tail_start >= 0 else ""
+                pending.extend(new_chunks)
+                while len(pending) >= _EMBED_BATCH_SIZE:
+                    batch, pending = pending[:_EMBED_BATCH_SIZE], pending[_EMBED_BATCH_SIZE:]
+                    await self.embedding_executor.add_to_index(builder, batch)
+                    chunks.extend(batch)
+        finally:
+            if close is not None:
+                close()
+
+        if buffer:
+            pending.extend(await asyncio.to_thread(self.text_splitter.split_text, buffer))
+        if pending:
+            await self.embedding_executor.add_to_index(builder, pending)
+            chunks.extend(pending)
+        if not chunks:
+            return None
+
+        index = await self.embedding_executor.finish_index(builder)
+        await asyncio.to_thread(self.document_cache.set, key, index, chunks)
+        return index, chunks
+
+    def __augmentation(self, request: str, chunks: list[tuple[str, str]]) -> str:
+        context = "\n\n".join(f"[Source: {file_url}]\n{chunk}" for file_url, chunk in chunks)
         return (
             f"Context:\n{context}\n\n"
             f"Question: {request}\n"
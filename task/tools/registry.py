@@ -0,0 +1,158 @@
+import asyncio
+import hashlib
+import json
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Callable, Mapping, Optional
+
+from aidial_client.types.chat import ToolParam
+
+from task.tools.base import BaseTool
+from task.tools.mcp.mcp_client_pool import MCPClientPool
+from task.tools.mcp.mcp_tool import MCPTool
+from task.tools.mcp.mcp_tool_model import MCPToolModel
+from task.utils.log import get_logger
+
+logger = get_logger(__name__)
+
+
+@dataclass(frozen=True)
+class ToolCatalog:
+    """Immutable snapshot of the available tools with their prebuilt schemas."""
+
+    version: int
+    tools: tuple[BaseTool, ...]
+    schemas: tuple[ToolParam, ...]
+    by_name: Mapping[str, BaseTool] = field(repr=False)
+
+    @classmethod
+    def build(cls, version: int, tools: list[BaseTool]) -> 'ToolCatalog':
+        by_name: dict[str, BaseTool] = {}
+        for tool in tools:
+            if tool.name in by_name:
+                logger.warning("Tool %s is registered more than once, the last one is used", tool.name)
+            by_name[tool.name] = tool
+        unique_tools = tuple(by_name.values())
+        return cls(
+            version=version,
+            tools=unique_tools,
+            schemas=tuple(tool.schema for tool in unique_tools),
+            by_name=MappingProxyType(by_name)
+        )
+
+
+@dataclass
+class _MCPServer:
+    client: MCPClientPool
+    tools: list[MCPTool] = field(default_factory=list)
+    fingerprint: str = ""
+    refresh: Optional[asyncio.Task] = None
+    refresh_pending: bool = False
+
+
+class ToolRegistry:
+    """
+    Keeps the catalog of tools offered to the model.
+
+    Schemas are built once per catalog version instead of on every round. Tools of MCP servers
+    are refreshed in the background when a server sends `tools/list_changed` (or reconnects),
+    and additionally every `poll_interval` seconds if it is set. A refresh publishes a new
+    catalog only if the fingerprint of the tool definitions changed. Requests keep the catalog
+    they started with, so a refresh never changes the tools in the middle of a request.
+    """
+
+    def __init__(self, poll_interval: Optional[float] = None):
+        self.poll_interval = poll_interval
+        self._static_tools: list[BaseTool] = []
+        self._servers: list[_MCPServer] = []
+        self._catalog = ToolCatalog.build(0, [])
+        self._poll: Optional[asyncio.Task] = None
+        self._catalog_listeners: list[Callable[[ToolCatalog], None]] = []
+
+    @property
+    def catalog(self) -> ToolCatalog:
+        return self._catalog
+
+    async def register(self, tools: list[BaseTool], clients: list[MCPClientPool]) -> None:
+        """
+        Add tools and MCP servers in one step: the tools of every server are loaded first,
+        and nothing is registered if any of them fails.
+
+        Args:
+            tools: Tools with fixed definitions
+            clients: Connected MCP servers; they stay owned by the caller, who closes them
+        """
+        servers = [_MCPServer(client) for client in clients]
+        await asyncio.gather(*(self.__refresh(server, publish=False) for server in servers))
+        self._static_tools.extend(tools)
+        self._servers.extend(servers)
+        self.__publish()
+        for server in servers:
+            server.client.add_tools_changed_listener(lambda server=server: self.__schedule_refresh(server))
+        if servers and self.poll_interval and self._poll is None:
+            self._poll = asyncio.create_task(self.__run_polling())
+
+    def add_catalog_listener(self, listener: Callable[[ToolCatalog], None]) -> None:
+        """Register a callback for every published catalog; it must not block."""
+        self._catalog_listeners.append(listener)
+
+    async def close(self) -> None:
+        if self._poll is not None:
+            self._poll.cancel()
+            self._poll = None
+        for server in self._servers:
+            if server.refresh is not None:
+                server.refresh.cancel()
+
+    def __schedule_refresh(self, server: _MCPServer) -> None:
+        if server.refresh is not None and not server.refresh.done():
+            # Notifications that arrive during a refresh are coalesced into one more refresh
+            server.refresh_pending = True
+            return
+        server.refresh = asyncio.create_task(self.__refresh_in_background(server))
+
+    async def __refresh_in_background(self, server: _MCPServer) -> None:
+        while True:
+            server.refresh_pending = False
+            try:
+                await self.__refresh(server)
+            except Exception:
+                logger.exception("Unable to refresh tools of MCP server %s", server.client.server_url)
+            if not server.refresh_pending:
+                return
+
+    async def __refresh(self, server: _MCPServer, publish: bool = True) -> None:
+        tool_models = await server.client.get_tools()
+        fingerprint = _fingerprint(tool_models)
+        if fingerprint == server.fingerprint:
+            return
+        # Unchanged tools keep their instances, so in-flight calls are not affected
+        current = {tool.mcp_tool_model.model_dump_json(): tool for tool in server.tools}
+        server.tools = [
+            current.get(model.model_dump_json()) or MCPTool(server.client, model) for model in tool_models
+        ]
+        server.fingerprint = fingerprint
+        if publish:
+            self.__publish()
+        logger.info("Loaded tools of MCP server %s", server.client.server_url, extra={"tools": len(tool_models)})
+
+    async def __run_polling(self) -> None:
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            for server in self._servers:
+                self.__schedule_refresh(server)
+
+    def __publish(self) -> None:
+        tools = [*self._static_tools, *(tool for server in self._servers for tool in server.tools)]
+        self._catalog = ToolCatalog.build(self._catalog.version + 1, tools)
+        logger.info(
+            "Published tool catalog",
+            extra={"catalog_version": self._catalog.version, "tools": len(self._catalog.tools)}
+        )
+        for listener in self._catalog_listeners:
+            listener(self._catalog)
+
+
+def _fingerprint(tool_models: list[MCPToolModel]) -> str:
+    payload = json.dumps([model.model_dump() for model in tool_models], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
@@ -0,0 +1,174 @@
+import asyncio
+import json
+import time
+from typing import Any, Iterable, Optional
+
+import numpy as np
+from aidial_client.types.chat import ToolParam
+
+from task.tools.base import BaseTool
+from task.tools.rag.embedding_executor import EmbeddingExecutor
+from task.tools.registry import ToolCatalog
+from task.utils.log import get_logger
+
+logger = get_logger(__name__)
+
+# Rough average for JSON schemas with GPT-style tokenizers
+_CHARS_PER_TOKEN = 4
+
+
+class ToolRouter:
+    """
+    Picks the tools offered to the model for a request.
+
+    The last user message is compared with embeddings of the tool names and descriptions,
+    and the `top_k` most similar tools are offered together with the `always_include` tools
+    and the tools already called in the conversation. Catalogs with no more tools than that
+    are passed through unchanged. Tool embeddings are computed once per tool definition, in the
+    background when a catalog is published. A request waits for them at most `timeout` seconds,
+    together with its query embedding; if they are not ready, all tools are offered.
+    """
+
+    def __init__(
+            self,
+            embedding_executor: EmbeddingExecutor,
+            top_k: int = 8,
+            always_include: Iterable[str] = (),
+            timeout: float = 2.0,
+    ):
+        self.embedding_executor = embedding_executor
+        self.top_k = top_k
+        self.always_include = frozenset(always_include)
+        self.timeout = timeout
+        self._embeddings: dict[str, np.ndarray] = {}
+        self._preparation: Optional[tuple[int, asyncio.Task]] = None
+
+    async def prepare(self, catalog: ToolCatalog) -> None:
+        """Compute the embeddings of tools that were not seen before."""
+        missing = [tool for tool in catalog.tools if _tool_text(tool) not in self._embeddings]
+        if not missing:
+            return
+        texts = [_tool_text(tool) for tool in missing]
+        embeddings = await self.embedding_executor.encode(texts)
+        for text, embedding in zip(texts, _normalize(embeddings)):
+            self._embeddings[text] = embedding
+        # Drop embeddings of tools that are gone from the catalog
+        current = {_tool_text(tool) for tool in catalog.tools}
+        for text in [text for text in self._embeddings if text not in current]:
+            del self._embeddings[text]
+
+    def prepare_in_background(self, catalog: ToolCatalog) -> asyncio.Task:
+        """
+        Start computing the embeddings of a catalog, unless it is being prepared already.
+        Preparations run one after another, so an older catalog never drops embeddings of a newer one.
+
+        Args:
+            catalog: Published catalog
+
+        Returns:
+            Task of the preparation
+        """
+        if self._preparation is not None:
+            version, task = self._preparation
+            if version == catalog.version and not (task.done() and (task.cancelled() or task.exception())):
+                return task
+        previous = self._preparation[1] if self._preparation is not None else None
+        task = asyncio.create_task(self.__prepare_after(previous, catalog))
+        task.add_done_callback(_log_failure)
+        self._preparation = (catalog.version, task)
+        return task
+
+    async def select(self, catalog: ToolCatalog, messages: list[dict[str, Any]]) -> list[ToolParam]:
+        """
+        Select the schemas of tools relevant to a request.
+
+        Args:
+            catalog: Tools available to the request
+            messages: Prepared messages of the request
+
+        Returns:
+            Schemas in catalog order
+        """
+        started_at = time.perf_counter()
+        used = _called_tools(messages)
+        required = [i for i, tool in enumerate(catalog.tools) if tool.name in self.always_include or tool.name in used]
+        if len(catalog.tools) <= len(required) + self.top_k:
+            return list(catalog.schemas)
+        query = _last_user_text(messages)
+        if not query:
+            return list(catalog.schemas)
+
+        try:
+            query_embedding = _normalize(await asyncio.wait_for(self.__embed(catalog, query), timeout=self.timeout))[0]
+            tool_embeddings = np.stack([self._embeddings[_tool_text(tool)] for tool in catalog.tools])
+        except Exception as e:
+            # Also when a newer catalog dropped the embedding of a tool this request still offers
+            logger.warning("Tool routing failed, all tools are offered: %r", e)
+            return list(catalog.schemas)
+
+        scores = tool_embeddings @ query_embedding
+        scores[required] = -np.inf
+        ranked = np.argsort(-scores)[:self.top_k].tolist()
+        selected = sorted(set(required) | set(ranked))
+        schemas = [catalog.schemas[i] for i in selected]
+
+        logger.info(
+            "Selected tools for request",
+            extra={
+                "tools_available": len(catalog.tools),
+                "tools_selected": len(schemas),
+                "schema_tokens_all": _schema_tokens(catalog.schemas),
+                "schema_tokens_selected": _schema_tokens(schemas),
+                "routing_ms": round((time.perf_counter() - started_at) * 1000, 1),
+            }
+        )
+        return schemas
+
+    async def __embed(self, catalog: ToolCatalog, query: str) -> np.ndarray:
+        # A timed-out request doesn't cancel the preparation, so later requests can use it
+        await asyncio.shield(self.prepare_in_background(catalog))
+        return await self.embedding_executor.encode([query])
+
+    async def __prepare_after(self, previous: Optional[asyncio.Task], catalog: ToolCatalog) -> None:
+        if previous is not None:
+            await asyncio.gather(previous, return_exceptions=True)
+        await self.prepare(catalog)
+
+
+def _log_failure(task: asyncio.Task) -> None:
+    if not task.cancelled() and (error := task.exception()) is not None:
+        logger.warning("Unable to embed the tool catalog: %r", error)
+
+
+def _tool_text(tool: BaseTool) -> str:
+    return f"{tool.name}: {tool.description}"
+
+
+def _normalize(embeddings: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings / np.maximum(norms, 1e-12)
+
+
+def _schema_tokens(schemas: Iterable[ToolParam]) -> int:
+    return sum(len(json.dumps(schema, ensure_ascii=False)) for schema in schemas) // _CHARS_PER_TOKEN
+
+
+def _called_tools(messages: list[dict[str, Any]]) -> set[str]:
+    return {
+        tool_call["function"]["name"]
+        for message in messages
+        for tool_call in message.get("tool_calls") or ()
+    }
+
+
+def _last_user_text(messages: list[dict[str, Any]]) -> str:
+    for message in reversed(messages):
+        if message.get("role") != "user":
+            continue
+        content = message.get("content")
+        if isinstance(content, str):
+            return content
+        if isinstance(content, list):
+            return " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+        return ""
+    return ""
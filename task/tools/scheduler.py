@@ -0,0 +1,167 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional
+
+from task.tools.base import BaseTool
+from task.utils.log import get_logger
+
+logger = get_logger(__name__)
+
+
+class ToolTimeoutError(Exception):
+    """Raised when a tool call does not finish before its deadline."""
+
+
+class ToolCancelledError(Exception):
+    """Reported when a tool call ends cancelled without the request cancelling it."""
+
+
+@dataclass(frozen=True)
+class ToolLimit:
+    """Concurrency limit shared by all calls of a tool class and the deadline of a single call."""
+
+    max_concurrency: int
+    timeout: float
+
+
+@dataclass
+class ToolCallResult:
+    """Outcome of a scheduled tool call with its timings in seconds."""
+
+    index: int
+    tool: BaseTool
+    result: Any = None
+    error: Optional[BaseException] = None
+    queue_wait: float = 0.0
+    execution_time: float = 0.0
+
+
+@dataclass
+class _ToolSlot:
+    limit: ToolLimit
+    semaphore: asyncio.Semaphore = field(init=False)
+
+    def __post_init__(self):
+        self.semaphore = asyncio.Semaphore(self.limit.max_concurrency)
+
+
+class ToolScheduler:
+    """
+    Runs the tool calls of a request concurrently within bounds.
+
+    Every tool class has a process-wide semaphore, so e.g. image generations from all
+    requests share one limit, and a call is cancelled once it runs longer than the
+    deadline of its class. The number of calls a single request runs at once is capped
+    by `max_concurrency_per_request`. Classes without a limit of their own use the limit
+    of their closest configured base class, or `default_limit`.
+    """
+
+    def __init__(
+            self,
+            limits: dict[type[BaseTool], ToolLimit],
+            default_limit: ToolLimit = ToolLimit(max_concurrency=16, timeout=300.0),
+            max_concurrency_per_request: int = 8,
+    ):
+        self.default_limit = default_limit
+        self.max_concurrency_per_request = max_concurrency_per_request
+        self._slots = {tool_class: _ToolSlot(limit) for tool_class, limit in limits.items()}
+        self._default_slot = _ToolSlot(default_limit)
+
+    def session(self) -> 'ToolSession':
+        """Start scheduling the tool calls of one request."""
+        return ToolSession(self)
+
+    async def _run_call(
+            self,
+            index: int,
+            tool: BaseTool,
+            call: Callable[[], Awaitable[Any]],
+            request_semaphore: asyncio.Semaphore,
+    ) -> ToolCallResult:
+        slot = self.__slot(tool)
+        result = ToolCallResult(index=index, tool=tool)
+        queued_at = time.perf_counter()
+        # The request slot is taken first, so a request never holds a shared tool slot while waiting on itself
+        async with request_semaphore, slot.semaphore:
+            started_at = time.perf_counter()
+            result.queue_wait = started_at - queued_at
+            try:
+                result.result = await asyncio.wait_for(call(), timeout=slot.limit.timeout)
+            except asyncio.TimeoutError:
+                result.error = ToolTimeoutError(f"{tool.name} did not finish within {slot.limit.timeout:g}s")
+            except Exception as e:
+                result.error = e
+            result.execution_time = time.perf_counter() - started_at
+        logger.info(
+            "Tool call %s finished",
+            tool.name,
+            extra={
+                "tool": tool.name,
+                "queue_wait_ms": round(result.queue_wait * 1000),
+                "execution_ms": round(result.execution_time * 1000),
+                "error": str(result.error) if result.error else None,
+            }
+        )
+        return result
+
+    def __slot(self, tool: BaseTool) -> _ToolSlot:
+        for tool_class in type(tool).__mro__:
+            if slot := self._slots.get(tool_class):
+                return slot
+        return self._default_slot
+
+
+class ToolSession:
+    """
+    Tool calls of one request. Calls start as soon as they are submitted, so a caller
+    can dispatch them while the model is still streaming the rest of its output.
+    """
+
+    def __init__(self, scheduler: ToolScheduler):
+        self._scheduler = scheduler
+        self._request_semaphore = asyncio.Semaphore(scheduler.max_concurrency_per_request)
+        self._tasks: list[asyncio.Task] = []
+        self._finished: asyncio.Queue[ToolCallResult] = asyncio.Queue()
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+    def submit(self, tool: BaseTool, call: Callable[[], Awaitable[Any]]) -> int:
+        """
+        Start a tool call.
+
+        Args:
+            tool: Tool being called
+            call: Coroutine function executing the call
+
+        Returns:
+            Index of the call in submission order
+        """
+        index = len(self._tasks)
+        task = asyncio.create_task(self._scheduler._run_call(index, tool, call, self._request_semaphore))
+        task.add_done_callback(lambda done: self.__on_done(index, tool, done))
+        self._tasks.append(task)
+        return index
+
+    async def results(self) -> AsyncIterator[ToolCallResult]:
+        """Yield results of all submitted calls in completion order; unfinished calls are cancelled on exit."""
+        try:
+            for _ in range(len(self._tasks)):
+                yield await self._finished.get()
+        finally:
+            self.cancel()
+
+    def cancel(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+
+    def __on_done(self, index: int, tool: BaseTool, task: asyncio.Task) -> None:
+        # Every call puts exactly one result on the queue, or `results` would wait for it forever
+        if task.cancelled():
+            result = ToolCallResult(index=index, tool=tool, error=ToolCancelledError(f"{tool.name} was cancelled"))
+        elif (error := task.exception()) is not None:
+            result = ToolCallResult(index=index, tool=tool, error=error)
+        else:
+            result = task.result()
+        self._finished.put_nowait(result)
@@ -0,0 +1,163 @@
+import hashlib
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+from task.utils.log import get_logger
+
+logger = get_logger(__name__)
+
+_REF_PREFIX = "sha256:"
+_REF_PATTERN = re.compile(r"sha256:[0-9a-f]{64}")
+# The directory is scanned again after writing this fraction of `max_bytes`, to count blobs of other workers
+_RESCAN_FRACTION = 16
+
+
+class BlobStore:
+    """
+    Content-addressed store of large text blobs on local disk, shared by all workers of the app.
+    Blobs are named by the SHA-256 of their content, so storing the same text twice is free,
+    and are written atomically through a temporary file and `os.replace`. When the store grows
+    over `max_bytes`, least recently read blobs are removed. Recently read blobs are kept in an
+    in-memory LRU cache bounded by `cache_max_bytes`.
+
+    The directory is created and indexed by the first write. After that, each worker tracks sizes
+    and access order in memory, so a write doesn't stat the whole store; the directory is scanned
+    again only after every `max_bytes / 16` written, to pick up blobs written by other workers.
+    """
+
+    def __init__(
+            self,
+            root_dir: str | Path,
+            max_bytes: int = 1024 * 1024 * 1024,
+            cache_max_bytes: int = 64 * 1024 * 1024,
+    ):
+        self.root_dir = Path(root_dir)
+        self.max_bytes = max_bytes
+        self.cache_max_bytes = cache_max_bytes
+        self._cache: OrderedDict[str, str] = OrderedDict()
+        self._cache_bytes = 0
+        # Blob file name -> size, least recently used first
+        self._index: OrderedDict[str, int] = OrderedDict()
+        self._total_bytes = 0
+        self._bytes_since_scan: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def put(self, content: str) -> str:
+        """
+        Store a blob.
+
+        Args:
+            content: Text to store
+
+        Returns:
+            Reference to pass to `get`
+        """
+        data = content.encode('utf-8')
+        ref = _REF_PREFIX + hashlib.sha256(data).hexdigest()
+        path = self._path(ref)
+        with self._lock:
+            if self._bytes_since_scan is None:
+                self.root_dir.mkdir(parents=True, exist_ok=True)
+                self._scan()
+        written = not path.exists()
+        if written:
+            fd, tmp_path = tempfile.mkstemp(dir=self.root_dir, prefix=".tmp-")
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            except BaseException:
+                Path(tmp_path).unlink(missing_ok=True)
+                raise
+        else:
+            os.utime(path)
+        with self._lock:
+            self._index_put(path.name, len(data), written)
+            self._evict()
+        self._cache_put(ref, content)
+        return ref
+
+    def get(self, ref: str) -> Optional[str]:
+        """
+        Load a blob.
+
+        Args:
+            ref: Reference returned by `put`
+
+        Returns:
+            Stored text, or None if the blob is unknown or was evicted
+        """
+        with self._lock:
+            if (content := self._cache.get(ref)) is not None:
+                self._cache.move_to_end(ref)
+                return content
+        # References come back from client-side conversation state, so only well-formed digests are read
+        if not _REF_PATTERN.fullmatch(ref):
+            return None
+        path = self._path(ref)
+        try:
+            content = path.read_text(encoding='utf-8')
+            # The file mtime tracks last access for eviction
+            os.utime(path)
+        except OSError:
+            return None
+        with self._lock:
+            if path.name in self._index:
+                self._index.move_to_end(path.name)
+        self._cache_put(ref, content)
+        return content
+
+    def _cache_put(self, ref: str, content: str) -> None:
+        size = len(content)
+        if size > self.cache_max_bytes:
+            return
+        with self._lock:
+            if ref in self._cache:
+                self._cache.move_to_end(ref)
+                return
+            self._cache[ref] = content
+            self._cache_bytes += size
+            while self._cache_bytes > self.cache_max_bytes:
+                _, evicted = self._cache.popitem(last=False)
+                self._cache_bytes -= len(evicted)
+
+    def _index_put(self, name: str, size: int, written: bool) -> None:
+        if name in self._index:
+            self._index.move_to_end(name)
+        else:
+            self._index[name] = size
+            self._total_bytes += size
+        if written:
+            self._bytes_since_scan += size
+            if self._bytes_since_scan > self.max_bytes // _RESCAN_FRACTION:
+                self._scan()
+
+    def _scan(self) -> None:
+        entries = []
+        for entry in os.scandir(self.root_dir):
+            if entry.name.startswith("."):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, entry.name, stat.st_size))
+        self._index = OrderedDict((name, size) for _, name, size in sorted(entries))
+        self._total_bytes = sum(self._index.values())
+        self._bytes_since_scan = 0
+
+    def _evict(self) -> None:
+        # The most recent blob is the one just written, so it is never evicted
+        while self._total_bytes > self.max_bytes and len(self._index) > 1:
+            name, size = self._index.popitem(last=False)
+            (self.root_dir / name).unlink(missing_ok=True)
+            self._total_bytes -= size
+            logger.info("Evicted blob %s", name)
+
+    def _path(self, ref: str) -> Path:
+        return self.root_dir / ref.removeprefix(_REF_PREFIX)
@@ -1,2 +1,4 @@
 TOOL_CALL_HISTORY_KEY = "tool_call_history"
-CUSTOM_CONTENT = "custom_content"
\ No newline at end of file
+CUSTOM_CONTENT = "custom_content"
+CONTENT_REF = "content_ref"
+CONTENT_LENGTH = "content_length"
\ No newline at end of file
@@ -0,0 +1,167 @@
+import asyncio
+import json
+from typing import Any, Optional
+
+from aidial_sdk.chat_completion import Role
+
+from task.utils.blob_store import BlobStore
+from task.utils.constants import CONTENT_LENGTH, CONTENT_REF
+from task.utils.log import get_logger
+
+logger = get_logger(__name__)
+
+# Rough average for English text and code with GPT-style tokenizers
+_CHARS_PER_TOKEN = 4
+_MESSAGE_OVERHEAD_TOKENS = 4
+_STUB_PREVIEW_CHARS = 200
+
+
+def estimate_tokens(message: dict[str, Any]) -> int:
+    """Estimate the prompt tokens of a message without running a tokenizer."""
+    chars = _content_length(message)
+    if tool_calls := message.get("tool_calls"):
+        chars += len(json.dumps(tool_calls, ensure_ascii=False))
+    return _MESSAGE_OVERHEAD_TOKENS + chars // _CHARS_PER_TOKEN
+
+
+class ContextManager:
+    """
+    Keeps the prompt of every LLM round within a token budget of the deployment.
+
+    The most recent `keep_recent_turns` user turns are always sent verbatim. In older turns,
+    tool results longer than `stub_threshold` characters are replaced with a short stub, and
+    if the prompt is still over budget, the oldest turns are dropped as a whole, so tool calls
+    and their results never get separated. Tool results offloaded to the `blob_store` are
+    loaded only if they are sent in full.
+    """
+
+    def __init__(
+            self,
+            budgets: dict[str, int],
+            default_budget: int = 64_000,
+            keep_recent_turns: int = 2,
+            stub_threshold: int = 2_000,
+            blob_store: Optional[BlobStore] = None,
+    ):
+        self.budgets = budgets
+        self.default_budget = default_budget
+        self.keep_recent_turns = keep_recent_turns
+        self.stub_threshold = stub_threshold
+        self.blob_store = blob_store
+
+    def open(self, deployment_name: str) -> 'ConversationContext':
+        """Start the context of one request to a deployment."""
+        return ConversationContext(self, self.budgets.get(deployment_name, self.default_budget))
+
+
+class ConversationContext:
+    """
+    Messages of one request. Token estimates are computed once per message and the fitted
+    prompt is cached, so rounds only pay for the messages they add.
+    """
+
+    def __init__(self, manager: ContextManager, budget: int):
+        self.manager = manager
+        self.budget = budget
+        self._messages: list[dict[str, Any]] = []
+        self._tokens: list[int] = []
+        self._prompt: Optional[list[dict[str, Any]]] = None
+        self._prompt_tokens = 0
+
+    @property
+    def prompt_tokens(self) -> int:
+        """Estimated tokens of the last built prompt."""
+        return self._prompt_tokens
+
+    def extend(self, messages: list[dict[str, Any]]) -> None:
+        for message in messages:
+            self._messages.append(message)
+            self._tokens.append(estimate_tokens(message))
+        self._prompt = None
+
+    async def build(self) -> list[dict[str, Any]]:
+        """Return the messages to send, fitted into the token budget."""
+        if self._prompt is None:
+            prompt, self._prompt_tokens = self.__fit()
+            self._prompt = [await self.__resolve(message) for message in prompt]
+        return self._prompt
+
+    async def __resolve(self, message: dict[str, Any]) -> dict[str, Any]:
+        if CONTENT_REF not in message:
+            return message
+        content = None
+        if self.manager.blob_store is not None:
+            content = await asyncio.to_thread(self.manager.blob_store.get, message[CONTENT_REF])
+        if content is None:
+            content = f"{_content_text(message)}\n[The full tool result is no longer available.]"
+        return {**_without_ref(message), "content": content}
+
+    def __fit(self) -> tuple[list[dict[str, Any]], int]:
+        total = sum(self._tokens)
+        if total <= self.budget:
+            return list(self._messages), total
+
+        turn_starts = [i for i, message in enumerate(self._messages) if message.get("role") == Role.USER.value]
+        recent_start = turn_starts[-self.manager.keep_recent_turns] \
+            if len(turn_starts) >= self.manager.keep_recent_turns else (turn_starts[0] if turn_starts else 0)
+        # Everything before the first user message (the system prompt) is always kept
+        head_end = turn_starts[0] if turn_starts else 0
+
+        messages = list(self._messages)
+        tokens = list(self._tokens)
+        stubbed = 0
+        for i in range(head_end, recent_start):
+            message = messages[i]
+            if message.get("role") == Role.TOOL.value and _content_length(message) > self.manager.stub_threshold:
+                messages[i] = _stub(message)
+                new_tokens = estimate_tokens(messages[i])
+                total -= tokens[i] - new_tokens
+                tokens[i] = new_tokens
+                stubbed += 1
+
+        dropped_until = head_end
+        old_turn_starts = [start for start in turn_starts if start < recent_start]
+        for next_start in old_turn_starts[1:] + [recent_start]:
+            if total <= self.budget:
+                break
+            total -= sum(tokens[dropped_until:next_start])
+            dropped_until = next_start
+
+        logger.info(
+            "Fitted conversation context into token budget",
+            extra={
+                "budget": self.budget,
+                "estimated_tokens": total,
+                "stubbed_tool_results": stubbed,
+                "dropped_messages": dropped_until - head_end,
+            }
+        )
+        return messages[:head_end] + messages[dropped_until:], total
+
+
+def _content_text(message: dict[str, Any]) -> str:
+    content = message.get("content")
+    if content is None:
+        return ""
+    return content if isinstance(content, str) else json.dumps(content, ensure_ascii=False)
+
+
+def _content_length(message: dict[str, Any]) -> int:
+    if CONTENT_REF in message:
+        return message.get(CONTENT_LENGTH) or 0
+    return len(_content_text(message))
+
+
+def _without_ref(message: dict[str, Any]) -> dict[str, Any]:
+    return {key: value for key, value in message.items() if key not in (CONTENT_REF, CONTENT_LENGTH)}
+
+
+def _stub(message: dict[str, Any]) -> dict[str, Any]:
+    preview = _content_text(message)[:_STUB_PREVIEW_CHARS].removesuffix("...")
+    return {
+        **_without_ref(message),
+        "content": (
+            f"{preview}...\n[Earlier tool result of {_content_length(message)} characters omitted to save context. "
+            f"Call the tool again if its full content is needed.]"
+        ),
+    }
@@ -0,0 +1,230 @@
+import io
+import math
+from collections import deque
+from dataclasses import dataclass
+from typing import IO, TYPE_CHECKING, Iterator
+
+from task.utils.extracted_text_cache import DEFAULT_PAGE_SIZE
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+_SAMPLE_ROWS = 1_000
+_CHUNK_ROWS = 1_000
+_PREVIEW_ROWS = 5
+# Distinct values are counted exactly up to this number per column
+_MAX_TRACKED_VALUES = 1_000
+
+
+@dataclass
+class CsvSchema:
+    """Column types inferred from the first rows of a CSV file, and the rows that fit in a page."""
+
+    columns: dict[str, str]
+    rows_per_page: int
+
+
+def infer_schema(file: IO[bytes], page_size: int = DEFAULT_PAGE_SIZE) -> CsvSchema:
+    """
+    Infer the column types from the first rows. All later reads use these columns with text values,
+    so every chunk has the same columns and is rendered exactly as written in the file.
+
+    Args:
+        file: CSV file, read from the start and rewound afterwards
+        page_size: Characters per page, used to estimate the rows per page
+
+    Returns:
+        Inferred schema
+    """
+    import pandas as pd
+    file.seek(0)
+    sample = pd.read_csv(_text(file), nrows=_SAMPLE_ROWS)
+    file.seek(0)
+    columns = {str(column): _kind(sample[column]) for column in sample.columns}
+    if len(sample):
+        row_chars = len(sample.astype(str).to_markdown(index=False)) / len(sample)
+        rows_per_page = max(1, int(page_size // max(row_chars, 1)))
+    else:
+        rows_per_page = page_size
+    return CsvSchema(columns=columns, rows_per_page=rows_per_page)
+
+
+def iter_chunks(file: IO[bytes], schema: CsvSchema, chunk_rows: int = _CHUNK_ROWS) -> Iterator['pd.DataFrame']:
+    """Read the file in chunks of `chunk_rows` rows with the columns of the schema as text."""
+    import pandas as pd
+    file.seek(0)
+    yield from pd.read_csv(_text(file), chunksize=chunk_rows, dtype={column: str for column in schema.columns})
+
+
+def iter_markdown(file: IO[bytes], schema: CsvSchema) -> Iterator[str]:
+    """Yield the file as one markdown table, chunk by chunk."""
+    for chunk_number, chunk in enumerate(iter_chunks(file, schema)):
+        table = chunk.to_markdown(index=False)
+        # Continue the same markdown table: drop the repeated header and separator rows
+        yield table if chunk_number == 0 else "\n" + table.split("\n", 2)[2]
+
+
+@dataclass
+class CsvLayout:
+    """
+    Where the pages of a CSV file start, so a page is read and parsed without the rows before it.
+    `page_offsets` holds the byte offset of the first row of every page and the end of the last row.
+    """
+
+    schema: CsvSchema
+    header: bytes
+    page_offsets: list[int]
+    rows: int
+
+    @property
+    def total_pages(self) -> int:
+        return max(1, len(self.page_offsets) - 1)
+
+    def page_range(self, page: int) -> tuple[int, int] | None:
+        """Byte range [start, end) of a 1-based page, None if the page does not exist."""
+        if not 1 <= page < len(self.page_offsets):
+            return None
+        return self.page_offsets[page - 1], self.page_offsets[page]
+
+
+def scan_layout(file: IO[bytes], page_size: int = DEFAULT_PAGE_SIZE) -> CsvLayout:
+    """
+    Infer the schema and find the page boundaries in one pass over the raw bytes.
+    Records are split on line ends outside quoted fields, so values with line breaks stay in one row.
+    """
+    schema = infer_schema(file, page_size)
+    header = _read_record(file)
+    page_offsets = [file.tell()]
+    rows = 0
+    rows_end = file.tell()
+    while record := _read_record(file):
+        # Blank lines are skipped by the parser, so they don't count as rows
+        if not record.strip():
+            continue
+        rows += 1
+        rows_end = file.tell()
+        if rows % schema.rows_per_page == 0:
+            page_offsets.append(rows_end)
+    if rows % schema.rows_per_page:
+        page_offsets.append(rows_end)
+    file.seek(0)
+    return CsvLayout(schema=schema, header=header, page_offsets=page_offsets, rows=rows)
+
+
+def render_rows(layout: CsvLayout, rows: bytes) -> str:
+    """Render the raw bytes of a page, as located by `CsvLayout.page_range`, as a markdown table."""
+    import pandas as pd
+    frame = pd.read_csv(
+        _text(io.BytesIO(layout.header + rows)), dtype={column: str for column in layout.schema.columns}
+    )
+    return frame.to_markdown(index=False)
+
+
+def summarize(file: IO[bytes], schema: CsvSchema) -> str:
+    """
+    Describe the file in one streaming pass: columns with types, row count,
+    per-column statistics and the first and last rows.
+    """
+    import pandas as pd
+    stats = {column: _ColumnStats(kind) for column, kind in schema.columns.items()}
+    head: list['pd.DataFrame'] = []
+    tail: deque['pd.DataFrame'] = deque()
+    rows = 0
+    for chunk in iter_chunks(file, schema):
+        rows += len(chunk)
+        for column, column_stats in stats.items():
+            column_stats.update(chunk[column])
+        if sum(len(part) for part in head) < _PREVIEW_ROWS:
+            head.append(chunk.head(_PREVIEW_ROWS))
+        tail.append(chunk.tail(_PREVIEW_ROWS))
+        # The last two chunks always hold the last rows
+        while len(tail) > 2:
+            tail.popleft()
+
+    lines = [f"**Rows**: {rows}", f"**Columns**: {len(stats)}", "", "## Columns", ""]
+    lines.append(pd.DataFrame([column_stats.describe(column) for column, column_stats in stats.items()])
+                 .to_markdown(index=False))
+    if rows:
+        lines += ["", f"## First {min(rows, _PREVIEW_ROWS)} rows", "",
+                  pd.concat(head).head(_PREVIEW_ROWS).to_markdown(index=False)]
+    if rows > _PREVIEW_ROWS:
+        lines += ["", f"## Last {min(rows - _PREVIEW_ROWS, _PREVIEW_ROWS)} rows", "",
+                  pd.concat(tail).tail(min(rows - _PREVIEW_ROWS, _PREVIEW_ROWS)).to_markdown(index=False)]
+    return "\n".join(lines)
+
+
+def _read_record(file: IO[bytes]) -> bytes:
+    record = file.readline()
+    # An odd number of quotes means a quoted field continues on the next line
+    while record.count(b'"') % 2 and (line := file.readline()):
+        record += line
+    return record
+
+
+class _ColumnStats:
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.non_null = 0
+        self.nulls = 0
+        self.values: set[str] = set()
+        self.values_capped = False
+        self.minimum = math.inf
+        self.maximum = -math.inf
+        self.total = 0.0
+
+    def update(self, values: 'pd.Series') -> None:
+        import pandas as pd
+        present = values.dropna()
+        self.non_null += len(present)
+        self.nulls += len(values) - len(present)
+        if not self.values_capped:
+            self.values.update(present.unique()[:_MAX_TRACKED_VALUES + 1 - len(self.values)])
+            self.values_capped = len(self.values) > _MAX_TRACKED_VALUES
+        if self.kind in ("integer", "float") and len(present):
+            numbers = pd.to_numeric(present, errors='coerce')
+            if numbers.isna().any():
+                # A value later in the file is not a number
+                self.kind = "text"
+                return
+            self.minimum = min(self.minimum, numbers.min())
+            self.maximum = max(self.maximum, numbers.max())
+            self.total += numbers.sum()
+
+    def describe(self, column: str) -> dict[str, str]:
+        numeric = self.kind in ("integer", "float") and self.non_null
+        return {
+            "column": column,
+            "type": self.kind,
+            "non-null": str(self.non_null),
+            "null": str(self.nulls),
+            "distinct": f">{_MAX_TRACKED_VALUES}" if self.values_capped else str(len(self.values)),
+            "min": f"{self.minimum:g}" if numeric else "",
+            "max": f"{self.maximum:g}" if numeric else "",
+            "mean": f"{self.total / self.non_null:g}" if numeric else "",
+        }
+
+
+def _kind(values: 'pd.Series') -> str:
+    from pandas.api import types
+    if types.is_bool_dtype(values):
+        return "boolean"
+    if types.is_integer_dtype(values):
+        return "integer"
+    if types.is_float_dtype(values):
+        return "float"
+    return "text"
+
+
+def _text(file: IO[bytes]) -> io.TextIOWrapper:
+    # The wrapper must not close the underlying file when it is garbage collected
+    return _NonClosingTextWrapper(file, encoding='utf-8', errors='ignore')
+
+
+class _NonClosingTextWrapper(io.TextIOWrapper):
+
+    def close(self) -> None:
+        pass
+
+    def __del__(self) -> None:
+        pass
@@ -0,0 +1,122 @@
+import importlib.util
+import threading
+from dataclasses import dataclass
+from typing import Optional
+
+import httpx
+from aidial_client import AsyncDial, AsyncDialClientPool
+
+from task.utils.log import get_logger
+
+logger = get_logger(__name__)
+
+DEFAULT_API_VERSION = "2025-01-01-preview"
+
+
+class DialClientFactory:
+    """
+    Process-wide factory of DIAL clients. All clients for an endpoint share one httpx
+    connection pool, so requests and tools reuse keep-alive connections instead of opening
+    new ones for every call. The API key is applied per client as a request header,
+    so one pool safely serves all users.
+
+    The pool is an httpx transport owned by the factory: it backs the `AsyncDialClientPool`
+    of the endpoint and a plain httpx client for streaming file transfers.
+    """
+
+    _instance: Optional['DialClientFactory'] = None
+    _instance_lock = threading.Lock()
+
+    def __init__(
+            self,
+            max_connections: int = 100,
+            max_keepalive_connections: int = 20,
+            keepalive_expiry: float = 30.0,
+            http2: bool = False,
+            timeout: float = 600.0,
+            connect_timeout: float = 5.0,
+            max_retries: int = 2,
+    ):
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.timeout = httpx.Timeout(timeout=timeout, connect=connect_timeout)
+        self.max_retries = max_retries
+        self.http2 = http2
+        if http2 and importlib.util.find_spec("h2") is None:
+            logger.warning("HTTP/2 requested but the 'h2' package is not installed, using HTTP/1.1")
+            self.http2 = False
+        self._pools: dict[str, _EndpointPool] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def configure(cls, **kwargs) -> 'DialClientFactory':
+        """Replace the process-wide factory with one using the given settings."""
+        with cls._instance_lock:
+            cls._instance = cls(**kwargs)
+            return cls._instance
+
+    @classmethod
+    def get_instance(cls) -> 'DialClientFactory':
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def create_async_client(self, endpoint: str, api_key: str) -> AsyncDial:
+        """
+        Create a lightweight AsyncDial client on top of the shared connection pool of the endpoint.
+        The API version of chat completions is passed with every `chat.completions.create` call.
+
+        Args:
+            endpoint: DIAL Core URL
+            api_key: API key of the current request
+
+        Returns:
+            AsyncDial client authenticated with `api_key`
+        """
+        return self.__get_pool(endpoint).dial.create_client(
+            base_url=endpoint,
+            api_key=api_key,
+            max_retries=self.max_retries,
+            timeout=self.timeout
+        )
+
+    def get_http_client(self, endpoint: str) -> httpx.AsyncClient:
+        """
+        Return the httpx client on the shared connection pool of the endpoint, for requests the
+        DIAL client doesn't stream (file downloads). Requests are authenticated with `auth_headers`.
+        """
+        return self.__get_pool(endpoint).http
+
+    @staticmethod
+    def auth_headers(api_key: str) -> dict[str, str]:
+        return {"api-key": api_key}
+
+    async def aclose(self) -> None:
+        """Close all connection pools."""
+        with self._lock:
+            pools, self._pools = list(self._pools.values()), {}
+        for pool in pools:
+            # Closes the shared transport, and with it the DIAL clients of the endpoint
+            await pool.http.aclose()
+
+    def __get_pool(self, endpoint: str) -> '_EndpointPool':
+        with self._lock:
+            pool = self._pools.get(endpoint)
+            if pool is None or pool.http.is_closed:
+                transport = httpx.AsyncHTTPTransport(limits=self.limits, http2=self.http2)
+                pool = _EndpointPool(
+                    dial=AsyncDialClientPool(transport=transport, timeout=self.timeout),
+                    http=httpx.AsyncClient(transport=transport, timeout=self.timeout)
+                )
+                self._pools[endpoint] = pool
+            return pool
+
+
+@dataclass
+class _EndpointPool:
+    dial: AsyncDialClientPool
+    http: httpx.AsyncClient
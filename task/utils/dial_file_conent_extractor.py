@@ -1,45 +1,284 @@
-import io
+import asyncio
+import codecs
+import hashlib
+import shutil
+import tempfile
+from dataclasses import dataclass
 from pathlib import Path
+from typing import IO, AsyncIterator, Iterator, Optional
+from urllib.parse import urljoin
 
-import pdfplumber
-import pandas as pd
-from aidial_client import Dial
-from bs4 import BeautifulSoup
+from aidial_client.types.metadata import FileMetadata
+
+from task.utils import csv_reader
+from task.utils.dial_client_factory import DialClientFactory
+from task.utils.extracted_text_cache import ExtractedText, ExtractedTextCache
+from task.utils.log import get_logger
+from task.utils.pdf_extractor import PdfPageExtractor
+
+logger = get_logger(__name__)
+
+# Downloads larger than this are spilled from memory to a temporary file
+_DOWNLOAD_SPOOL_SIZE = 8 * 1024 * 1024
+_TEXT_BLOCK_SIZE = 64 * 1024
+_CSV_CONTENT_TYPES = {"text/csv", "application/csv"}
+
+
+@dataclass
+class DownloadedFile:
+    filename: str
+    extension: str
+    content: IO[bytes]
+    content_hash: str
+    etag: Optional[str] = None
+
+    def close(self) -> None:
+        self.content.close()
 
 
 class DialFileContentExtractor:
 
-    def __init__(self, endpoint: str, api_key: str):
-        self.dial_client = Dial(base_url=endpoint, api_key=api_key)
+    def __init__(
+            self,
+            endpoint: str,
+            api_key: str,
+            text_cache: Optional[ExtractedTextCache] = None,
+            pdf_extractor: Optional[PdfPageExtractor] = None,
+    ):
+        factory = DialClientFactory.get_instance()
+        self.dial_client = factory.create_async_client(endpoint, api_key)
+        self.http_client = factory.get_http_client(endpoint)
+        self.auth_headers = factory.auth_headers(api_key)
+        self.text_cache = text_cache
+        self.pdf_extractor = pdf_extractor
+        self._metadata: dict[str, Optional[FileMetadata]] = {}
+
+    async def get_extracted_text(self, file_url: str) -> ExtractedText:
+        """
+        Extract the whole text of the file. With a text cache, an unchanged file (same ETag)
+        is served without downloading it, and a known content hash skips parsing.
+        """
+        etag = None
+        if self.text_cache is not None:
+            etag = await self.get_etag(file_url)
+            if etag and (cached := self.text_cache.get(file_url, etag)):
+                return cached
+
+        file = await self.download(file_url)
+        try:
+            extracted = self.text_cache.get_by_hash(file.content_hash) if self.text_cache is not None else None
+            if extracted is None:
+                text = "".join([piece async for piece in self.iter_file_text(file)])
+                extracted = ExtractedText(text=text, content_hash=file.content_hash)
+        finally:
+            file.close()
+
+        # An empty text may come from a failed extraction, so it is extracted again next time
+        if self.text_cache is not None and extracted.text:
+            self.text_cache.set(file_url, file.etag or etag, extracted)
+        return extracted
+
+    async def get_metadata(self, file_url: str) -> Optional[FileMetadata]:
+        """Storage metadata of the file, fetched once per extractor; None if it can't be read."""
+        if file_url not in self._metadata:
+            try:
+                self._metadata[file_url] = await self.dial_client.files.get_metadata(file_url)
+            except Exception as e:
+                logger.warning("Unable to get metadata of %s: %s", file_url, e)
+                self._metadata[file_url] = None
+        return self._metadata[file_url]
+
+    async def get_etag(self, file_url: str) -> Optional[str]:
+        metadata = await self.get_metadata(file_url)
+        return _normalize_etag(metadata.etag) if metadata is not None else None
+
+    async def is_csv(self, file_url: str) -> bool:
+        """
+        Whether the file is a CSV file by its content type or name in storage. Without metadata,
+        the URL is checked for a `.csv` extension.
+        """
+        metadata = await self.get_metadata(file_url)
+        if metadata is None:
+            return Path(file_url).suffix.lower() == ".csv"
+        content_type = (metadata.content_type or "").split(";")[0].strip().lower()
+        return content_type in _CSV_CONTENT_TYPES or Path(metadata.name).suffix.lower() == ".csv"
+
+    async def get_csv_page(self, file_url: str, page: int) -> tuple[str, int]:
+        """
+        Render one page of a CSV file as a markdown table. The first request scans the file for
+        its page boundaries; with a text cache, later pages of the same file version read only
+        their own byte range.
 
-    def extract_text(self, file_url: str) -> str:
-        file = self.dial_client.files.download(file_url)
-        filename = file.name
-        file_content = file.content
-        file_extension = Path(filename).suffix.lower()
-        return self.__extract_text(file_content, file_extension, filename)
+        Args:
+            file_url: URL of a CSV file
+            page: 1-based page number
 
-    def __extract_text(self, file_content: bytes, file_extension: str, filename: str) -> str:
+        Returns:
+            Markdown of the page (empty if the page does not exist) and the total number of pages
+        """
+        etag = await self.get_etag(file_url) if self.text_cache is not None else None
+        layout = self.text_cache.get_csv_layout(file_url, etag) if etag else None
+        if layout is not None:
+            if (page_range := layout.page_range(page)) is None:
+                return "", layout.total_pages
+            rows = await self.download_range(file_url, *page_range, etag=etag)
+            if rows is not None:
+                return await asyncio.to_thread(csv_reader.render_rows, layout, rows), layout.total_pages
+            # The file changed since its layout was cached
+
+        file = await self.download(file_url)
+        try:
+            layout = self.text_cache.get_csv_layout_by_hash(file.content_hash) if self.text_cache is not None else None
+            if layout is None:
+                layout = await asyncio.to_thread(csv_reader.scan_layout, file.content)
+            if self.text_cache is not None:
+                self.text_cache.set_csv_layout(file_url, file.etag or etag, file.content_hash, layout)
+            if (page_range := layout.page_range(page)) is None:
+                return "", layout.total_pages
+            start, end = page_range
+            file.content.seek(start)
+            rows = file.content.read(end - start)
+        finally:
+            file.close()
+        return await asyncio.to_thread(csv_reader.render_rows, layout, rows), layout.total_pages
+
+    async def get_csv_summary(self, file_url: str) -> str:
+        """Describe a CSV file: columns, row count, per-column statistics and sample rows."""
+        file = await self.download(file_url)
         try:
-            if file_extension == '.txt':
-                return file_content.decode('utf-8', errors='ignore')
-            elif file_extension == '.pdf':
-                with pdfplumber.open(io.BytesIO(file_content)) as pdf:
-                    pages = [page.extract_text() or "" for page in pdf.pages]
-                return "\n".join(pages)
-            elif file_extension == '.csv':
-                decoded_text_content = file_content.decode('utf-8', errors='ignore')
-                csv_buffer = io.StringIO(decoded_text_content)
-                df = pd.read_csv(csv_buffer)
-                return df.to_markdown(index=False)
-            elif file_extension in ['.html', '.htm']:
-                decoded_text_content = file_content.decode('utf-8', errors='ignore')
-                soup = BeautifulSoup(decoded_text_content, features='html.parser')
-                for script in soup(["script", "style"]):
-                    script.decompose()
-                return soup.get_text(separator='\n', strip=True)
-            else:
-                return file_content.decode('utf-8', errors='ignore')
-        except Exception as e:
-            print(f"Error extracting text from {filename}: {e}")
-            return ""
\ No newline at end of file
+            schema = await asyncio.to_thread(csv_reader.infer_schema, file.content)
+            return await asyncio.to_thread(csv_reader.summarize, file.content, schema)
+        finally:
+            file.close()
+
+    async def iter_file_text(self, file: DownloadedFile) -> AsyncIterator[str]:
+        pieces = self.__iter_text(file.content, file.extension, file.filename)
+        # Parsing is CPU-bound, so every step of the parser runs in a worker thread
+        while (piece := await asyncio.to_thread(next, pieces, None)) is not None:
+            yield piece
+
+    async def download(self, file_url: str) -> DownloadedFile:
+        """Stream the file from DIAL storage into a spooled temporary file."""
+        storage_resource = self.dial_client.files.get_storage_resource(file_url)
+        url = urljoin(self.dial_client.api_url, storage_resource.api_path)
+
+        content = tempfile.SpooledTemporaryFile(max_size=_DOWNLOAD_SPOOL_SIZE)
+        content_hash = hashlib.sha256()
+        try:
+            async with self.http_client.stream("GET", url, headers=self.auth_headers) as response:
+                response.raise_for_status()
+                etag = _normalize_etag(response.headers.get("etag"))
+                async for chunk in response.aiter_bytes():
+                    content_hash.update(chunk)
+                    content.write(chunk)
+        except BaseException:
+            content.close()
+            raise
+        content.seek(0)
+
+        filename = storage_resource.filename
+        return DownloadedFile(
+            filename=filename,
+            extension=Path(filename).suffix.lower(),
+            content=content,
+            content_hash=content_hash.hexdigest(),
+            etag=etag,
+        )
+
+    async def download_range(self, file_url: str, start: int, end: int, etag: str) -> Optional[bytes]:
+        """
+        Read the bytes [start, end) of a file version with a range request.
+
+        Args:
+            file_url: File URL
+            start: First byte
+            end: End of the range (exclusive)
+            etag: ETag of the expected file version
+
+        Returns:
+            The bytes of the range, or None if the file is no longer the version with this ETag
+        """
+        if start >= end:
+            return b""
+        storage_resource = self.dial_client.files.get_storage_resource(file_url)
+        headers = {**self.auth_headers, "Range": f"bytes={start}-{end - 1}"}
+        url = urljoin(self.dial_client.api_url, storage_resource.api_path)
+
+        async with self.http_client.stream("GET", url, headers=headers) as response:
+            response.raise_for_status()
+            if (response_etag := _normalize_etag(response.headers.get("etag"))) and response_etag != etag:
+                return None
+            if response.status_code == 206:
+                return await response.aread()
+            # The storage ignored the range: skip to the start and stop reading at the end
+            data = bytearray()
+            position = 0
+            async for chunk in response.aiter_bytes():
+                if position + len(chunk) > start:
+                    data += chunk[max(start - position, 0):end - position]
+                position += len(chunk)
+                if position >= end:
+                    break
+            return bytes(data)
+
+    def __iter_text(self, file_content: IO[bytes], file_extension: str, filename: str) -> Iterator[str]:
+        produced = False
+        try:
+            for piece in self.__iter_format_text(file_content, file_extension):
+                produced = True
+                yield piece
+        except Exception:
+            logger.exception("Error extracting text from %s", filename)
+            if produced:
+                # Ending quietly here would pass off a truncated text as the whole document
+                raise
+
+    def __iter_format_text(self, file_content: IO[bytes], file_extension: str) -> Iterator[str]:
+        if file_extension == '.pdf':
+            yield from self.__iter_pdf(file_content)
+        elif file_extension == '.csv':
+            yield from self.__iter_csv(file_content)
+        elif file_extension in ['.html', '.htm']:
+            from bs4 import BeautifulSoup
+            decoded_text_content = file_content.read().decode('utf-8', errors='ignore')
+            soup = BeautifulSoup(decoded_text_content, features='html.parser')
+            for script in soup(["script", "style"]):
+                script.decompose()
+            yield soup.get_text(separator='\n', strip=True)
+        else:
+            yield from self.__iter_plain_text(file_content)
+
+    def __iter_pdf(self, file_content: IO[bytes]) -> Iterator[str]:
+        if self.pdf_extractor is None:
+            import pdfplumber
+            with pdfplumber.open(file_content) as pdf:
+                for page_number, page in enumerate(pdf.pages):
+                    text = page.extract_text() or ""
+                    page.close()
+                    yield text if page_number == 0 else f"\n{text}"
+            return
+
+        # Worker processes open the document by path, so it is written to a named temporary file
+        with tempfile.NamedTemporaryFile(suffix='.pdf') as pdf_file:
+            shutil.copyfileobj(file_content, pdf_file)
+            pdf_file.flush()
+            for page_number, text in enumerate(self.pdf_extractor.iter_pages(pdf_file.name)):
+                yield text if page_number == 0 else f"\n{text}"
+
+    @staticmethod
+    def __iter_csv(file_content: IO[bytes]) -> Iterator[str]:
+        yield from csv_reader.iter_markdown(file_content, csv_reader.infer_schema(file_content))
+
+    @staticmethod
+    def __iter_plain_text(file_content: IO[bytes]) -> Iterator[str]:
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='ignore')
+        while block := file_content.read(_TEXT_BLOCK_SIZE):
+            if text := decoder.decode(block):
+                yield text
+        if tail := decoder.decode(b"", final=True):
+            yield tail
+
+
+def _normalize_etag(etag: Optional[str]) -> Optional[str]:
+    # Metadata and download responses may quote the ETag differently or mark it weak
+    return etag.removeprefix("W/").strip('"') if etag else None
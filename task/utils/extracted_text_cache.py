@@ -0,0 +1,171 @@
+import sys
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:
+    from task.utils.csv_reader import CsvLayout
+
+DEFAULT_PAGE_SIZE = 10_000
+# Layouts are small (a few bytes per page), so they are bounded by count
+_MAX_CSV_LAYOUTS = 1_024
+
+
+@dataclass
+class ExtractedText:
+    """Extracted file text with precomputed page offsets."""
+
+    text: str
+    content_hash: str
+    page_size: int = DEFAULT_PAGE_SIZE
+    page_offsets: list[int] = field(init=False)
+
+    def __post_init__(self):
+        self.page_offsets = list(range(0, max(len(self.text), 1), self.page_size))
+
+    @property
+    def total_pages(self) -> int:
+        return len(self.page_offsets)
+
+    def page(self, page: int) -> str:
+        """Return the text of a 1-based page."""
+        start = self.page_offsets[page - 1]
+        end = self.page_offsets[page] if page < self.total_pages else len(self.text)
+        return self.text[start:end]
+
+
+class ExtractedTextCache:
+    """
+    Thread-safe LRU cache of extracted file text, bounded by the memory used by the text.
+    Entries are stored by content hash and found either by (file URL, ETag), which needs only
+    a metadata request, or by the content hash of a downloaded file, which skips parsing.
+    The page layouts of CSV files, which are paged without extracting their whole text,
+    are kept the same way.
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[str, tuple[ExtractedText, int]] = OrderedDict()
+        self._layouts: OrderedDict[str, 'CsvLayout'] = OrderedDict()
+        self._urls: dict[tuple[str, str], str] = {}
+        self._total_bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._lock = threading.Lock()
+
+    def get(self, file_url: str, etag: str) -> Optional[ExtractedText]:
+        """
+        Retrieve the text of a file version.
+
+        Args:
+            file_url: File URL
+            etag: ETag of the file version
+
+        Returns:
+            Extracted text if cached, None otherwise
+        """
+        with self._lock:
+            content_hash = self._urls.get((file_url, etag))
+            return self._get(content_hash) if content_hash else self._miss()
+
+    def get_by_hash(self, content_hash: str) -> Optional[ExtractedText]:
+        """Retrieve extracted text by the content hash of the downloaded file."""
+        with self._lock:
+            return self._get(content_hash)
+
+    def set(self, file_url: str, etag: Optional[str], extracted: ExtractedText) -> None:
+        """
+        Store extracted text, evicting least recently used entries over the memory budget.
+        Texts larger than the whole budget are not cached.
+
+        Args:
+            file_url: File URL
+            etag: ETag of the file version, if known
+            extracted: Extracted text
+        """
+        size = sys.getsizeof(extracted.text)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if etag:
+                self._urls[(file_url, etag)] = extracted.content_hash
+            if extracted.content_hash in self._entries:
+                self._entries.move_to_end(extracted.content_hash)
+                return
+            self._entries[extracted.content_hash] = (extracted, size)
+            self._total_bytes += size
+            while self._total_bytes > self.max_bytes:
+                evicted_hash, (_, evicted_size) = self._entries.popitem(last=False)
+                self._total_bytes -= evicted_size
+                self._evictions += 1
+                self._forget_urls(evicted_hash)
+
+    def get_csv_layout(self, file_url: str, etag: str) -> Optional['CsvLayout']:
+        """Retrieve the page layout of a CSV file version."""
+        with self._lock:
+            content_hash = self._urls.get((file_url, etag))
+            return self._get_layout(content_hash) if content_hash else self._miss()
+
+    def get_csv_layout_by_hash(self, content_hash: str) -> Optional['CsvLayout']:
+        """Retrieve the page layout of a CSV file by the content hash of the downloaded file."""
+        with self._lock:
+            return self._get_layout(content_hash)
+
+    def set_csv_layout(self, file_url: str, etag: Optional[str], content_hash: str, layout: 'CsvLayout') -> None:
+        """
+        Store the page layout of a CSV file, evicting the least recently used layout over the limit.
+
+        Args:
+            file_url: File URL
+            etag: ETag of the file version, if known
+            content_hash: Content hash of the file
+            layout: Page layout
+        """
+        with self._lock:
+            if etag:
+                self._urls[(file_url, etag)] = content_hash
+            self._layouts[content_hash] = layout
+            self._layouts.move_to_end(content_hash)
+            while len(self._layouts) > _MAX_CSV_LAYOUTS:
+                evicted_hash, _ = self._layouts.popitem(last=False)
+                self._evictions += 1
+                self._forget_urls(evicted_hash)
+
+    def stats(self) -> dict[str, int]:
+        """Return hit/miss/eviction counters and current usage."""
+        with self._lock:
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "entries": len(self._entries),
+                "csv_layouts": len(self._layouts),
+                "bytes": self._total_bytes,
+            }
+
+    def _get(self, content_hash: str) -> Optional[ExtractedText]:
+        entry = self._entries.get(content_hash)
+        if entry is None:
+            return self._miss()
+        self._entries.move_to_end(content_hash)
+        self._hits += 1
+        return entry[0]
+
+    def _get_layout(self, content_hash: str) -> Optional['CsvLayout']:
+        layout = self._layouts.get(content_hash)
+        if layout is None:
+            return self._miss()
+        self._layouts.move_to_end(content_hash)
+        self._hits += 1
+        return layout
+
+    def _forget_urls(self, content_hash: str) -> None:
+        # A URL stays known while its text or its layout is cached
+        if content_hash not in self._entries and content_hash not in self._layouts:
+            self._urls = {key: value for key, value in self._urls.items() if value != content_hash}
+
+    def _miss(self) -> None:
+        self._misses += 1
+        return None
@@ -1,9 +1,9 @@
-import copy
 from typing import Any
 
 from aidial_sdk.chat_completion import Message, Role
 
-from task.utils.constants import TOOL_CALL_HISTORY_KEY, CUSTOM_CONTENT
+from task.utils.blob_store import BlobStore
+from task.utils.constants import TOOL_CALL_HISTORY_KEY, CUSTOM_CONTENT, CONTENT_REF, CONTENT_LENGTH
 
 
 def unpack_messages(messages: list[Message], state_history: list[dict[str, Any]]) -> list[dict[str, Any]]:
@@ -18,19 +18,20 @@ def unpack_messages(messages: list[Message], state_history: list[dict[str, Any]]
                     if tool_call_history and isinstance(tool_call_history, list):
                         for history_msg in tool_call_history:
                             if history_msg.get("role") == Role.TOOL.value:
-                                result.append(
-                                    {
-                                        "role": Role.TOOL.value,
-                                        "content": history_msg.get("content"),
-                                        "tool_call_id": history_msg.get("tool_call_id"),
-                                    }
-                                )
+                                tool_msg = {
+                                    "role": Role.TOOL.value,
+                                    "content": history_msg.get("content"),
+                                    "tool_call_id": history_msg.get("tool_call_id"),
+                                }
+                                # Offloaded content is resolved later, only if it is sent in full
+                                if content_ref := history_msg.get(CONTENT_REF):
+                                    tool_msg[CONTENT_REF] = content_ref
+                                    tool_msg[CONTENT_LENGTH] = history_msg.get(CONTENT_LENGTH)
+                                result.append(tool_msg)
                             else:
                                 result.append(history_msg)
 
-                    msg = copy.deepcopy(message)
-                    msg.custom_content = None
-                    result.append(msg.dict(exclude_none=True))
+                    result.append(message.dict(exclude_none=True, exclude={"custom_content"}))
         else:
             attachments_urls_content = ''
             if message.custom_content and message.custom_content.attachments:
@@ -59,3 +60,28 @@ def unpack_messages(messages: list[Message], state_history: list[dict[str, Any]]
             result.append(history_msg)
 
     return result
+
+
+
+def offload_tool_messages(
+        messages: list[dict[str, Any]],
+        blob_store: BlobStore,
+        min_chars: int,
+        preview_chars: int = 200,
+) -> list[dict[str, Any]]:
+    """
+    Prepare tool call history for the choice state: the content of tool messages longer than
+    `min_chars` is moved to the blob store and replaced with a preview and a reference.
+    """
+    result: list[dict[str, Any]] = []
+    for message in messages:
+        content = message.get("content")
+        if message.get("role") == Role.TOOL.value and isinstance(content, str) and len(content) > min_chars:
+            message = {
+                **message,
+                "content": f"{content[:preview_chars]}...",
+                CONTENT_REF: blob_store.put(content),
+                CONTENT_LENGTH: len(content),
+            }
+        result.append(message)
+    return result
@@ -0,0 +1,136 @@
+import atexit
+import copy
+import json
+import logging
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+_ROOT_LOGGER = "task"
+_STANDARD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+_listener: Optional[QueueListener] = None
+
+
+class _QueueHandler(QueueHandler):
+    """Queue handler that keeps the traceback out of the message, so it is not truncated with it."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+
+class SamplingFilter(logging.Filter):
+    """Lets through only a `rate` fraction of records below `max_level`; more severe records always pass."""
+
+    def __init__(self, rate: float, max_level: int = logging.DEBUG):
+        super().__init__()
+        self.rate = rate
+        self.max_level = max_level
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno > self.max_level or self.rate >= 1.0 or random.random() < self.rate
+
+
+class TruncatingFormatter(logging.Formatter):
+    """Plain-text formatter that cuts messages longer than `max_length` characters."""
+
+    def __init__(self, max_length: int, fmt: Optional[str] = None):
+        super().__init__(fmt or "%(asctime)s %(levelname)s [%(name)s] %(message)s")
+        self.max_length = max_length
+
+    def formatMessage(self, record: logging.LogRecord) -> str:
+        record.message = _truncate(record.message, self.max_length)
+        return super().formatMessage(record)
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats records as one JSON object per line. Attributes passed with `extra=`
+    become fields of the object; long messages and field values are truncated.
+    """
+
+    def __init__(self, max_length: int):
+        super().__init__()
+        self.max_length = max_length
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": _truncate(record.getMessage(), self.max_length),
+        }
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value if isinstance(value, (int, float, bool)) or value is None \
+                    else _truncate(str(value), self.max_length)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def setup_logging(
+        level: str = "INFO",
+        json_format: bool = True,
+        sample_rate: float = 1.0,
+        max_message_length: int = 2_000,
+) -> None:
+    """
+    Configure logging of the `task` package. Records are put on an in-memory queue by the
+    calling thread and formatted and written to stdout by a background listener thread,
+    so logging never blocks the event loop on I/O.
+
+    Args:
+        level: Minimal level name (DEBUG, INFO, ...)
+        json_format: Write JSON lines instead of plain text
+        sample_rate: Fraction of DEBUG records to keep
+        max_message_length: Messages and fields longer than this are truncated
+    """
+    global _listener
+    if _listener is None:
+        atexit.register(_stop_listener)
+    else:
+        _listener.stop()
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(
+        JsonFormatter(max_message_length) if json_format else TruncatingFormatter(max_message_length)
+    )
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = _QueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(sample_rate))
+
+    logger = logging.getLogger(_ROOT_LOGGER)
+    logger.setLevel(level.upper())
+    logger.handlers = [queue_handler]
+    logger.propagate = False
+
+    _listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Return a logger of the `task` package for a module name."""
+    return logging.getLogger(name if name.startswith(_ROOT_LOGGER) else f"{_ROOT_LOGGER}.{name}")
+
+
+def _stop_listener() -> None:
+    # Flushes records still in the queue
+    if _listener is not None:
+        _listener.stop()
+
+
+def _truncate(text: str, max_length: int) -> str:
+    if len(text) <= max_length:
+        return text
+    return f"{text[:max_length]}... [truncated {len(text) - max_length} chars]"
@@ -0,0 +1,175 @@
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Iterator, Optional
+
+from task.utils.log import get_logger
+
+logger = get_logger(__name__)
+
+
+class PdfPageExtractor:
+    """
+    Extracts the text of PDF pages with pdfplumber in a pool of worker processes.
+
+    Documents with at least `min_pages_for_pool` pages are split into ranges of
+    `pages_per_task` pages that are extracted in parallel. Pages are yielded in order
+    as soon as their range is done, and at most two ranges per worker are queued,
+    so a long document doesn't hold all its text in flight. Smaller documents are
+    extracted in the calling thread, where starting a process would cost more than it saves.
+
+    The address space of every worker can be capped with `memory_limit_mb`, and workers
+    are replaced after `max_tasks_per_worker` ranges to release memory held by the parser.
+    If a worker dies, the pool is replaced and the rest of the document is retried once.
+    """
+
+    def __init__(
+            self,
+            max_workers: int = 4,
+            pages_per_task: int = 16,
+            min_pages_for_pool: int = 32,
+            memory_limit_mb: Optional[int] = None,
+            max_tasks_per_worker: Optional[int] = 100,
+    ):
+        self.max_workers = max_workers
+        self.pages_per_task = pages_per_task
+        self.min_pages_for_pool = min_pages_for_pool
+        self.memory_limit_mb = memory_limit_mb
+        self.max_tasks_per_worker = max_tasks_per_worker
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def iter_pages(self, path: str) -> Iterator[str]:
+        """
+        Yield the text of every page of a PDF file. Blocking; call it from a worker thread.
+
+        Args:
+            path: Path of the PDF file; worker processes open it by path
+
+        Returns:
+            Iterator over page texts in page order
+        """
+        total_pages = _count_pages(path)
+        if self.max_workers <= 1 or total_pages < self.min_pages_for_pool:
+            yield from _extract_pages(path, 0, total_pages)
+            return
+
+        next_page = 0
+        for attempt in range(2):
+            executor = self.__get_executor()
+            try:
+                for text in self.__iter_pool_pages(executor, path, next_page, total_pages):
+                    yield text
+                    next_page += 1
+                return
+            except BrokenProcessPool:
+                # A worker died (e.g. over its memory limit): the pool can't be used anymore, so it is
+                # replaced, and the rest of the document is retried once in the new pool
+                self.__discard_executor(executor)
+                if attempt:
+                    raise
+                logger.warning("PDF extraction pool broke at page %d of %s, retrying", next_page + 1, path)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def __iter_pool_pages(
+            self,
+            executor: ProcessPoolExecutor,
+            path: str,
+            first_page: int,
+            total_pages: int,
+    ) -> Iterator[str]:
+        ranges = iter(range(first_page, total_pages, self.pages_per_task))
+        pending: deque[Future] = deque()
+        try:
+            for start in ranges:
+                pending.append(executor.submit(_extract_page_range, path, start, start + self.pages_per_task))
+                if len(pending) >= 2 * self.max_workers:
+                    break
+            while pending:
+                pages = pending.popleft().result()
+                if (start := next(ranges, None)) is not None:
+                    pending.append(executor.submit(_extract_page_range, path, start, start + self.pages_per_task))
+                yield from pages
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def __discard_executor(self, executor: ProcessPoolExecutor) -> None:
+        with self._lock:
+            # Another thread may have replaced the broken pool already
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def __get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # Forking a process with running threads (event loop, model workers) may deadlock
+                methods = multiprocessing.get_all_start_methods()
+                context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=context,
+                    initializer=_init_worker,
+                    initargs=(self.memory_limit_mb,),
+                    max_tasks_per_child=self.max_tasks_per_worker
+                )
+                logger.info("Started PDF extraction pool with %d workers", self.max_workers)
+            return self._executor
+
+
+def _init_worker(memory_limit_mb: Optional[int]) -> None:
+    if memory_limit_mb:
+        try:
+            import resource
+            limit = memory_limit_mb * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        except (ImportError, ValueError, OSError) as e:
+            logger.warning("Unable to limit memory of PDF extraction worker: %s", e)
+
+
+def _count_pages(path: str) -> int:
+    import pdfplumber
+    with pdfplumber.open(path) as pdf:
+        return len(pdf.pages)
+
+
+# Document last opened by this worker process, reused by the next ranges of the same file
+_worker_document: Optional[tuple[tuple[str, int, int], Any]] = None
+
+
+def _extract_page_range(path: str, start: int, end: int) -> list[str]:
+    global _worker_document
+    import pdfplumber
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    if _worker_document is None or _worker_document[0] != key:
+        if _worker_document is not None:
+            _worker_document[1].close()
+            _worker_document = None
+        # Parsing the page tree of a long document costs as much as extracting a range of its pages
+        _worker_document = (key, pdfplumber.open(path))
+    pdf = _worker_document[1]
+    texts = []
+    for page in pdf.pages[start:end]:
+        texts.append(page.extract_text() or "")
+        page.close()
+    return texts
+
+
+def _extract_pages(path: str, start: int, end: int) -> Iterator[str]:
+    import pdfplumber
+    # Only the pages of the range are built, not the whole document
+    with pdfplumber.open(path, pages=list(range(start + 1, end + 1))) as pdf:
+        for page in pdf.pages:
+            text = page.extract_text() or ""
+            page.close()
+            yield text
@@ -1,7 +1,12 @@
-from typing import Optional
+import asyncio
+from typing import Any, Optional
 
 from aidial_sdk.chat_completion import Choice, Stage
 
+from task.utils.log import get_logger
+
+logger = get_logger(__name__)
+
 
 class StageProcessor:
 
@@ -12,8 +17,108 @@ class StageProcessor:
         return stage
 
     @staticmethod
-    def close_stage_safely(stage: Stage) -> None:
+    def close_stage_safely(stage: 'Stage | BufferedStage') -> None:
         try:
             stage.close()
         except Exception as e:
-            print("⚠️ Unable to close stage. ", e)
+            logger.warning("Unable to close stage: %s", e)
+
+
+class BufferedContentWriter:
+    """
+    Merges content appended to a `Choice` or `Stage` into fewer chunks.
+
+    The first content is written right away, so the time to first token doesn't change.
+    After that, content is buffered until `flush_interval` seconds pass or `max_buffer_chars`
+    characters are buffered. Content beyond `max_total_chars` is dropped, and `close`
+    reports how much was omitted.
+    """
+
+    def __init__(
+            self,
+            target: Choice | Stage,
+            flush_interval: float = 0.03,
+            max_buffer_chars: int = 2_048,
+            max_total_chars: Optional[int] = None,
+    ):
+        self.target = target
+        self.flush_interval = flush_interval
+        self.max_buffer_chars = max_buffer_chars
+        self.max_total_chars = max_total_chars
+        self._buffer: list[str] = []
+        self._buffered_chars = 0
+        self._written_chars = 0
+        self._omitted_chars = 0
+        self._chunks = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def append_content(self, content: str) -> None:
+        if self.max_total_chars is not None:
+            room = max(self.max_total_chars - self._written_chars - self._buffered_chars, 0)
+            if len(content) > room:
+                self._omitted_chars += len(content) - room
+                content = content[:room]
+        if not content:
+            return
+        self._buffer.append(content)
+        self._buffered_chars += len(content)
+        if self._chunks == 0 or self._buffered_chars >= self.max_buffer_chars or self.flush_interval <= 0:
+            self.flush()
+        elif self._timer is None:
+            self.__schedule_flush()
+
+    def flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._buffer:
+            return
+        content = "".join(self._buffer)
+        self._buffer.clear()
+        self._buffered_chars = 0
+        self._written_chars += len(content)
+        self._chunks += 1
+        self.target.append_content(content)
+
+    def close(self) -> None:
+        """Write the buffered content; the target itself stays open."""
+        self.flush()
+        if self._omitted_chars:
+            self.target.append_content(f"\n\r[{self._omitted_chars} more characters not shown]\n\r")
+            self._chunks += 1
+        logger.debug(
+            "Content writer closed",
+            extra={"chunks": self._chunks, "chars": self._written_chars, "omitted_chars": self._omitted_chars}
+        )
+
+    def __schedule_flush(self) -> None:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Outside the event loop the content is written by the size limit or on close
+            return
+        self._timer = loop.call_later(self.flush_interval, self.__flush_on_timer)
+
+    def __flush_on_timer(self) -> None:
+        self._timer = None
+        try:
+            self.flush()
+        except Exception as e:
+            logger.warning("Unable to write buffered content: %s", e)
+
+
+class BufferedStage(BufferedContentWriter):
+    """Stage with buffered content; closing it writes the rest of the content and closes the stage."""
+
+    def __init__(self, stage: Stage, **kwargs: Any):
+        super().__init__(stage, **kwargs)
+
+    def add_attachment(self, *args: Any, **kwargs: Any) -> None:
+        self.flush()
+        self.target.add_attachment(*args, **kwargs)
+
+    def close(self) -> None:
+        try:
+            super().close()
+        finally:
+            self.target.close()
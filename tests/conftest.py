@@ -0,0 +1,97 @@
+import logging
+import socket
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import pytest
+
+from task.utils.log import get_logger
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("localhost", 0))
+        return sock.getsockname()[1]
+
+
+@contextmanager
+def _run_stub_server(script: str, port: int):
+    process = subprocess.Popen(
+        [sys.executable, str(Path(__file__).with_name(script)), str(port)],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                socket.create_connection(("localhost", port), timeout=1).close()
+                break
+            except OSError:
+                if process.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError(f"Stub server {script} did not start")
+                time.sleep(0.1)
+        yield
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+@pytest.fixture
+def interpreter_server_url():
+    """URL of a fresh stub code interpreter MCP server (tests/mcp_stub_server.py)."""
+    port = _free_port()
+    with _run_stub_server("mcp_stub_server.py", port):
+        yield f"http://localhost:{port}/mcp"
+
+
+class RestartableServer:
+    """Stub server on a fixed port that can be restarted, so clients have to reconnect."""
+
+    def __init__(self, script: str, port: int):
+        self.script = script
+        self.port = port
+        self._server = None
+
+    def start(self) -> None:
+        self._server = _run_stub_server(self.script, self.port)
+        self._server.__enter__()
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.__exit__(None, None, None)
+            self._server = None
+
+    def restart(self) -> None:
+        self.stop()
+        self.start()
+
+
+@pytest.fixture
+def restartable_interpreter_server():
+    """Stub code interpreter MCP server that can be restarted on the same port."""
+    server = RestartableServer("mcp_stub_server.py", _free_port())
+    server.start()
+    try:
+        yield server
+    finally:
+        server.stop()
+
+
+@pytest.fixture
+def dial_server_url():
+    """URL of a fresh stub DIAL server (tests/dial_stub_server.py)."""
+    port = _free_port()
+    with _run_stub_server("dial_stub_server.py", port):
+        yield f"http://localhost:{port}"
+
+
+@pytest.fixture
+def benchmark_logger() -> logging.Logger:
+    """Logger for benchmark results: shown with `--log-cli-level=INFO` and in the captured log of failed tests."""
+    logger = get_logger("benchmark")
+    logger.setLevel(logging.INFO)
+    return logger
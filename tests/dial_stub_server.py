@@ -0,0 +1,84 @@
+"""
+Minimal DIAL chat completions server for tests: `python tests/dial_stub_server.py <port>`.
+
+Deployment `echo` streams "ok". Deployment `agent` streams two tool calls: `slow` with complete
+arguments first, then `fast`, whose arguments arrive over `ARGUMENT_STREAM_SECONDS`. Once the
+conversation has tool results or no tools are offered, it streams the final answer instead.
+`GET /stats` reports the TCP connections, API keys and request bodies seen.
+"""
+import asyncio
+import json
+import sys
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+ARGUMENT_STREAM_SECONDS = 0.4
+_ARGUMENT_CHUNKS = 8
+
+app = FastAPI()
+_connections: set[tuple[str, int]] = set()
+_api_keys: set[str] = set()
+_requests: list[dict] = []
+
+
+def _chunk(delta: dict, finish_reason: str | None = None) -> str:
+    payload = {
+        "id": "chatcmpl-stub",
+        "object": "chat.completion.chunk",
+        "created": 0,
+        "model": "stub",
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+    return f"data: {json.dumps(payload)}\n\n"
+
+
+def _tool_call(index: int, call_id: str, name: str, arguments: str) -> dict:
+    return {"index": index, "id": call_id, "type": "function", "function": {"name": name, "arguments": arguments}}
+
+
+async def _agent_stream(body: dict):
+    if not body.get("tools") or any(message["role"] == "tool" for message in body["messages"]):
+        for token in ["Done", "."]:
+            yield _chunk({"role": "assistant", "content": token})
+        yield _chunk({}, "stop")
+        return
+    yield _chunk({"role": "assistant", "tool_calls": [_tool_call(0, "call_slow", "slow", '{"n": 1}')]})
+    yield _chunk({"tool_calls": [_tool_call(1, "call_fast", "fast", "")]})
+    pieces = ['{"text": "', *["x" * 8] * (_ARGUMENT_CHUNKS - 2), '"}']
+    for piece in pieces:
+        await asyncio.sleep(ARGUMENT_STREAM_SECONDS / len(pieces))
+        yield _chunk({"tool_calls": [{"index": 1, "function": {"arguments": piece}}]})
+    yield _chunk({}, "tool_calls")
+
+
+async def _echo_stream():
+    yield _chunk({"role": "assistant", "content": "ok"})
+    yield _chunk({}, "stop")
+
+
+async def _with_done(stream):
+    async for event in stream:
+        yield event
+    yield "data: [DONE]\n\n"
+
+
+@app.post("/openai/deployments/{deployment}/chat/completions")
+async def chat_completions(deployment: str, request: Request):
+    client = request.scope["client"]
+    _connections.add((client[0], client[1]))
+    _api_keys.add(request.headers.get("api-key", ""))
+    body = await request.json()
+    _requests.append(body)
+    stream = _agent_stream(body) if deployment == "agent" else _echo_stream()
+    return StreamingResponse(_with_done(stream), media_type="text/event-stream")
+
+
+@app.get("/stats")
+async def stats():
+    return {"connections": len(_connections), "api_keys": sorted(_api_keys), "requests": _requests}
+
+
+if __name__ == "__main__":
+    uvicorn.run(app, port=int(sys.argv[1]), log_level="warning")
@@ -0,0 +1,46 @@
+"""
+Minimal code interpreter MCP server for tests: `python tests/mcp_stub_server.py <port>`.
+
+Code is not run; the server only records which code reached which session.
+"""
+import itertools
+import json
+import sys
+
+from mcp.server.fastmcp import FastMCP
+
+mcp = FastMCP("interpreter-stub", port=int(sys.argv[1]), log_level="WARNING")
+_session_ids = itertools.count(1)
+_sessions: dict[int, list[str]] = {}
+_closed: list[int] = []
+
+
+@mcp.tool()
+def execute_code(code: str, session_id: int = 0) -> str:
+    """Run Python code in a session; a new session is started if session_id is 0."""
+    if not session_id:
+        session_id = next(_session_ids)
+    _sessions.setdefault(session_id, []).append(code)
+    return json.dumps({
+        "success": True,
+        "output": [code],
+        "session_info": {"session_id": str(session_id)},
+    })
+
+
+@mcp.tool()
+def close_session(session_id: int) -> str:
+    """Close a session."""
+    _sessions.pop(session_id, None)
+    _closed.append(session_id)
+    return "closed"
+
+
+@mcp.tool()
+def session_stats() -> str:
+    """Code received by every open session, and the closed session IDs."""
+    return json.dumps({"sessions": _sessions, "closed": _closed})
+
+
+if __name__ == "__main__":
+    mcp.run(transport="streamable-http")
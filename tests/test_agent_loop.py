@@ -0,0 +1,156 @@
+import asyncio
+import json
+from types import SimpleNamespace
+from typing import Any
+
+import httpx
+from aidial_sdk.chat_completion import Message, Role
+
+from task.agent import GeneralPurposeAgent
+from task.prompts import FINAL_ROUND_PROMPT
+from task.tools.base import BaseTool
+from task.tools.models import ToolCallParams
+from task.tools.registry import ToolCatalog
+from task.tools.scheduler import ToolScheduler
+from task.utils.context import ContextManager
+from dial_stub_server import ARGUMENT_STREAM_SECONDS
+
+_SLOW_TOOL_SECONDS = 0.3
+
+
+class _SleepTool(BaseTool):
+
+    def __init__(self, name: str, seconds: float):
+        self._name = name
+        self.seconds = seconds
+
+    async def _execute(self, tool_call_params: ToolCallParams) -> str:
+        await asyncio.sleep(self.seconds)
+        return f"{self.name} finished"
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def description(self) -> str:
+        return f"Sleeps {self.seconds}s"
+
+    @property
+    def parameters(self) -> dict[str, Any]:
+        return {"type": "object", "properties": {}}
+
+
+class _Stage:
+
+    def __init__(self):
+        self.content = ""
+
+    def open(self) -> None:
+        pass
+
+    def append_content(self, content: str) -> None:
+        self.content += content
+
+    def add_attachment(self, *args, **kwargs) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class _Choice:
+
+    def __init__(self):
+        self.content = ""
+        self.stages: dict[str, _Stage] = {}
+        self.state = None
+
+    def append_content(self, content: str) -> None:
+        self.content += content
+
+    def create_stage(self, name: str) -> _Stage:
+        return self.stages.setdefault(name, _Stage())
+
+    def set_state(self, state: Any) -> None:
+        self.state = state
+
+
+def _agent(endpoint: str, max_rounds: int = 10) -> GeneralPurposeAgent:
+    tools = [_SleepTool("slow", _SLOW_TOOL_SECONDS), _SleepTool("fast", 0.0)]
+    return GeneralPurposeAgent(
+        endpoint=endpoint,
+        system_prompt="You are a test agent.",
+        tool_catalog=ToolCatalog.build(1, tools),
+        tool_scheduler=ToolScheduler({}),
+        context_manager=ContextManager({}),
+        max_rounds=max_rounds,
+        output_flush_interval=0
+    )
+
+
+def _request() -> SimpleNamespace:
+    return SimpleNamespace(
+        api_key="key",
+        api_version="2025-01-01-preview",
+        messages=[Message(role=Role.USER, content="Run the tools")],
+        headers={}
+    )
+
+
+def _sent_requests(endpoint: str) -> list[dict]:
+    return httpx.get(f"{endpoint}/stats").json()["requests"]
+
+
+def test_tools_run_while_the_model_is_still_streaming(dial_server_url, benchmark_logger):
+    agent = _agent(dial_server_url)
+    choice = _Choice()
+    message = asyncio.run(agent.handle_request("agent", choice, _request(), None))
+
+    assert message.content == "Done."
+    assert [timing.tool_calls for timing in agent.round_timings] == [2, 0]
+    first_round = agent.round_timings[0]
+    # Waiting for the stream to end before starting the tools would take the stream plus the slow tool
+    sequential_time = first_round.llm_time + _SLOW_TOOL_SECONDS
+    saved = sequential_time - first_round.total_time
+    benchmark_logger.info(
+        "Round 1: %.3fs, dispatch after the stream: %.3fs, saved %.3fs",
+        first_round.total_time, sequential_time, saved
+    )
+    assert first_round.llm_time >= ARGUMENT_STREAM_SECONDS
+    assert first_round.tool_wait_time < 0.1
+    assert saved > _SLOW_TOOL_SECONDS - 0.1
+
+    # The second round got the tool results in call order, after the prepared messages
+    sent = _sent_requests(dial_server_url)[1]["messages"]
+    assert [message["role"] for message in sent] == ["system", "user", "assistant", "tool", "tool"]
+    assert [message["content"] for message in sent[3:]] == ["slow finished", "fast finished"]
+    assert json.loads(sent[2]["tool_calls"][1]["function"]["arguments"]) == {"text": "x" * 48}
+    assert [message["role"] for message in choice.state["tool_call_history"]] == ["assistant", "tool", "tool"]
+    assert set(choice.stages) == {"slow", "fast"}
+
+
+def test_last_round_keeps_the_tools_and_asks_for_an_answer(dial_server_url):
+    agent = _agent(dial_server_url, max_rounds=2)
+    message = asyncio.run(agent.handle_request("agent", _Choice(), _request(), None))
+
+    assert message.content == "Done."
+    sent = _sent_requests(dial_server_url)
+    assert [bool(request.get("tools")) for request in sent] == [True, True]
+    assert sent[1]["messages"][-1] == {"role": "user", "content": FINAL_ROUND_PROMPT}
+    assert FINAL_ROUND_PROMPT not in json.dumps(sent[0]["messages"])
+
+
+def test_tool_calls_of_the_last_round_are_not_run(dial_server_url):
+    # Without tool results in the history the stub model keeps calling tools
+    agent = _agent(dial_server_url, max_rounds=1)
+    choice = _Choice()
+    message = asyncio.run(agent.handle_request("agent", choice, _request(), None))
+
+    assert not message.tool_calls
+    assert [timing.tool_calls for timing in agent.round_timings] == [0]
+    assert choice.stages == {}
+    assert choice.state["tool_call_history"] == []
+    sent = _sent_requests(dial_server_url)
+    assert len(sent) == 1
+    assert sent[0]["tools"]
@@ -0,0 +1,54 @@
+import os
+
+from task.utils import blob_store as blob_store_module
+from task.utils.blob_store import BlobStore
+
+
+def _blob(i: int) -> str:
+    return f"{i:04d}" * 25
+
+
+def test_directory_is_created_by_the_first_write(tmp_path):
+    store = BlobStore(tmp_path / "blobs")
+    assert not (tmp_path / "blobs").exists()
+    assert store.get("sha256:" + "0" * 64) is None
+
+    ref = store.put("text")
+    assert (tmp_path / "blobs").is_dir()
+    assert BlobStore(tmp_path / "blobs").get(ref) == "text"
+
+
+def test_eviction_removes_least_recently_read_blobs(tmp_path):
+    store = BlobStore(tmp_path, max_bytes=500, cache_max_bytes=0)
+    refs = [store.put(_blob(i)) for i in range(5)]
+    store.get(refs[0])
+
+    store.put(_blob(5))
+    assert store.get(refs[1]) is None
+    assert [store.get(ref) for ref in (refs[0], *refs[2:])] == [_blob(0), *map(_blob, range(2, 5))]
+
+
+def test_writes_do_not_scan_the_store(tmp_path, monkeypatch):
+    scans = []
+    scandir = os.scandir
+    monkeypatch.setattr(blob_store_module.os, "scandir", lambda path: scans.append(path) or scandir(path))
+
+    store = BlobStore(tmp_path, max_bytes=100 * 16 * 10)
+    for i in range(100):
+        store.put(_blob(i))
+    # One scan on the first write, then one per max_bytes / 16 written
+    assert len(scans) <= 1 + 100 // 10
+
+
+def test_blobs_of_other_workers_count_after_a_rescan(tmp_path):
+    worker = BlobStore(tmp_path, max_bytes=1_600, cache_max_bytes=0)
+    other = BlobStore(tmp_path, max_bytes=1_600, cache_max_bytes=0)
+    worker.put(_blob(0))
+    other_refs = [other.put(_blob(i)) for i in range(1, 16)]
+
+    # The next write rescans the directory and evicts the oldest blobs of both workers
+    for i in range(16, 20):
+        worker.put(_blob(i))
+    blobs = [name for name in os.listdir(tmp_path) if not name.startswith(".")]
+    assert len(blobs) * 100 <= 1_600
+    assert other.get(other_refs[0]) is None
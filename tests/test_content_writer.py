@@ -0,0 +1,46 @@
+import asyncio
+
+from task.utils.stage import BufferedContentWriter
+
+_TOKENS = [f"token{i} " for i in range(1_000)]
+_TOKEN_INTERVAL = 0.001
+
+
+class _CountingChoice:
+    """Stands in for a `Choice`: every `append_content` call would be one SSE chunk."""
+
+    def __init__(self):
+        self.chunks: list[str] = []
+
+    def append_content(self, content: str) -> None:
+        self.chunks.append(content)
+
+
+async def _stream(writer: BufferedContentWriter | _CountingChoice) -> None:
+    for token in _TOKENS:
+        writer.append_content(token)
+        await asyncio.sleep(_TOKEN_INTERVAL)
+
+
+def test_buffering_merges_streamed_tokens(benchmark_logger):
+    unbuffered = _CountingChoice()
+    asyncio.run(_stream(unbuffered))
+
+    async def run_buffered() -> _CountingChoice:
+        choice = _CountingChoice()
+        writer = BufferedContentWriter(choice)
+        await _stream(writer)
+        writer.close()
+        return choice
+
+    buffered = asyncio.run(run_buffered())
+    benchmark_logger.info(
+        "%d streamed tokens: %d chunks without buffering, %d with buffering",
+        len(_TOKENS), len(unbuffered.chunks), len(buffered.chunks)
+    )
+
+    assert "".join(buffered.chunks) == "".join(unbuffered.chunks) == "".join(_TOKENS)
+    # The first token isn't delayed
+    assert buffered.chunks[0] == _TOKENS[0]
+    assert len(unbuffered.chunks) == len(_TOKENS)
+    assert len(buffered.chunks) < len(_TOKENS) // 10
@@ -0,0 +1,62 @@
+import io
+
+import pandas as pd
+
+from task.utils import csv_reader
+
+
+def _csv(rows: int) -> bytes:
+    lines = ['id,name,note']
+    for i in range(rows):
+        # Quoted values with line breaks, commas and escaped quotes must stay in one row
+        note = f'"line one\nline ""two"", {i}"' if i % 7 == 0 else f"plain {i}"
+        lines.append(f"{i},name {i},{note}")
+        if i % 50 == 0:
+            lines.append("")
+    return ("\n".join(lines) + "\n").encode()
+
+
+def _pages(content: bytes, page_size: int) -> list[str]:
+    file = io.BytesIO(content)
+    layout = csv_reader.scan_layout(file, page_size=page_size)
+    pages = []
+    for page in range(1, layout.total_pages + 1):
+        start, end = layout.page_range(page)
+        pages.append(csv_reader.render_rows(layout, content[start:end]))
+    return pages
+
+
+def test_pages_cover_every_row_once_in_order():
+    content = _csv(1_000)
+    layout = csv_reader.scan_layout(io.BytesIO(content), page_size=2_000)
+    assert layout.rows == 1_000
+    assert layout.total_pages > 10
+
+    frames = [
+        pd.read_csv(io.BytesIO(layout.header + content[slice(*layout.page_range(page))]), dtype=str)
+        for page in range(1, layout.total_pages + 1)
+    ]
+    combined = pd.concat(frames, ignore_index=True)
+    expected = pd.read_csv(io.BytesIO(content), dtype=str)
+    pd.testing.assert_frame_equal(combined, expected)
+    assert all(len(frame) == layout.schema.rows_per_page for frame in frames[:-1])
+
+
+def test_page_out_of_range():
+    layout = csv_reader.scan_layout(io.BytesIO(_csv(10)))
+    assert layout.total_pages == 1
+    assert layout.page_range(0) is None
+    assert layout.page_range(2) is None
+
+
+def test_header_only_file_has_one_empty_page():
+    layout = csv_reader.scan_layout(io.BytesIO(b"id,name\n"))
+    assert layout.rows == 0
+    assert layout.total_pages == 1
+    assert layout.page_range(1) is None
+
+
+def test_rendered_page_matches_whole_table():
+    content = _csv(30)
+    pages = _pages(content, page_size=100_000)
+    assert pages == [pd.read_csv(io.BytesIO(content), dtype=str).to_markdown(index=False)]
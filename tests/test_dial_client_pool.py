@@ -0,0 +1,55 @@
+import asyncio
+import time
+
+import httpx
+
+from task.utils.dial_client_factory import DialClientFactory
+
+_REQUESTS = 100
+_CONCURRENCY = 10
+
+
+async def _run_load(factory: DialClientFactory, endpoint: str) -> float:
+    semaphore = asyncio.Semaphore(_CONCURRENCY)
+
+    async def chat(i: int) -> str:
+        async with semaphore:
+            # Like the agent, every request gets its own client with its own API key
+            client = factory.create_async_client(endpoint, f"key-{i}")
+            stream = await client.chat.completions.create(
+                messages=[{"role": "user", "content": "hi"}],
+                deployment_name="echo",
+                stream=True
+            )
+            return "".join([chunk.choices[0].delta.content or "" async for chunk in stream if chunk.choices])
+
+    try:
+        # The first request of the process also pays for client imports, so it is not timed
+        await chat(_REQUESTS)
+        started_at = time.perf_counter()
+        assert await asyncio.gather(*(chat(i) for i in range(_REQUESTS))) == ["ok"] * _REQUESTS
+        return time.perf_counter() - started_at
+    finally:
+        await factory.aclose()
+
+
+def _stats(endpoint: str) -> dict:
+    return httpx.get(f"{endpoint}/stats").json()
+
+
+def test_requests_reuse_pooled_connections(dial_server_url, benchmark_logger):
+    elapsed = asyncio.run(_run_load(DialClientFactory(max_keepalive_connections=20), dial_server_url))
+    stats = _stats(dial_server_url)
+    benchmark_logger.info("Pooled: %d requests over %d connections in %.3fs", _REQUESTS, stats["connections"], elapsed)
+
+    assert stats["connections"] <= _CONCURRENCY
+    # One pool serves all API keys, each request is sent with its own
+    assert stats["api_keys"] == sorted(f"key-{i}" for i in range(_REQUESTS + 1))
+
+
+def test_requests_without_keep_alive_open_a_connection_each(dial_server_url, benchmark_logger):
+    elapsed = asyncio.run(_run_load(DialClientFactory(max_keepalive_connections=0), dial_server_url))
+    connections = _stats(dial_server_url)["connections"]
+    benchmark_logger.info("Without keep-alive: %d requests over %d connections in %.3fs", _REQUESTS, connections, elapsed)
+
+    assert connections == _REQUESTS + 1
@@ -0,0 +1,53 @@
+from datetime import timedelta
+
+import faiss
+import numpy as np
+import pytest
+
+from task.tools.rag.document_cache import DocumentCache
+from task.tools.rag.index_factory import IndexConfig, create_index
+from task.tools.rag.index_store import PersistentIndexStore
+
+
+@pytest.mark.parametrize(("backend", "size"), [("flat", 500), ("hnsw", 500), ("ivfpq", 2_000)])
+def test_entry_size_matches_serialized_index(backend, size):
+    embeddings = np.random.default_rng(0).random((size, 64), dtype='float32')
+    index = create_index(embeddings, IndexConfig(backend=backend, pq_m=8))
+
+    serialized = faiss.serialize_index(index).nbytes
+    assert DocumentCache._entry_size(index, []) == pytest.approx(serialized, rel=0.05)
+    assert DocumentCache._entry_size(index, ["ab", "ü"]) == DocumentCache._entry_size(index, []) + 4
+
+
+def test_evicts_least_recently_used_over_budget():
+    index = create_index(np.ones((10, 8), dtype='float32'), IndexConfig(backend="flat"))
+    entry_size = DocumentCache._entry_size(index, ["chunk"])
+    cache = DocumentCache(max_bytes=2 * entry_size, ttl=timedelta(hours=1))
+
+    cache.set("a", index, ["chunk"])
+    cache.set("b", index, ["chunk"])
+    assert cache.get("a") is not None
+    cache.set("c", index, ["chunk"])
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.stats()["bytes"] == 2 * entry_size
+
+
+def test_file_versions_are_found_by_a_new_instance(tmp_path):
+    index = create_index(np.ones((10, 8), dtype='float32'), IndexConfig(backend="flat"))
+    cache = DocumentCache(store=PersistentIndexStore(tmp_path, model_version="m1"))
+    cache.set("key", index, ["chunk"])
+    cache.add_source("key", "files/a.pdf", "v1", "hash-1")
+    assert cache.find_content_hash("files/a.pdf", "v1") == "hash-1"
+
+    # After a restart the file version still leads to the stored index without a download
+    restarted = DocumentCache(store=PersistentIndexStore(tmp_path, model_version="m1"))
+    assert restarted.find_content_hash("files/a.pdf", "v1") == "hash-1"
+    assert restarted.find_content_hash("files/a.pdf", "v2") is None
+
+    # A new version of the file replaces the old one
+    restarted.add_source("key", "files/a.pdf", "v2", "hash-1")
+    assert DocumentCache(store=PersistentIndexStore(tmp_path, model_version="m1")).find_content_hash(
+        "files/a.pdf", "v1"
+    ) is None
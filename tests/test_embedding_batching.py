@@ -0,0 +1,70 @@
+import asyncio
+import sys
+import threading
+import time
+from types import ModuleType
+
+import numpy as np
+import pytest
+
+from task.tools.rag.embedding_executor import EmbeddingExecutor
+
+_DIMENSION = 8
+_CALLERS = 256
+_CALL_OVERHEAD = 0.002
+_TEXT_COST = 0.00005
+
+
+class _SlowModel:
+    """Stands in for SentenceTransformer: every `encode` call has a fixed overhead and a per-text cost."""
+
+    def __init__(self, model_name: str, device: str):
+        self.batch_sizes: list[int] = []
+        self._lock = threading.Lock()
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return _DIMENSION
+
+    def encode(self, texts: list[str], batch_size: int, convert_to_numpy: bool) -> np.ndarray:
+        with self._lock:
+            self.batch_sizes.append(len(texts))
+        # Sleeping releases the GIL like the native kernels of torch do
+        time.sleep(_CALL_OVERHEAD + _TEXT_COST * len(texts))
+        return np.ones((len(texts), _DIMENSION))
+
+
+@pytest.fixture(autouse=True)
+def slow_model(monkeypatch):
+    module = ModuleType("sentence_transformers")
+    module.SentenceTransformer = _SlowModel
+    monkeypatch.setitem(sys.modules, "sentence_transformers", module)
+
+
+def _measure(**executor_args) -> tuple[float, list[int]]:
+    async def run():
+        executor = EmbeddingExecutor(max_pending=_CALLERS, **executor_args)
+        try:
+            started_at = time.perf_counter()
+            results = await asyncio.gather(*(executor.encode([f"query {i}"]) for i in range(_CALLERS)))
+            elapsed = time.perf_counter() - started_at
+        finally:
+            executor.shutdown()
+        assert [result.shape for result in results] == [(1, _DIMENSION)] * _CALLERS
+        return _CALLERS / elapsed, executor.model.batch_sizes
+
+    return asyncio.run(run())
+
+
+def test_micro_batching_of_concurrent_queries(benchmark_logger):
+    unbatched_throughput, unbatched_calls = _measure(max_batch_size=1)
+    batched_throughput, batched_calls = _measure(max_batch_size=64, max_batch_wait=0.005)
+    benchmark_logger.info(
+        "%d concurrent single-query callers: %.0f texts/s in %d encode calls without batching, "
+        "%.0f texts/s in %d encode calls with batching",
+        _CALLERS, unbatched_throughput, len(unbatched_calls), batched_throughput, len(batched_calls)
+    )
+
+    assert sum(unbatched_calls) == sum(batched_calls) == _CALLERS
+    assert len(unbatched_calls) == _CALLERS
+    assert len(batched_calls) <= _CALLERS // 64 + 1
+    assert batched_throughput > 3 * unbatched_throughput
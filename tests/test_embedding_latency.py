@@ -0,0 +1,56 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+pytest.importorskip("sentence_transformers")
+
+from task.tools.rag.embedding_executor import EmbeddingExecutor
+from task.tools.rag.index_factory import IndexConfig
+
+_TOKEN_INTERVAL = 0.01
+_CHAT_COUNT = 20
+_DOCUMENT_COUNT = 3
+_DOCUMENT_CHUNKS = 2_000
+_CHUNKS_PER_STEP = 256
+
+
+async def _stream_chat(done: asyncio.Event, lateness: list[float]) -> None:
+    """An unrelated chat streaming one token every 10 ms; records how late each token is."""
+    loop = asyncio.get_running_loop()
+    while not done.is_set():
+        expected = loop.time() + _TOKEN_INTERVAL
+        await asyncio.sleep(_TOKEN_INTERVAL)
+        lateness.append(loop.time() - expected)
+
+
+async def _index_document(executor: EmbeddingExecutor, document: int) -> int:
+    chunks = [f"Document {document}, section {i}: the microwave reheats food evenly." for i in range(_DOCUMENT_CHUNKS)]
+    builder = executor.create_index_builder(IndexConfig())
+    for start in range(0, len(chunks), _CHUNKS_PER_STEP):
+        await executor.add_to_index(builder, chunks[start:start + _CHUNKS_PER_STEP])
+    return (await executor.finish_index(builder)).ntotal
+
+
+def test_indexing_large_documents_keeps_chat_streaming_p99_low(benchmark_logger):
+    async def run():
+        executor = EmbeddingExecutor()
+        done = asyncio.Event()
+        lateness: list[float] = []
+        chats = [asyncio.create_task(_stream_chat(done, lateness)) for _ in range(_CHAT_COUNT)]
+        try:
+            sizes = await asyncio.gather(*(_index_document(executor, i) for i in range(_DOCUMENT_COUNT)))
+        finally:
+            done.set()
+            await asyncio.gather(*chats)
+            executor.shutdown()
+        return sizes, lateness
+
+    sizes, lateness = asyncio.run(run())
+    p50, p99 = np.percentile(lateness, [50, 99]) * 1000
+    benchmark_logger.info(
+        "Token lateness while indexing: p50 %.1f ms, p99 %.1f ms over %d tokens", p50, p99, len(lateness)
+    )
+
+    assert sizes == [_DOCUMENT_CHUNKS] * _DOCUMENT_COUNT
+    assert p99 < 50
@@ -0,0 +1,132 @@
+import asyncio
+import hashlib
+import io
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+
+from task.utils.dial_file_conent_extractor import DialFileContentExtractor, DownloadedFile
+from task.utils.extracted_text_cache import ExtractedTextCache
+
+
+class _LocalExtractor(DialFileContentExtractor):
+    """Serves files from memory instead of DIAL storage."""
+
+    def __init__(self, files: dict[str, bytes], text_cache: ExtractedTextCache):
+        super().__init__("http://localhost:8080", "key", text_cache)
+        self.files = files
+        self.downloads = 0
+        self.range_reads = 0
+
+    async def get_etag(self, file_url: str) -> str:
+        return hashlib.sha256(self.files[file_url]).hexdigest()
+
+    async def download(self, file_url: str) -> DownloadedFile:
+        self.downloads += 1
+        content = self.files[file_url]
+        return DownloadedFile(
+            filename=file_url,
+            extension="." + file_url.rsplit(".", 1)[-1],
+            content=io.BytesIO(content),
+            content_hash=hashlib.sha256(content).hexdigest(),
+            etag=await self.get_etag(file_url)
+        )
+
+    async def download_range(self, file_url: str, start: int, end: int, etag: str) -> bytes | None:
+        self.range_reads += 1
+        if etag != await self.get_etag(file_url):
+            return None
+        return self.files[file_url][start:end]
+
+
+def _csv(rows: int, broken_row: int | None = None) -> bytes:
+    lines = ["id,name"]
+    for i in range(rows):
+        lines.append(f"{i},name {i},unexpected" if i == broken_row else f"{i},name {i}")
+    return "\n".join(lines).encode()
+
+
+def test_text_is_cached_by_etag():
+    async def run():
+        extractor = _LocalExtractor({"report.csv": _csv(10)}, ExtractedTextCache())
+        first = await extractor.get_extracted_text("report.csv")
+        second = await extractor.get_extracted_text("report.csv")
+        assert "name 9" in first.text
+        assert second is first
+        assert extractor.downloads == 1
+
+    asyncio.run(run())
+
+
+def test_error_after_partial_text_is_raised_and_not_cached():
+    async def run():
+        # The first chunk of rows renders, the malformed row in the second chunk fails
+        extractor = _LocalExtractor({"report.csv": _csv(3_000, broken_row=2_500)}, ExtractedTextCache())
+        for _ in range(2):
+            with pytest.raises(pd.errors.ParserError):
+                await extractor.get_extracted_text("report.csv")
+        assert extractor.downloads == 2
+        assert extractor.text_cache.stats()["entries"] == 0
+
+    asyncio.run(run())
+
+
+def test_unreadable_file_gives_empty_text_that_is_not_cached():
+    async def run():
+        extractor = _LocalExtractor({"scan.pdf": b"not a pdf"}, ExtractedTextCache())
+        assert (await extractor.get_extracted_text("scan.pdf")).text == ""
+        assert extractor.text_cache.stats()["entries"] == 0
+
+    asyncio.run(run())
+
+
+def test_csv_pages_after_the_first_read_only_their_range():
+    async def run():
+        content = _csv(5_000)
+        extractor = _LocalExtractor({"report.csv": content}, ExtractedTextCache())
+        first, total_pages = await extractor.get_csv_page("report.csv", 1)
+        assert total_pages > 3
+        last, _ = await extractor.get_csv_page("report.csv", total_pages)
+        missing, _ = await extractor.get_csv_page("report.csv", total_pages + 1)
+
+        assert (extractor.downloads, extractor.range_reads) == (1, 1)
+        assert "name 0 " in first and "name 4999 " in last
+        assert missing == ""
+
+        # A new version of the file is scanned again
+        extractor.files["report.csv"] = _csv(10)
+        page, total_pages = await extractor.get_csv_page("report.csv", 1)
+        assert total_pages == 1 and "name 9 " in page
+        assert extractor.downloads == 2
+
+    asyncio.run(run())
+
+
+def test_csv_is_detected_by_storage_metadata():
+    metadata = {
+        "files/b/export": SimpleNamespace(name="export", content_type="text/csv; charset=utf-8", etag="1"),
+        "files/b/data.CSV": SimpleNamespace(name="data.CSV", content_type="application/octet-stream", etag="2"),
+        "files/b/notes.csv.txt": SimpleNamespace(name="notes.csv.txt", content_type="text/plain", etag="3"),
+    }
+    requests = []
+
+    async def get_metadata(file_url: str):
+        requests.append(file_url)
+        if file_url not in metadata:
+            raise RuntimeError("Storage is unavailable")
+        return metadata[file_url]
+
+    async def run():
+        extractor = DialFileContentExtractor("http://localhost:8080", "key")
+        extractor.dial_client = SimpleNamespace(files=SimpleNamespace(get_metadata=get_metadata))
+        assert await extractor.is_csv("files/b/export")
+        assert await extractor.is_csv("files/b/data.CSV")
+        assert not await extractor.is_csv("files/b/notes.csv.txt")
+        # Without metadata the URL decides
+        assert await extractor.is_csv("files/b/report.csv")
+        # The metadata is fetched once for the type and the ETag
+        assert await extractor.get_etag("files/b/export") == "1"
+        assert requests == ["files/b/export", "files/b/data.CSV", "files/b/notes.csv.txt", "files/b/report.csv"]
+
+    asyncio.run(run())
@@ -0,0 +1,56 @@
+import time
+
+import numpy as np
+import pytest
+
+from task.tools.rag.index_factory import IndexConfig, create_index, prepare_query
+
+_DIMENSION = 64
+_CORPUS_SIZE = 10_000
+_QUERIES = 200
+_K = 10
+
+
+@pytest.fixture(scope="module")
+def embeddings() -> tuple[np.ndarray, np.ndarray]:
+    """Clustered vectors, like embeddings of chunks about a limited set of topics."""
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(100, _DIMENSION))
+    corpus = centers[rng.integers(0, 100, _CORPUS_SIZE)] + rng.normal(scale=0.5, size=(_CORPUS_SIZE, _DIMENSION))
+    queries = centers[rng.integers(0, 100, _QUERIES)] + rng.normal(scale=0.5, size=(_QUERIES, _DIMENSION))
+    return corpus.astype('float32'), queries.astype('float32')
+
+
+@pytest.fixture(scope="module")
+def exact_results(embeddings) -> list[set[int]]:
+    return _search_one_by_one("flat", embeddings)[0]
+
+
+def _search_one_by_one(backend: str, embeddings: tuple[np.ndarray, np.ndarray]) -> tuple[list[set[int]], np.ndarray]:
+    corpus, queries = embeddings
+    config = IndexConfig(backend=backend, pq_m=8)
+    index = create_index(corpus, config)
+    queries = prepare_query(queries, config)
+    results, latencies = [], []
+    for i in range(len(queries)):
+        started_at = time.perf_counter()
+        _, ids = index.search(queries[i:i + 1], _K)
+        latencies.append(time.perf_counter() - started_at)
+        results.append(set(ids[0].tolist()))
+    return results, np.array(latencies)
+
+
+@pytest.mark.parametrize(("backend", "min_recall"), [("flat", 1.0), ("hnsw", 0.9), ("ivfpq", 0.3)])
+def test_recall_and_latency_against_flat(backend, min_recall, embeddings, exact_results, benchmark_logger):
+    results, latencies = _search_one_by_one(backend, embeddings)
+
+    recall = np.mean([len(found & expected) / _K for found, expected in zip(results, exact_results)])
+    p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+    benchmark_logger.info(
+        "%s over %d vectors: recall@%d %.3f, search p50 %.3f ms, p99 %.3f ms",
+        backend, _CORPUS_SIZE, _K, recall, p50, p99
+    )
+
+    # IVF-PQ trades recall for memory: its codes are 8 bytes instead of 256 per vector
+    assert recall >= min_recall
+    assert p99 < 50
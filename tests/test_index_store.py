@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+from task.tools.rag.index_factory import IndexConfig, create_index, prepare_query
+from task.tools.rag.index_store import PersistentIndexStore
+
+_DIMENSION = 64
+
+
+@pytest.mark.parametrize(("backend", "size", "index_type"), [
+    ("flat", 300, "IndexFlat"),
+    ("hnsw", 300, "IndexHNSWFlat"),
+    ("ivfpq", 2_000, "IndexIVFPQ"),
+])
+def test_round_trip_per_backend(tmp_path, backend, size, index_type):
+    config = IndexConfig(backend=backend, pq_m=8)
+    embeddings = np.random.default_rng(0).random((size, _DIMENSION), dtype='float32')
+    index = create_index(embeddings, config)
+    assert type(index).__name__ == index_type
+    chunks = [f"chunk {i} ✓" for i in range(size)]
+
+    PersistentIndexStore(tmp_path, model_version="m1").put("key", index, chunks)
+    # A new store instance reads the entry back, as another worker or a restarted app would
+    stored = PersistentIndexStore(tmp_path, model_version="m1").get("key")
+
+    assert stored is not None
+    loaded, loaded_chunks, size_bytes = stored
+    assert loaded.ntotal == size
+    assert size_bytes > 0
+    assert list(loaded_chunks) == chunks
+    queries = prepare_query(embeddings[:5], config)
+    np.testing.assert_array_equal(loaded.search(queries, 3)[1], index.search(queries, 3)[1])
+
+
+def test_other_model_version_misses(tmp_path):
+    index = create_index(np.ones((2, _DIMENSION), dtype='float32'), IndexConfig(backend="flat"))
+    PersistentIndexStore(tmp_path, model_version="m1").put("key", index, ["a", "b"])
+
+    assert PersistentIndexStore(tmp_path, model_version="m2").get("key") is None
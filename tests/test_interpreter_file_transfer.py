@@ -0,0 +1,79 @@
+import asyncio
+import itertools
+from pathlib import PurePosixPath
+from types import SimpleNamespace
+
+from task.tools.mcp.mcp_tool_model import MCPToolModel
+from task.tools.py_interpreter._response import _FileReference
+from task.tools.py_interpreter.python_code_interpreter_tool import PythonCodeInterpreterTool
+
+
+class _Storage:
+    """In-memory DIAL file storage with a new ETag for every write."""
+
+    def __init__(self):
+        self.files: dict[str, tuple[bytes, str]] = {}
+        self.uploads = 0
+        self._etags = itertools.count(1)
+
+    async def upload(self, url: str, file: tuple) -> SimpleNamespace:
+        self.uploads += 1
+        self.files[url] = (file[1], f"etag-{next(self._etags)}")
+        return SimpleNamespace(etag=self.files[url][1])
+
+    async def get_metadata(self, url: str) -> SimpleNamespace:
+        if url not in self.files:
+            raise FileNotFoundError(url)
+        return SimpleNamespace(etag=self.files[url][1])
+
+
+class _Interpreter:
+    """Serves the content the code produced last for every resource URI."""
+
+    def __init__(self):
+        self.resources: dict[str, str] = {}
+
+    async def get_resource(self, uri: str) -> str:
+        return self.resources[uri]
+
+
+def _transfer(tool: PythonCodeInterpreterTool, storage: _Storage, content: str) -> None:
+    tool.mcp_client.resources["res://chart"] = content
+    file = _FileReference(uri="res://chart", mime_type="text/plain", name="chart.txt", size=len(content))
+    dial_client = SimpleNamespace(files=storage)
+    asyncio.run(tool._PythonCodeInterpreterTool__transfer_file(dial_client, PurePosixPath("app/home"), file))
+
+
+def _create_tool() -> PythonCodeInterpreterTool:
+    execute_code = MCPToolModel(name="execute_code", description="Run code", parameters={})
+    return PythonCodeInterpreterTool(_Interpreter(), [execute_code], "execute_code", "http://localhost:8080")
+
+
+def test_unchanged_file_is_not_uploaded_again():
+    tool, storage = _create_tool(), _Storage()
+    _transfer(tool, storage, "A")
+    _transfer(tool, storage, "A")
+    assert storage.uploads == 1
+
+
+def test_earlier_content_is_uploaded_again_after_the_path_was_overwritten():
+    tool, storage = _create_tool(), _Storage()
+    _transfer(tool, storage, "A")
+    _transfer(tool, storage, "B")
+    _transfer(tool, storage, "A")
+    assert storage.uploads == 3
+    assert storage.files["files/app/home/chart.txt"][0] == b"A"
+
+
+def test_file_changed_or_deleted_in_storage_is_uploaded_again():
+    tool, storage = _create_tool(), _Storage()
+    _transfer(tool, storage, "A")
+    # Another conversation writes the same path
+    storage.files["files/app/home/chart.txt"] = (b"other", "etag-other")
+    _transfer(tool, storage, "A")
+    assert storage.files["files/app/home/chart.txt"][0] == b"A"
+
+    del storage.files["files/app/home/chart.txt"]
+    _transfer(tool, storage, "A")
+    assert storage.uploads == 3
+    assert storage.files["files/app/home/chart.txt"][0] == b"A"
@@ -0,0 +1,121 @@
+import asyncio
+import itertools
+import json
+from types import SimpleNamespace
+
+from task.tools.py_interpreter._response import _ExecutionResult, _SessionInfo
+from task.tools.py_interpreter._session_pool import _InterpreterSessionPool
+from task.tools.py_interpreter.python_code_interpreter_tool import PythonCodeInterpreterTool
+
+
+class _FakeInterpreter:
+
+    def __init__(self):
+        self.session_ids = itertools.count(1)
+        self.started: list[str] = []
+        self.closed: list[str] = []
+
+    async def execute(self, code: str) -> _ExecutionResult:
+        session_id = str(next(self.session_ids))
+        self.started.append(session_id)
+        return _ExecutionResult(success=True, session_info=_SessionInfo(session_id=session_id))
+
+    async def close(self, session_id: str) -> None:
+        self.closed.append(session_id)
+
+
+def test_conversation_keeps_its_warm_session():
+    async def run():
+        interpreter = _FakeInterpreter()
+        pool = _InterpreterSessionPool(interpreter.execute, size=2)
+        pool.start()
+        await asyncio.sleep(0.05)
+
+        first = pool.acquire("conversation-1")
+        assert first in ("1", "2")
+        assert pool.acquire("conversation-1") == first
+        assert pool.acquire("conversation-2") not in (None, first)
+        await pool.close()
+
+    asyncio.run(run())
+
+
+def test_warm_sessions_without_close_tool_are_not_recycled():
+    async def run():
+        interpreter = _FakeInterpreter()
+        pool = _InterpreterSessionPool(interpreter.execute, size=2, ttl=0.2)
+        pool.start()
+        await asyncio.sleep(1.5)
+
+        # Replacing them would leave the old kernels running on the server
+        assert interpreter.started == ["1", "2"]
+        assert pool.acquire("conversation") in ("1", "2")
+        await pool.close()
+
+    asyncio.run(run())
+
+
+def test_warm_sessions_with_close_tool_are_recycled():
+    async def run():
+        interpreter = _FakeInterpreter()
+        pool = _InterpreterSessionPool(interpreter.execute, size=2, ttl=0.2, close_session=interpreter.close)
+        pool.start()
+        await asyncio.sleep(1.5)
+
+        assert sorted(interpreter.closed[:2]) == ["1", "2"]
+        assert len(interpreter.started) == 4
+        await pool.close()
+        assert sorted(interpreter.closed) == ["1", "2", "3", "4"]
+
+    asyncio.run(run())
+
+
+class _Stage:
+
+    def append_content(self, content: str) -> None:
+        pass
+
+
+def _call(code: str, conversation_id: str) -> SimpleNamespace:
+    return SimpleNamespace(
+        tool_call=SimpleNamespace(function=SimpleNamespace(arguments=json.dumps({"code": code}))),
+        stage=_Stage(),
+        api_key="key",
+        conversation_id=conversation_id
+    )
+
+
+def test_interpreter_tool_with_stub_server(interpreter_server_url):
+    async def run():
+        tool = await PythonCodeInterpreterTool.create(
+            mcp_url=interpreter_server_url,
+            tool_name="execute_code",
+            dial_endpoint="http://localhost:8080",
+            warm_sessions=2,
+            session_prelude="import math",
+            close_session_tool="close_session",
+            size=1
+        )
+        await asyncio.sleep(0.5)
+
+        first = json.loads(await tool._execute(_call("a = 1", "conversation-1")))
+        second = json.loads(await tool._execute(_call("print(a)", "conversation-1")))
+        other = json.loads(await tool._execute(_call("b = 2", "conversation-2")))
+        assert first["session_info"]["session_id"] == second["session_info"]["session_id"]
+        assert other["session_info"]["session_id"] != first["session_info"]["session_id"]
+
+        await asyncio.sleep(0.5)
+        stats = json.loads(await tool.mcp_client.call_tool("session_stats", {}))
+        sessions = stats["sessions"]
+        # Both conversations ran in sessions that had the prelude loaded before their first code
+        assert sessions[first["session_info"]["session_id"]] == ["import math", "a = 1", "print(a)"]
+        assert sessions[other["session_info"]["session_id"]] == ["import math", "b = 2"]
+        # The pool was filled up again after handing out two sessions
+        assert len(sessions) == 4
+
+        await tool._session_pool.close()
+        stats = json.loads(await tool.mcp_client.call_tool("session_stats", {}))
+        assert stats["sessions"] == {}
+        await tool.mcp_client.close()
+
+    asyncio.run(run())
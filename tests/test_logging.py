@@ -0,0 +1,58 @@
+import io
+import logging
+import sys
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+from task.utils import log
+from task.utils.log import get_logger, setup_logging
+
+_RECORDS = 50
+_WRITE_DELAY = 0.02
+
+
+class _SlowStream(io.StringIO):
+    """Stdout of a blocked pipe or a slow log collector: every write takes 20 ms."""
+
+    def write(self, text: str) -> int:
+        time.sleep(_WRITE_DELAY)
+        return super().write(text)
+
+
+@contextmanager
+def _logging_to(stream: io.StringIO):
+    """Set up logging to `stream` as stdout; the pytest logging setup is restored afterwards."""
+    root = logging.getLogger("task")
+    handlers, level, propagate = root.handlers, root.level, root.propagate
+    stdout, sys.stdout = sys.stdout, stream
+    try:
+        setup_logging(json_format=True)
+        yield get_logger(__name__)
+    finally:
+        # Stopping the listener writes the records still in the queue
+        log._stop_listener()
+        log._listener = None
+        sys.stdout = stdout
+        root.handlers, root.propagate = handlers, propagate
+        root.setLevel(level)
+
+
+def test_logging_does_not_wait_for_a_slow_stream(benchmark_logger):
+    stream = _SlowStream()
+    latencies = []
+    with _logging_to(stream) as logger:
+        for i in range(_RECORDS):
+            started_at = time.perf_counter()
+            logger.info("Record %d", i, extra={"request_id": i})
+            latencies.append(time.perf_counter() - started_at)
+    p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+    lines = stream.getvalue().splitlines()
+    benchmark_logger.info(
+        "Log call latency with a %.0f ms stream write: p50 %.3f ms, p99 %.3f ms",
+        _WRITE_DELAY * 1000, p50, p99
+    )
+
+    assert len(lines) == _RECORDS
+    assert p99 < _WRITE_DELAY * 1000 / 10
@@ -0,0 +1,77 @@
+import asyncio
+import time
+
+from task.tools.mcp.mcp_client_pool import MCPClientPool
+
+_CALLS = 200
+_CONCURRENCY = 32
+_RUNS = 3
+
+
+async def _calls_per_second(url: str, size: int) -> float:
+    pool = await MCPClientPool.create(url, size=size)
+    semaphore = asyncio.Semaphore(_CONCURRENCY)
+
+    async def call() -> None:
+        async with semaphore:
+            await pool.call_tool("session_stats", {})
+
+    try:
+        await call()
+        started_at = time.perf_counter()
+        await asyncio.gather(*(call() for _ in range(_CALLS)))
+        return _CALLS / (time.perf_counter() - started_at)
+    finally:
+        await pool.close()
+
+
+def test_concurrent_calls_through_the_pool(interpreter_server_url, benchmark_logger):
+    # Client and stub share the machine, so the best of a few alternating runs is compared
+    single, pooled = 0.0, 0.0
+    for _ in range(_RUNS):
+        single = max(single, asyncio.run(_calls_per_second(interpreter_server_url, size=1)))
+        pooled = max(pooled, asyncio.run(_calls_per_second(interpreter_server_url, size=4)))
+    benchmark_logger.info(
+        "%d calls, %d at a time: %.0f calls/s over one session, %.0f calls/s over a pool of 4",
+        _CALLS, _CONCURRENCY, single, pooled
+    )
+
+    # Against a local stub the server CPU is the limit, so the pool must at least not cost throughput
+    assert pooled > 0.8 * single
+
+
+def test_pool_recovers_after_the_server_restarts(restartable_interpreter_server, benchmark_logger):
+    server = restartable_interpreter_server
+    url = f"http://localhost:{server.port}/mcp"
+
+    async def run() -> float:
+        pool = await MCPClientPool.create(
+            url, size=4, health_check_interval=0.2, ping_timeout=1.0, backoff_base=0.1, backoff_max=2.0,
+            idempotent_tools={"session_stats"}
+        )
+        try:
+            await pool.call_tool("session_stats", {})
+            await asyncio.to_thread(server.restart)
+            restarted_at = time.perf_counter()
+
+            # The first calls fail on the dead sessions and are retried on the reconnected ones
+            deadline = restarted_at + 10
+            while True:
+                try:
+                    await pool.call_tool("session_stats", {})
+                    break
+                except Exception:
+                    assert time.perf_counter() < deadline, "the pool did not reconnect"
+                    await asyncio.sleep(0.05)
+            recovered_in = time.perf_counter() - restarted_at
+
+            while pool.stats()["connected"] < pool.size or pool.stats()["reconnecting"]:
+                assert time.perf_counter() < deadline, f"sessions did not reconnect: {pool.stats()}"
+                await asyncio.sleep(0.05)
+            return recovered_in
+        finally:
+            await pool.close()
+
+    recovered_in = asyncio.run(run())
+    benchmark_logger.info("First successful call %.3fs after the server restarted", recovered_in)
+    assert recovered_in < 5
@@ -0,0 +1,98 @@
+import os
+import time
+
+import pytest
+
+from task.utils.pdf_extractor import PdfPageExtractor
+
+
+def _write_pdf(path, page_texts: list[str]) -> None:
+    """Write a minimal PDF with one line of Helvetica text per page."""
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        "<< /Type /Pages /Kids [{}] /Count {} >>".format(
+            " ".join(f"{4 + 2 * i} 0 R" for i in range(len(page_texts))), len(page_texts)
+        ),
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    for i, text in enumerate(page_texts):
+        stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET"
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>"
+        )
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+
+    content = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(content))
+        content += f"{number} 0 obj\n{body}\nendobj\n".encode()
+    xref = len(content)
+    content += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    content += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode()
+    content += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    path.write_bytes(content)
+
+
+@pytest.fixture
+def long_pdf(tmp_path):
+    path = tmp_path / "long.pdf"
+    _write_pdf(path, [f"Page {i + 1}" for i in range(40)])
+    return str(path)
+
+
+@pytest.fixture
+def extractor():
+    extractor = PdfPageExtractor(max_workers=2, pages_per_task=2, min_pages_for_pool=4)
+    yield extractor
+    extractor.shutdown()
+
+
+def test_pool_extraction_matches_page_order(long_pdf, extractor):
+    assert list(extractor.iter_pages(long_pdf)) == [f"Page {i + 1}" for i in range(40)]
+
+
+def test_pool_is_replaced_after_a_worker_dies(long_pdf, extractor):
+    pages = extractor.iter_pages(long_pdf)
+    first = next(pages)
+    broken = extractor._executor
+    for process in list(broken._processes.values()):
+        process.kill()
+
+    # The rest of the document is extracted in a new pool, without repeating or skipping pages
+    assert [first, *pages] == [f"Page {i + 1}" for i in range(40)]
+    assert extractor._executor is not broken
+    # Later documents keep using the new pool
+    assert len(list(extractor.iter_pages(long_pdf))) == 40
+
+
+def test_pool_against_calling_thread_on_a_long_pdf(tmp_path, benchmark_logger):
+    path = tmp_path / "book.pdf"
+    pages = [f"Page {i + 1}: the quick brown fox jumps over the lazy dog. " * 2 for i in range(500)]
+    _write_pdf(path, pages)
+
+    def timed(extractor: PdfPageExtractor) -> float:
+        started_at = time.perf_counter()
+        assert list(extractor.iter_pages(str(path))) == [page.strip() for page in pages]
+        return time.perf_counter() - started_at
+
+    calling_thread = timed(PdfPageExtractor(max_workers=1))
+    extractor = PdfPageExtractor()
+    try:
+        # The first document also pays for starting the workers
+        cold_pool = timed(extractor)
+        pool = timed(extractor)
+    finally:
+        extractor.shutdown()
+
+    cpus = len(os.sched_getaffinity(0))
+    benchmark_logger.info(
+        "500 pages on %d CPUs: %.2fs in the calling thread, %.2fs in the pool (%.2fs with worker startup)",
+        cpus, calling_thread, pool, cold_pool
+    )
+    if cpus >= 4:
+        assert pool < 0.6 * calling_thread
+    else:
+        # Without spare CPUs the pool can't be faster, but its overhead stays small
+        assert pool < 1.5 * calling_thread
@@ -0,0 +1,121 @@
+import asyncio
+import hashlib
+import io
+import json
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from task.tools.rag import rag_tool
+from task.tools.rag.document_cache import DocumentCache
+from task.tools.rag.index_factory import IndexBuilder, IndexConfig, prepare_query
+from task.tools.rag.rag_tool import RagTool
+from task.utils.dial_file_conent_extractor import DialFileContentExtractor, DownloadedFile
+
+_DIMENSION = 16
+_MANUAL = Path(__file__).with_name("microwave_manual.txt").read_bytes()
+
+
+class _HashEmbeddingExecutor:
+    """Embeds texts with vectors seeded by their hash, in the calling thread."""
+
+    model_name = "hash"
+
+    def create_index_builder(self, index_config: IndexConfig) -> IndexBuilder:
+        return IndexBuilder(_DIMENSION, index_config)
+
+    async def add_to_index(self, builder: IndexBuilder, chunks: list[str]) -> None:
+        builder.add(self._encode(chunks))
+
+    async def finish_index(self, builder: IndexBuilder):
+        return builder.build()
+
+    async def search(self, indexes, query: str, k: int, index_config: IndexConfig):
+        query_embedding = prepare_query(self._encode([query]), index_config)
+        return [index.search(query_embedding, k) for index in indexes]
+
+    @staticmethod
+    def _encode(texts: list[str]) -> np.ndarray:
+        seeds = [int(hashlib.sha256(text.encode()).hexdigest()[:8], 16) for text in texts]
+        return np.array([np.random.default_rng(seed).random(_DIMENSION) for seed in seeds], dtype='float32')
+
+
+class _Storage:
+    """Files served by URL and version, with a download counter."""
+
+    def __init__(self):
+        self.files = {"files/manual.txt": (_MANUAL, "v1")}
+        self.downloads = 0
+
+
+@pytest.fixture
+def storage(monkeypatch):
+    storage = _Storage()
+
+    class _LocalExtractor(DialFileContentExtractor):
+
+        async def get_etag(self, file_url: str) -> str:
+            return storage.files[file_url][1]
+
+        async def download(self, file_url: str) -> DownloadedFile:
+            storage.downloads += 1
+            content, etag = storage.files[file_url]
+            return DownloadedFile(
+                filename=file_url,
+                extension=Path(file_url).suffix,
+                content=io.BytesIO(content),
+                content_hash=hashlib.sha256(content).hexdigest(),
+                etag=etag
+            )
+
+    monkeypatch.setattr(rag_tool, "DialFileContentExtractor", _LocalExtractor)
+    return storage
+
+
+class _Stage:
+
+    def append_content(self, content: str) -> None:
+        pass
+
+
+def _call(request: str, file_urls: list[str]) -> SimpleNamespace:
+    arguments = json.dumps({"request": request, "file_urls": file_urls})
+    return SimpleNamespace(
+        tool_call=SimpleNamespace(function=SimpleNamespace(arguments=arguments)),
+        stage=_Stage(),
+        api_key="key"
+    )
+
+
+def test_repeated_query_does_not_download_the_file_again(storage, dial_server_url):
+    async def run():
+        tool = RagTool(dial_server_url, "echo", DocumentCache(), _HashEmbeddingExecutor())
+        assert await tool._execute(_call("How do I defrost?", ["files/manual.txt"])) == "ok"
+        assert await tool._execute(_call("How long to reheat?", ["files/manual.txt"])) == "ok"
+        assert storage.downloads == 1
+
+        # A new version of the file is downloaded and indexed again
+        storage.files["files/manual.txt"] = (_MANUAL + b"\nWarranty: two years.", "v2")
+        assert await tool._execute(_call("What is the warranty?", ["files/manual.txt"])) == "ok"
+        assert storage.downloads == 2
+
+    asyncio.run(run())
+
+
+def test_words_at_a_block_boundary_stay_separate(storage, dial_server_url):
+    # Plain text is read in 64KB blocks; the first one ends with a space and the next one starts with a word
+    first_block = ("lorem ipsum " * 6_000)[:64 * 1024 - len("dolor ")] + "dolor "
+    text = first_block + "amet consectetur adipiscing elit"
+    storage.files["files/lorem.txt"] = (text.encode(), "v1")
+
+    async def run():
+        cache = DocumentCache()
+        tool = RagTool(dial_server_url, "echo", cache, _HashEmbeddingExecutor())
+        await tool._execute(_call("amet", ["files/lorem.txt"]))
+        chunks = next(iter(cache._cache.values())).chunks
+        assert not any("doloramet" in chunk for chunk in chunks)
+        assert any("dolor amet consectetur" in chunk for chunk in chunks)
+
+    asyncio.run(run())
@@ -0,0 +1,38 @@
+import json
+import re
+import subprocess
+import sys
+from pathlib import Path
+
+_HEAVY_MODULES = ["torch", "sentence_transformers", "faiss", "pdfplumber", "pandas", "langchain_text_splitters"]
+
+_IMPORT_APP = f"""
+import json, re, sys
+import task.app
+# Peak RSS of this process; ru_maxrss would include the pytest process it was forked from
+with open("/proc/self/status") as status:
+    peak_kb = int(re.search(r"VmHWM:\\s+(\\d+) kB", status.read()).group(1))
+print(json.dumps({{
+    "loaded": [name for name in {_HEAVY_MODULES!r} if name in sys.modules],
+    "rss_mb": peak_kb / 1024,
+}}))
+"""
+
+
+def test_app_imports_without_heavy_dependencies(benchmark_logger):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _IMPORT_APP],
+        cwd=Path(__file__).parents[1],
+        capture_output=True,
+        text=True,
+        timeout=60,
+        check=True
+    )
+    report = json.loads(result.stdout)
+    # -X importtime reports "import time: self [us] | cumulative | package" for every module
+    import_us = int(re.search(r"^import time:\s+\d+ \|\s+(\d+) \| task\.app$", result.stderr, re.MULTILINE).group(1))
+    benchmark_logger.info("task.app imports in %.0f ms, RSS at idle %.0f MB", import_us / 1000, report["rss_mb"])
+
+    assert report["loaded"] == []
+    # torch alone takes a few hundred MB
+    assert report["rss_mb"] < 200
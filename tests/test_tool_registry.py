@@ -0,0 +1,77 @@
+import asyncio
+
+import pytest
+
+from task.tools.mcp.mcp_tool_model import MCPToolModel
+from task.tools.registry import ToolRegistry
+
+
+class _FakeServer:
+    """Stands in for an MCPClientPool: serves a fixed tool list, or fails."""
+
+    def __init__(self, url: str, tool_names: list[str], error: Exception | None = None):
+        self.server_url = url
+        self.tool_names = tool_names
+        self.error = error
+        self.listeners = []
+
+    async def get_tools(self) -> list[MCPToolModel]:
+        if self.error is not None:
+            raise self.error
+        return [MCPToolModel(name=name, description=name, parameters={}) for name in self.tool_names]
+
+    def add_tools_changed_listener(self, listener) -> None:
+        self.listeners.append(listener)
+
+
+def test_register_publishes_tools_of_all_servers():
+    async def run():
+        registry = ToolRegistry()
+        first = _FakeServer("a", ["echo"])
+        second = _FakeServer("b", ["add", "sub"])
+        await registry.register([], [first, second])
+        assert [tool.name for tool in registry.catalog.tools] == ["echo", "add", "sub"]
+        assert registry.catalog.version == 1
+        assert len(first.listeners) == len(second.listeners) == 1
+
+    asyncio.run(run())
+
+
+def test_failed_register_leaves_registry_unchanged():
+    async def run():
+        registry = ToolRegistry()
+        healthy = _FakeServer("a", ["echo"])
+        broken = _FakeServer("b", [], error=ConnectionError("down"))
+        with pytest.raises(ConnectionError):
+            await registry.register([], [healthy, broken])
+        assert registry.catalog.tools == ()
+        assert healthy.listeners == []
+
+        # A retry after the failure registers every server exactly once
+        broken.error = None
+        broken.tool_names = ["add"]
+        await registry.register([], [healthy, broken])
+        assert [tool.name for tool in registry.catalog.tools] == ["echo", "add"]
+
+    asyncio.run(run())
+
+
+def test_tools_changed_refresh_publishes_only_changes():
+    async def run():
+        registry = ToolRegistry()
+        server = _FakeServer("a", ["echo"])
+        await registry.register([], [server])
+        version = registry.catalog.version
+
+        server.listeners[0]()
+        await asyncio.sleep(0.01)
+        assert registry.catalog.version == version
+
+        server.tool_names = ["echo", "add"]
+        server.listeners[0]()
+        await asyncio.sleep(0.01)
+        assert registry.catalog.version == version + 1
+        assert [tool.name for tool in registry.catalog.tools] == ["echo", "add"]
+        await registry.close()
+
+    asyncio.run(run())
@@ -0,0 +1,94 @@
+import asyncio
+import time
+
+import numpy as np
+
+from task.tools.mcp.mcp_tool_model import MCPToolModel
+from task.tools.registry import ToolRegistry
+from task.tools.router import ToolRouter
+
+_TOOL_NAMES = ["weather", "calendar", "email", "search", "translate", "calculator"]
+
+
+class _FakeServer:
+
+    def __init__(self, tool_names: list[str]):
+        self.server_url = "fake"
+        self.tool_names = tool_names
+        self.listeners = []
+
+    async def get_tools(self) -> list[MCPToolModel]:
+        return [MCPToolModel(name=name, description=name, parameters={}) for name in self.tool_names]
+
+    def add_tools_changed_listener(self, listener) -> None:
+        self.listeners.append(listener)
+
+
+class _FakeEmbeddingExecutor:
+    """One-hot embeddings by the tool names found in the text; tool texts take `delay` seconds."""
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.tool_batches = 0
+
+    async def encode(self, texts: list[str]) -> np.ndarray:
+        if any(": " in text for text in texts):
+            self.tool_batches += 1
+            await asyncio.sleep(self.delay)
+        return np.array([[float(name in text) + 0.01 for name in _TOOL_NAMES] for text in texts])
+
+
+def _messages(text: str) -> list[dict]:
+    return [{"role": "user", "content": text}]
+
+
+async def _registry_with_router(
+        executor: _FakeEmbeddingExecutor,
+        tool_names: list[str] = _TOOL_NAMES
+) -> tuple[ToolRegistry, ToolRouter]:
+    registry = ToolRegistry()
+    await registry.register([], [_FakeServer(tool_names)])
+    router = ToolRouter(executor, top_k=1, timeout=0.2)
+    registry.add_catalog_listener(router.prepare_in_background)
+    router.prepare_in_background(registry.catalog)
+    return registry, router
+
+
+def test_slow_tool_embeddings_fall_back_to_all_tools_within_timeout():
+    async def run():
+        executor = _FakeEmbeddingExecutor(delay=1.0)
+        registry, router = await _registry_with_router(executor)
+
+        started_at = time.perf_counter()
+        schemas = await router.select(registry.catalog, _messages("send an email"))
+        assert time.perf_counter() - started_at < 0.5
+        assert len(schemas) == len(_TOOL_NAMES)
+
+        # The timed-out request didn't cancel the preparation, so routing works once it finishes
+        await asyncio.sleep(1.0)
+        schemas = await router.select(registry.catalog, _messages("send an email"))
+        assert [schema["function"]["name"] for schema in schemas] == ["email"]
+        assert executor.tool_batches == 1
+
+    asyncio.run(run())
+
+
+def test_published_catalog_is_embedded_before_requests():
+    async def run():
+        executor = _FakeEmbeddingExecutor()
+        registry, router = await _registry_with_router(executor, _TOOL_NAMES[:-1])
+        await asyncio.sleep(0.05)
+        assert executor.tool_batches == 1
+
+        server = registry._servers[0].client
+        server.tool_names = _TOOL_NAMES
+        server.listeners[0]()
+        await asyncio.sleep(0.05)
+        # The new tool was embedded on publish, so the request only embeds its query
+        assert executor.tool_batches == 2
+        schemas = await router.select(registry.catalog, _messages("what does the calculator say"))
+        assert [schema["function"]["name"] for schema in schemas] == ["calculator"]
+        assert executor.tool_batches == 2
+        await registry.close()
+
+    asyncio.run(run())
@@ -0,0 +1,71 @@
+import asyncio
+
+from task.tools.scheduler import ToolCancelledError, ToolLimit, ToolScheduler, ToolTimeoutError
+
+
+class _Tool:
+
+    def __init__(self, name: str):
+        self.name = name
+
+
+def _collect(scheduler: ToolScheduler, calls) -> dict[int, object]:
+    async def run():
+        session = scheduler.session()
+        for tool, call in calls:
+            session.submit(tool, call)
+        return {result.index: result async for result in session.results()}
+
+    return asyncio.run(asyncio.wait_for(run(), timeout=5))
+
+
+def test_results_of_successful_failed_and_timed_out_calls():
+    async def ok():
+        return "done"
+
+    async def fail():
+        raise ValueError("broken")
+
+    async def slow():
+        await asyncio.sleep(10)
+
+    scheduler = ToolScheduler(limits={}, default_limit=ToolLimit(max_concurrency=4, timeout=0.1))
+    results = _collect(scheduler, [(_Tool("ok"), ok), (_Tool("fail"), fail), (_Tool("slow"), slow)])
+
+    assert results[0].result == "done" and results[0].error is None
+    assert isinstance(results[1].error, ValueError)
+    assert isinstance(results[2].error, ToolTimeoutError)
+
+
+def test_call_cancelled_inside_the_tool_still_reports_a_result():
+    async def cancelled_inside():
+        raise asyncio.CancelledError()
+
+    async def cancelled_inner_task():
+        inner = asyncio.create_task(asyncio.sleep(10))
+        asyncio.get_running_loop().call_later(0.01, inner.cancel)
+        return await asyncio.shield(inner)
+
+    scheduler = ToolScheduler(limits={})
+    results = _collect(scheduler, [(_Tool("a"), cancelled_inside), (_Tool("b"), cancelled_inner_task)])
+
+    assert isinstance(results[0].error, ToolCancelledError)
+    assert isinstance(results[1].error, ToolCancelledError)
+
+
+def test_calls_share_the_per_request_limit():
+    running = 0
+    peak = 0
+
+    async def call():
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.02)
+        running -= 1
+
+    scheduler = ToolScheduler(limits={}, max_concurrency_per_request=2)
+    results = _collect(scheduler, [(_Tool(f"t{i}"), call) for i in range(6)])
+
+    assert len(results) == 6
+    assert peak == 2